@@ -1,21 +1,250 @@
 # app.py
 
 import streamlit as st
+import itertools
 import os
+import requests
+from contextlib import closing
 from datetime import datetime
 
 # Import dari konfigurasi dan modul
-from config import LOGO_PATH, setup_directories
+from config import ADMIN_USERS, LOGO_PATH, RAG_ENABLED, RAG_INLINE_MAX_CHARS, setup_directories
 from modules.auth import authentication_ui
-from modules.session_manager import initialize_session_state, save_chat_session
-from modules.ollama_client import get_ollama_models_cached, query_ollama_non_stream
+from modules.session_manager import (
+    initialize_session_state, save_chat_session, load_session_summary, trim_chat_history
+)
+from modules.ollama_client import (
+    get_model_catalog, stream_ollama_chat, build_messages_for_api, schedule_context_summary_refresh
+)
+from modules.response_cache import get_response_cache, make_cache_key, cached_response_events
+from modules.scheduler import SchedulerBusyError
+from modules.metrics import GENERATIONS, start_metrics_server
+from modules.generation_tasks import get_generation_tracker, CANCEL_REASONS
+from modules.model_manager import get_model_manager
 from modules.file_processor import extract_text_from_file
+from modules.document_index import index_document, retrieve_chunks
 from modules.ui_components import (
     display_sidebar, 
     display_chat_messages_paginated, 
-    display_export_options
+    display_export_options,
+    display_metrics_dashboard,
+    render_streaming_response,
+    current_browser_tab
 )
 
+def with_cancel_note(answer, reason):
+    """Jawapan separuh siap diikuti nota sebab penjanaan dihentikan."""
+    return f"{answer.strip()}\n\n⏹ _{CANCEL_REASONS.get(reason, CANCEL_REASONS['interrupted'])}_".strip()
+
+def _track_partial_reply(events, partial):
+    """Menyalin teks yang sudah distrim ke `partial` supaya boleh disimpan jika skrip diganggu."""
+    for kind, value in events:
+        if kind in partial:
+            partial[kind] += value
+        yield kind, value
+
+def stop_generation(username):
+    """Callback butang henti: membatalkan penjanaan tab ini."""
+    tab_id, _ = current_browser_tab()
+    # Klik ini biasanya sudah mengganggu skrip dan melepaskan penjanaan;
+    # sebab disimpan supaya jawapan separuh siap diberi nota yang betul
+    get_generation_tracker().cancel(username, "user", owner=tab_id)
+    if st.session_state.get("partial_reply") is not None:
+        st.session_state.partial_reply["reason"] = "user"
+
+def generate_assistant_reply(username, user_input):
+    """
+    Menjana jawapan untuk mesej terkini, dari cache jika soalan yang sama pernah dijawab.
+
+    Returns:
+        Tuple (jawapan, proses_pemikiran, statistik), atau None jika pelayan terlalu sibuk.
+    """
+    model = st.session_state.selected_ollama_model
+    # Mesej lama yang tidak muat dalam bajet token digantikan dengan ringkasan bergulir
+    context_summary = None
+    if st.session_state.session_id != "new":
+        context_summary = load_session_summary(username, st.session_state.session_id)
+
+    # Petikan paling berkaitan dari dokumen yang dilampirkan pada sesi ini
+    retrieved_chunks = None
+    if RAG_ENABLED:
+        try:
+            retrieved_chunks = retrieve_chunks(username, st.session_state.current_filename_prefix, user_input)
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            st.warning(f"Carian dokumen gagal; jawapan tanpa petikan dokumen. ({e})")
+
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(
+            model,
+            build_messages_for_api(
+                user_input, st.session_state.chat_history, model, context_summary, retrieved_chunks,
+                st.session_state.chat_history_offset
+            )
+        )
+        cached_entry = cache.get(cache_key)
+        if cached_entry is not None:
+            GENERATIONS.inc(model=model, outcome="cached")
+            return render_streaming_response(cached_response_events(cached_entry))
+
+    # Setiap pengguna mempunyai paling banyak GENERATION_LIMIT_PER_USER penjanaan
+    # aktif; soalan baharu (termasuk dari tab lain) membatalkan yang lama
+    tracker = get_generation_tracker()
+    tab_id, is_connected = current_browser_tab()
+    task = tracker.start(username, tab_id, st.session_state.session_id, model, is_connected)
+    partial = st.session_state.partial_reply = {"answer": "", "thinking": ""}
+    stop_button = st.empty()
+    stop_button.button("⏹ Hentikan", key="stop_generation", on_click=stop_generation, args=(username,))
+
+    # Penjadual mengehadkan penjanaan serentak bagi setiap model; permintaan
+    # lain menunggu giliran secara adil mengikut pengguna. Soalan yang sama
+    # dengan penjanaan yang sedang berjalan menyertainya tanpa beratur semula.
+    queue_status = st.empty()
+    # Token dipaparkan sebaik sahaja tiba; jika skrip dihentikan (cth. pengguna
+    # menekan butang lain) atau tugas dibatalkan, closing() melepaskan
+    # permintaan ini dan penjanaan dihentikan jika tiada pengguna lain yang berkongsi.
+    response_stream = stream_ollama_chat(
+        user_input,
+        st.session_state.chat_history,
+        model,
+        stop_event=task.stop_event,
+        context_summary=context_summary,
+        retrieved_chunks=retrieved_chunks,
+        history_offset=st.session_state.chat_history_offset,
+        username=username,
+        on_wait=lambda position: queue_status.info(f"⏳ Dalam baris gilir: kedudukan {position}")
+    )
+    try:
+        with closing(response_stream):
+            try:
+                first_event = next(response_stream)  # Menunggu slot penjadual
+            except SchedulerBusyError as e:
+                queue_status.empty()
+                stop_button.empty()
+                st.session_state.partial_reply = None
+                st.warning(f"Pelayan AI sedang sibuk. Sila cuba sebentar lagi. ({e})")
+                return None
+            queue_status.empty()
+            assistant_response, thinking, stats = render_streaming_response(
+                _track_partial_reply(itertools.chain([first_event], response_stream), partial)
+            )
+    finally:
+        tracker.finish(task)
+    stop_button.empty()
+    st.session_state.partial_reply = None
+
+    if stats.get("cancelled") and task.cancel_reason:
+        # Dibatalkan dari luar skrip ini (cth. soalan baharu dari tab lain)
+        assistant_response = with_cancel_note(partial["answer"], task.cancel_reason)
+        st.caption(f"⏹ {CANCEL_REASONS[task.cancel_reason]}")
+
+    # Hanya jawapan lengkap disimpan; jawapan ralat atau yang dibatalkan tidak
+    if cache is not None and stats.get("completed") and not stats.get("error") and not stats.get("cancelled"):
+        cache.put(cache_key, model, assistant_response, thinking)
+    return assistant_response, thinking, stats
+
+def build_file_prompt(username, uploaded_file, instruction=""):
+    """
+    Mengekstrak teks fail yang dimuat naik sambil memaparkan kemajuan halaman.
+
+    Fail pendek dihantar terus dalam prompt. Fail panjang diindeks untuk
+    carian supaya hanya petikan berkaitan dihantar bersama setiap soalan.
+
+    Returns:
+        Prompt untuk model, atau None jika gagal.
+    """
+    progress_bar = st.progress(0.0, text=f"Memproses '{uploaded_file.name}'...")
+
+    def show_progress(done_pages, total_pages, ocr_pages):
+        label = f"Halaman {done_pages}/{total_pages}"
+        if ocr_pages:
+            label += f" · OCR: {ocr_pages}"
+        progress_bar.progress(done_pages / max(1, total_pages), text=label)
+
+    extracted_text = extract_text_from_file(uploaded_file, show_progress)
+    progress_bar.empty()
+    if not extracted_text:
+        st.warning(f"Tiada teks untuk dianalisis dalam '{uploaded_file.name}'.")
+        return None
+    instruction = instruction.strip() or "Analisis dan terangkan kandungan fail berikut."
+
+    if RAG_ENABLED and len(extracted_text) > RAG_INLINE_MAX_CHARS:
+        try:
+            with st.spinner(f"Mengindeks '{uploaded_file.name}' untuk carian..."):
+                index_document(username, st.session_state.current_filename_prefix, uploaded_file.name, extracted_text)
+            return f"{instruction}\n\n📎 Fail dilampirkan: '{uploaded_file.name}'"
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            st.warning(f"Gagal mengindeks fail untuk carian; kandungan penuh akan dihantar. ({e})")
+    return f"{instruction}\n\n--- Kandungan fail '{uploaded_file.name}' ---\n{extracted_text}"
+
+def store_assistant_reply(username, content, thinking, time_taken):
+    """
+    Menambah jawapan pembantu pada sejarah dan menyimpan sesi.
+
+    Returns:
+        True jika sesi baharu dicipta untuk mesej pertama.
+    """
+    st.session_state.chat_history.append({
+        "role": "assistant",
+        "content": content,
+        "thinking_process": thinking,
+        "time_taken": time_taken
+    })
+
+    # Jika ini mesej pertama, cipta ID sesi baharu
+    new_session = st.session_state.session_id == "new"
+    if new_session:
+        st.session_state.session_id = st.session_state.current_filename_prefix
+
+    saved = save_chat_session(
+        username, st.session_state.session_id, st.session_state.chat_history, st.session_state.chat_history_offset
+    )
+    schedule_context_summary_refresh(
+        username,
+        st.session_state.session_id,
+        st.session_state.chat_history,
+        st.session_state.selected_ollama_model,
+        st.session_state.chat_history_offset
+    )
+    if saved:
+        # Jika simpanan gagal, mesej kekal dalam memori dan disimpan semula pada mesej seterusnya
+        trim_chat_history()
+    st.session_state.chat_page_num = 1
+    return new_session
+
+def save_interrupted_reply(username):
+    """
+    Menyimpan jawapan separuh siap dari larian skrip sebelumnya yang diganggu
+    (cth. butang henti atau widget lain ditekan semasa penstriman).
+    """
+    partial = st.session_state.get("partial_reply")
+    st.session_state.partial_reply = None
+    history = st.session_state.chat_history
+    if partial is None or not history or history[-1]["role"] != "user":
+        return
+    store_assistant_reply(
+        username, with_cancel_note(partial["answer"], partial.get("reason", "interrupted")),
+        partial["thinking"].strip(), 0.0
+    )
+
+def handle_user_prompt(username, user_input):
+    """Menambah mesej pengguna, menjana jawapan dan menyimpan sesi."""
+    st.session_state.chat_history.append({"role": "user", "content": user_input})
+    with st.chat_message("user"):
+        st.markdown(user_input)
+
+    reply = generate_assistant_reply(username, user_input)
+    if reply is None:
+        st.session_state.chat_history.pop()
+        return
+    assistant_response, thinking, stats = reply
+
+    new_session = store_assistant_reply(username, assistant_response, thinking, stats.get("time_taken", 0.0))
+    # Mesej baharu sudah dipaparkan; jalankan semula hanya supaya sidebar menyenaraikan sesi baharu
+    if new_session:
+        st.rerun()
+
 def main():
     """Fungsi utama untuk menjalankan aplikasi Streamlit."""
     st.set_page_config(
@@ -27,6 +256,10 @@ def main():
 
     # Pastikan semua direktori wujud
     setup_directories()
+    # Titik akhir /metrics untuk Prometheus (dimulakan sekali bagi setiap proses)
+    start_metrics_server()
+    # Muatkan model lalai ke memori Ollama sebelum soalan pertama (sekali bagi setiap proses)
+    get_model_manager()
 
     # Paparkan logo
     if os.path.exists(LOGO_PATH):
@@ -42,60 +275,57 @@ def main():
     with st.sidebar:
         st.markdown(f"#### 👤 Pengguna: {current_username}")
         if st.button("🚪 Log Keluar", use_container_width=True):
-            # Reset keadaan sesi dan log keluar
+            # Hentikan penjanaan pengguna ini di semua tab, kemudian reset keadaan sesi dan log keluar
+            get_generation_tracker().cancel(current_username, "logout")
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
+        if current_username in ADMIN_USERS:
+            st.toggle("📊 Papan Pemantauan", key="show_metrics_dashboard")
         st.markdown("---")
 
+    if current_username in ADMIN_USERS and st.session_state.get("show_metrics_dashboard"):
+        display_metrics_dashboard()
+        return
+
     st.markdown("<h1 style='text-align: center;'>🤖 DFK Stembot</h1>", unsafe_allow_html=True)
 
-    # Muatkan model dan mulakan keadaan sesi
-    available_models = get_ollama_models_cached()
-    initialize_session_state(available_models)
+    # Senarai model dari cache proses (dikemas kini di latar belakang) dan mulakan keadaan sesi
+    model_catalog = get_model_catalog()
+    initialize_session_state([model["name"] for model in model_catalog["models"]])
+    save_interrupted_reply(current_username)
 
     st.markdown(f"<p style='text-align: center; color: grey;'>Model Aktif: <b>{st.session_state.selected_ollama_model.split(':')[0]}</b></p>", unsafe_allow_html=True)
     st.markdown("---")
 
     # Paparkan sidebar dan uruskan logik sesi
-    display_sidebar(available_models, current_username)
+    display_sidebar(model_catalog, current_username)
 
     # Bahagian muat naik fail
+    file_prompt = None
     with st.sidebar:
         st.markdown("#### 📎 Muat Naik & Analisis Fail")
-        # ... (Logik muat naik fail anda boleh diletakkan di sini)
-        # ... Ia memanggil extract_text_from_file dan query_ollama_non_stream
+        uploaded_file = st.file_uploader(
+            "Pilih fail:", type=["png", "jpg", "jpeg", "gif", "pdf", "docx", "pptx", "xlsx", "csv", "txt"],
+            key="file_uploader_widget", label_visibility="collapsed"
+        )
+        file_instruction = st.text_input(
+            "Arahan untuk fail:", key="file_instruction", placeholder="cth. Ringkaskan dokumen ini"
+        )
+        if st.button("🔍 Analisis Fail", use_container_width=True, disabled=uploaded_file is None):
+            file_prompt = build_file_prompt(current_username, uploaded_file, file_instruction)
+        st.markdown("---")
 
     # Paparkan mesej perbualan
-    display_chat_messages_paginated()
+    display_chat_messages_paginated(current_username)
 
     # Input pengguna
-    if user_input := st.chat_input(f"Tanya {st.session_state.selected_ollama_model.split(':')[0].capitalize()}..."):
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        
-        with st.spinner("Sedang berfikir..."):
-            assistant_response, thinking, time_taken = query_ollama_non_stream(
-                user_input,
-                st.session_state.chat_history,
-                st.session_state.selected_ollama_model
-            )
-        
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "content": assistant_response,
-            "thinking_process": thinking,
-            "time_taken": time_taken
-        })
-
-        # Jika ini mesej pertama, cipta ID sesi baharu
-        if st.session_state.session_id == "new":
-            st.session_state.session_id = st.session_state.current_filename_prefix
-        
-        save_chat_session(current_username, st.session_state.session_id, st.session_state.chat_history)
-        st.rerun()
+    user_input = st.chat_input(f"Tanya {st.session_state.selected_ollama_model.split(':')[0].capitalize()}...")
+    if prompt := user_input or file_prompt:
+        handle_user_prompt(current_username, prompt)
 
     # Pilihan eksport
-    display_export_options()
+    display_export_options(current_username)
 
 
 if __name__ == "__main__":
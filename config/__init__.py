@@ -4,13 +4,74 @@ import os
 
 # --- Konfigurasi Direktori ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-HISTORY_DIR = os.path.join(BASE_DIR, "chat_sessions")
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploaded_files")
-EXPORT_DIR = os.path.join(BASE_DIR, "exported_files")
-USERS_DIR = os.path.join(BASE_DIR, "user_data")
-USERS_FILE = os.path.join(USERS_DIR, "users.json")
+DATA_DIR = os.getenv("STEMBOT_DATA_DIR", BASE_DIR)  # Akar data runtime (sesi, muat naik, eksport, pengguna)
+HISTORY_DIR = os.path.join(DATA_DIR, "chat_sessions")
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploaded_files")
+EXPORT_DIR = os.path.join(DATA_DIR, "exported_files")
+USERS_DIR = os.path.join(DATA_DIR, "user_data")
+USERS_FILE = os.path.join(USERS_DIR, "users.json")  # Format lama, diimport ke USERS_DB_PATH
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", os.path.join(USERS_DIR, "users.sqlite3"))
 FONT_DIR = os.path.join(BASE_DIR, "fonts")
 
+# --- Konfigurasi Storan Sesi ---
+CHAT_STORE_BACKEND = os.getenv("CHAT_STORE_BACKEND", "sqlite").lower()  # "sqlite", "jsonl" atau "json"
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", os.path.join(HISTORY_DIR, "chat_sessions.sqlite3"))
+SESSIONS_PER_PAGE = int(os.getenv("SESSIONS_PER_PAGE", "20"))  # Sesi bagi setiap halaman dalam sidebar
+CHAT_MESSAGES_PER_PAGE = int(os.getenv("CHAT_MESSAGES_PER_PAGE", "20"))  # Mesej yang dipaparkan bagi setiap halaman perbualan
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "100"))  # Mesej terakhir yang disimpan dalam memori sesi
+CHAT_RENDER_CACHE_SIZE = int(os.getenv("CHAT_RENDER_CACHE_SIZE", "2000"))  # Mesej yang markdownnya dicache bagi setiap proses
+JSONL_COMPACT_INTERVAL = float(os.getenv("JSONL_COMPACT_INTERVAL", "60"))  # Saat antara kitaran pemadatan log
+
+# --- Konfigurasi Pengesahan ---
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # Faktor kos bcrypt untuk hash baharu
+# Proses pekerja bcrypt; 0 menjalankan bcrypt terus dalam thread skrip
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))  # Cubaan gagal sebelum log masuk disekat
+LOGIN_ATTEMPT_WINDOW = float(os.getenv("LOGIN_ATTEMPT_WINDOW", "300"))  # Saat tetingkap kiraan cubaan gagal
+
+# --- Konfigurasi Ekstraksi Dokumen ---
+# Proses pekerja untuk halaman PDF dan OCR; 0 menjalankan ekstraksi dalam thread skrip
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))  # Halaman PDF bagi setiap tugas pekerja
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng")  # Bahasa Tesseract, cth. "eng+msa"
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))  # Resolusi rasterisasi halaman imbasan
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "2500"))  # Piksel; imej lebih besar dikecilkan
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))  # Halaman dengan teks kurang dianggap imbasan
+# Had saiz muat naik (MB) mengikut jenis fail, cth. "pdf=100,csv=20"
+EXTRACTION_SIZE_LIMITS = {
+    "png": 10, "jpg": 10, "jpeg": 10, "gif": 10, "txt": 5, "csv": 20,
+    "docx": 20, "pptx": 50, "xlsx": 20, "pdf": 100,
+}
+EXTRACTION_SIZE_LIMITS.update(
+    (name.strip().lstrip(".").lower(), int(limit))
+    for name, _, limit in (item.partition("=") for item in os.getenv("EXTRACTION_SIZE_LIMITS", "").split(","))
+    if name.strip() and limit.strip().isdigit()
+)
+EXTRACTION_DEFAULT_SIZE_LIMIT = int(os.getenv("EXTRACTION_DEFAULT_SIZE_LIMIT", "10"))  # MB bagi jenis lain
+EXTRACTION_MAX_ROWS = int(os.getenv("EXTRACTION_MAX_ROWS", "5000"))  # Baris/perenggan maksimum dokumen berstruktur
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(UPLOAD_DIR, "extraction_cache"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))  # Had saiz cache teks
+
+# --- Konfigurasi Carian Dokumen (RAG) ---
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() in ("1", "true", "yes")
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(DATA_DIR, "vector_index"))
+RAG_EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "nomic-embed-text")
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "32"))  # Cebisan bagi setiap permintaan /api/embed
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "1200"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))  # Cebisan yang dihantar bersama setiap prompt
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.35"))  # Persamaan kosinus minimum
+RAG_INLINE_MAX_CHARS = int(os.getenv("RAG_INLINE_MAX_CHARS", "4000"))  # Fail lebih pendek dihantar terus dalam prompt
+
+# --- Konfigurasi Eksport ---
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))  # Proses pekerja untuk membina fail eksport
+EXPORT_JOB_TTL = float(os.getenv("EXPORT_JOB_TTL", "3600"))  # Saat kerja eksport kekal dalam senarai
+EXPORT_POLL_INTERVAL = float(os.getenv("EXPORT_POLL_INTERVAL", "1"))  # Saat antara semakan status kerja
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(EXPORT_DIR, "cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # Had saiz fail eksport dalam cache
+PDF_EXPORT_MESSAGES_PER_PART = int(os.getenv("PDF_EXPORT_MESSAGES_PER_PART", "400"))  # Mesej bagi setiap bahagian PDF yang dijana dalam memori
+
 # --- Konfigurasi Aplikasi ---
 LOGO_PATH = os.getenv("LOGO_IKM", os.path.join(BASE_DIR, "logo_ikm.jpg"))
 WATERMARK_TEXT = os.getenv("CHATBOT_WATERMARK_TEXT", "IKM Besut")
@@ -18,6 +79,64 @@ WATERMARK_TEXT = os.getenv("CHATBOT_WATERMARK_TEXT", "IKM Besut")
 # --- Konfigurasi Ollama ---
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DEFAULT_OLLAMA_MODEL = os.getenv("DEFAULT_OLLAMA_MODEL", "STEMBot-4B")
+# Senarai pelayan Ollama dipisahkan dengan koma; lalai kepada OLLAMA_BASE_URL sahaja
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/") for url in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()
+]
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", "30"))  # Saat antara semakan /api/tags
+
+# --- Konfigurasi Pemanasan Model ---
+# Tempoh model kekal dalam memori selepas permintaan terakhir, cth. "30m", "2h" atau "-1" (selamanya)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)  # Ollama menerima nombor saat tetapi bukan "-1" sebagai teks
+MODEL_WARMUP_ENABLED = os.getenv("MODEL_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Model yang dimuatkan semasa permulaan dan dikekalkan dalam memori; lalai kepada DEFAULT_OLLAMA_MODEL
+MODEL_WARMUP_MODELS = [
+    name.strip() for name in os.getenv("MODEL_WARMUP_MODELS", DEFAULT_OLLAMA_MODEL).split(",") if name.strip()
+]
+MODEL_RECENT_LIMIT = int(os.getenv("MODEL_RECENT_LIMIT", "2"))  # Model terkini dipilih pengguna yang turut dikekalkan
+
+# --- Konfigurasi Sambungan HTTP ---
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "50"))  # Sambungan keep-alive maksimum
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))  # Saat, berganda setiap cubaan
+
+# --- Konfigurasi Penjadual Permintaan ---
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "2"))  # Penjanaan serentak bagi setiap model
+SCHEDULER_MAX_QUEUE_DEPTH = int(os.getenv("SCHEDULER_MAX_QUEUE_DEPTH", "40"))  # Permintaan menunggu bagi setiap model
+SCHEDULER_QUEUE_TIMEOUT = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "180"))  # Saat maksimum dalam baris gilir
+# Permintaan serentak dengan model dan konteks yang sama berkongsi satu penjanaan
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Penjanaan aktif maksimum bagi setiap pengguna; soalan baharu membatalkan yang paling lama
+GENERATION_LIMIT_PER_USER = int(os.getenv("GENERATION_LIMIT_PER_USER", "1"))
+GENERATION_WATCHDOG_INTERVAL = float(os.getenv("GENERATION_WATCHDOG_INTERVAL", "2"))  # Saat antara semakan sambungan pelayar
+
+# --- Konfigurasi Tetingkap Konteks ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))  # Anggaran token untuk sejarah perbualan
+# Bajet khusus model, cth. "STEMBot-4B=8000,llama3:8b=6000"
+CONTEXT_MODEL_BUDGETS = {
+    name.strip(): int(budget)
+    for name, _, budget in (item.partition("=") for item in os.getenv("CONTEXT_MODEL_BUDGETS", "").split(","))
+    if name.strip() and budget.strip().isdigit()
+}
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTEXT_SUMMARY_MIN_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_MIN_MESSAGES", "6"))  # Mesej tercicir sebelum ringkasan dikemas kini
+
+# --- Konfigurasi Cache Jawapan ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))  # Had cache dalam memori
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # Saat
+RESPONSE_CACHE_TAIL_MESSAGES = int(os.getenv("RESPONSE_CACHE_TAIL_MESSAGES", "3"))  # Mesej terakhir dalam kunci
+# Fail SQLite untuk tier cakera; kosongkan untuk menggunakan memori sahaja
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", os.path.join(DATA_DIR, "cache", "responses.sqlite3"))
+
+# --- Konfigurasi Pemantauan ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # Port pelayan /metrics Prometheus; 0 untuk mematikan
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_RECENT_SAMPLES = int(os.getenv("METRICS_RECENT_SAMPLES", "2000"))  # Cerapan terkini bagi setiap metrik untuk papan pemantauan
+# Pengguna yang boleh membuka papan pemantauan, cth. "cikgu_ali,admin"
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
 
 # --- Fungsi untuk memastikan direktori wujud ---
 def setup_directories():
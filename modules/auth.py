@@ -1,35 +1,143 @@
 # modules/auth.py
 
 import streamlit as st
-import json
-import os
-import bcrypt
+import argparse
+import csv
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
 from datetime import datetime
-from config import USERS_FILE, setup_directories
+from config import setup_directories, BCRYPT_ROUNDS, LOGIN_MAX_ATTEMPTS, LOGIN_ATTEMPT_WINDOW
+from .user_store import get_user_store
+from .password_hashing import hash_password, verify_password, hash_passwords
 
 # Pastikan direktori wujud semasa modul diimport
 setup_directories()
 
 def load_users():
-    """Memuatkan data pengguna dari fail JSON."""
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            json.dump({}, f)
-    with open(USERS_FILE, "r") as f:
-        return json.load(f)
+    """Memuatkan semua pengguna sebagai dict {nama_pengguna: rekod}."""
+    return get_user_store().all_users()
 
 def save_users(users):
-    """Menyimpan data pengguna ke fail JSON."""
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+    """Menyimpan (atau mengemas kini) rekod bagi setiap pengguna dalam dict."""
+    store = get_user_store()
+    for username, user in users.items():
+        store.update_user(username, user)
 
-def hash_password(password):
-    """Melencongkan kata laluan menggunakan bcrypt."""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+def get_user(username):
+    """Mendapatkan rekod satu pengguna, atau None jika tiada."""
+    return get_user_store().get_user(username)
 
-def verify_password(password, hashed):
-    """Mengesahkan kata laluan dengan hash yang disimpan."""
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+def hash_rounds(hashed):
+    """Faktor kos yang tertanam dalam hash bcrypt ('$2b$12$...'), atau None jika tidak dikenali."""
+    parts = hashed.split("$")
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+class LoginRateLimiter:
+    """
+    Mengehadkan cubaan log masuk gagal bagi setiap nama pengguna.
+
+    Selepas `max_attempts` kegagalan dalam `window` saat, cubaan seterusnya
+    ditolak tanpa menjalankan bcrypt sehingga kegagalan terawal luput.
+
+    Entri yang luput dibuang sekali setiap `window` saat, dan bilangan nama
+    pengguna yang dijejak dihadkan kepada `max_entries` (yang paling lama
+    tidak gagal dibuang dahulu), supaya cubaan dengan nama pengguna rawak
+    tidak membesarkan memori tanpa had.
+    """
+
+    def __init__(self, max_attempts=LOGIN_MAX_ATTEMPTS, window=LOGIN_ATTEMPT_WINDOW, max_entries=10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_entries = max_entries
+        self._failures = OrderedDict()  # nama pengguna -> deque masa kegagalan, paling lama gagal dahulu
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+
+    def _prune(self, key, now):
+        failures = self._failures.get(key)
+        while failures and now - failures[0] > self.window:
+            failures.popleft()
+        if failures is not None and not failures:
+            del self._failures[key]
+        return failures
+
+    def _sweep(self, now):
+        """Membuang semua entri yang luput, paling kerap sekali setiap `window` saat."""
+        if now - self._last_sweep < self.window:
+            return
+        self._last_sweep = now
+        for key in list(self._failures):
+            self._prune(key, now)
+
+    def retry_after(self, username):
+        """Saat sebelum cubaan seterusnya dibenarkan; 0 jika tidak disekat."""
+        key = username.strip().lower()
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            failures = self._prune(key, now)
+            if not failures or len(failures) < self.max_attempts:
+                return 0
+            return max(0.0, self.window - (now - failures[-self.max_attempts]))
+
+    def record_failure(self, username):
+        key = username.strip().lower()
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            # Hanya `max_attempts` kegagalan terakhir diperlukan untuk menentukan sekatan
+            self._failures.setdefault(key, deque(maxlen=max(1, self.max_attempts))).append(now)
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def reset(self, username):
+        with self._lock:
+            self._failures.pop(username.strip().lower(), None)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_login_rate_limiter():
+    """Mendapatkan pengehad cubaan log masuk yang dikongsi oleh semua sesi dalam proses."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = LoginRateLimiter()
+    return _limiter
+
+def authenticate(username, password):
+    """
+    Menyemak kata laluan pengguna dengan had cubaan log masuk.
+
+    Hash dengan faktor kos lama dinaik taraf selepas log masuk berjaya.
+
+    Returns:
+        Tuple (berjaya, saat menunggu jika cubaan disekat, atau 0).
+
+    Raises:
+        sqlite3.Error: Jika data pengguna tidak dapat dibaca.
+    """
+    limiter = get_login_rate_limiter()
+    wait_seconds = limiter.retry_after(username)
+    if wait_seconds > 0:
+        return False, wait_seconds
+    user = get_user(username)
+    if not user or not verify_password(password, user["password"]):
+        limiter.record_failure(username)
+        return False, 0
+    limiter.reset(username)
+    if hash_rounds(user["password"]) != BCRYPT_ROUNDS:
+        # Naik taraf hash lama kepada faktor kos semasa
+        try:
+            get_user_store().update_user(username, dict(user, password=hash_password(password)))
+        except sqlite3.Error:
+            pass
+    return True, 0
 
 def login_page():
     """Memaparkan borang log masuk."""
@@ -40,8 +148,15 @@ def login_page():
         submitted = st.form_submit_button("Log Masuk", type="primary", use_container_width=True)
 
         if submitted:
-            users = load_users()
-            if username in users and verify_password(password, users[username]["password"]):
+            try:
+                authenticated, wait_seconds = authenticate(username, password)
+            except sqlite3.Error as e:
+                st.error(f"Ralat membaca data pengguna: {e}")
+                return
+            if wait_seconds > 0:
+                st.error(f"Terlalu banyak cubaan log masuk. Sila cuba lagi dalam {int(wait_seconds) + 1} saat.")
+                return
+            if authenticated:
                 st.session_state.authenticated = True
                 st.session_state.username = username
                 st.success("Berjaya log masuk!")
@@ -66,16 +181,24 @@ def register_page():
                 st.error("Kata laluan tidak sepadan.")
                 return
             
-            users = load_users()
-            if username in users:
+            store = get_user_store()
+            if store.user_exists(username):
                 st.error("Nama pengguna telah wujud.")
                 return
-            
-            users[username] = {
+
+            user = {
                 "password": hash_password(password),
                 "created_at": datetime.now().isoformat()
             }
-            save_users(users)
+            try:
+                created = store.create_user(username, user)
+            except sqlite3.Error as e:
+                st.error(f"Ralat menyimpan data pengguna: {e}")
+                return
+            if not created:
+                # Pendaftaran serentak dengan nama yang sama telah berjaya dahulu
+                st.error("Nama pengguna telah wujud.")
+                return
             st.success("Akaun berjaya didaftarkan! Sila log masuk.")
             # Tidak perlu rerun di sini, biarkan pengguna lihat mesej kejayaan
             
@@ -93,3 +216,68 @@ def authentication_ui():
             register_page()
         return False
     return True
+
+def provision_users_from_csv(csv_path, output_path=None, password_length=10):
+    """
+    Mendaftarkan pengguna secara pukal dari fail CSV dengan lajur
+    'username' dan 'password' (pilihan).
+
+    Kata laluan dilencongkan secara selari dalam kumpulan proses bcrypt dan
+    semua akaun disimpan dalam satu transaksi. Baris tanpa kata laluan diberi
+    kata laluan rawak yang ditulis ke `output_path`.
+
+    Returns:
+        Tuple (bilangan dicipta, senarai nama pengguna yang telah wujud).
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        rows = [row for row in csv.DictReader(f) if (row.get("username") or "").strip()]
+
+    store = get_user_store()
+    credentials = {}
+    generated = False
+    for row in rows:
+        username = row["username"].strip()
+        if username not in credentials and not store.user_exists(username):
+            password = (row.get("password") or "").strip()
+            if not password:
+                password = secrets.token_urlsafe(password_length)[:password_length]
+                generated = True
+            credentials[username] = password
+    if generated and not output_path:
+        raise ValueError("Sesetengah baris tiada kata laluan; nyatakan fail output untuk kata laluan rawak.")
+    skipped = sorted({row["username"].strip() for row in rows} - set(credentials))
+
+    hashes = hash_passwords(list(credentials.values()))
+    created_at = datetime.now().isoformat()
+    created = store.create_users({
+        username: {"password": hashed, "created_at": created_at}
+        for username, hashed in zip(credentials, hashes)
+    })
+
+    if output_path:
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["username", "password"])
+            writer.writerows((username, credentials[username]) for username in created)
+    return len(created), skipped + sorted(set(credentials) - set(created))
+
+def main():
+    parser = argparse.ArgumentParser(description="Alat pengurusan pengguna DFK Stembot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    provision = subparsers.add_parser("provision", help="Daftarkan pengguna secara pukal dari fail CSV.")
+    provision.add_argument("csv_path", help="Fail CSV dengan lajur username dan password (pilihan).")
+    provision.add_argument("--output", help="Tulis nama pengguna dan kata laluan akaun baharu ke fail CSV ini.")
+    args = parser.parse_args()
+
+    if args.command == "provision":
+        started = time.time()
+        try:
+            count, skipped = provision_users_from_csv(args.csv_path, args.output)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        print(f"{count} pengguna didaftarkan dalam {time.time() - started:.1f} saat.")
+        if skipped:
+            print(f"{len(skipped)} pengguna telah wujud dan dilangkau: {', '.join(skipped)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# modules/backends.py
+
+import threading
+import time
+import requests
+from config import OLLAMA_BASE_URLS, OLLAMA_HEALTH_CHECK_INTERVAL
+from .http_client import get_http_session
+from .metrics import REGISTRY
+
+def _model_info(entry):
+    """Metadata satu model dari /api/tags: saiz fail, saiz parameter dan kuantisasi."""
+    details = entry.get("details") or {}
+    return {
+        "size": entry.get("size"),
+        "parameter_size": details.get("parameter_size"),
+        "quantization": details.get("quantization_level"),
+    }
+
+class OllamaBackend:
+    """Keadaan satu pelayan Ollama seperti yang dilihat oleh proses ini."""
+
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True  # Dianggap sihat sehingga semakan pertama membuktikan sebaliknya
+        self.models = set()
+        self.model_info = {}  # nama model -> metadata dari /api/tags
+        self.loaded = None  # Model dalam memori dari /api/ps; None jika tidak diketahui
+        self.outstanding = 0
+        self.last_checked = None
+        self.last_error = None
+
+    def __repr__(self):
+        return f"OllamaBackend({self.url!r}, healthy={self.healthy}, outstanding={self.outstanding})"
+
+class BackendPool:
+    """
+    Kumpulan pelayan Ollama dengan semakan kesihatan dan penghalaan.
+
+    Permintaan dihalakan ke pelayan sihat yang mempunyai model terpilih dan
+    paling sedikit permintaan belum selesai. Pelayan yang gagal ditanda tidak
+    sihat sehingga semakan /api/tags seterusnya berjaya.
+
+    Thread semakan kesihatan juga menyimpan metadata model, jadi catalog()
+    boleh dipanggil pada setiap paparan halaman tanpa menunggu rangkaian.
+    """
+
+    REFRESH_MIN_INTERVAL = 5  # Saat minimum antara semakan yang diminta oleh pengguna
+
+    def __init__(self, urls, check_interval=OLLAMA_HEALTH_CHECK_INTERVAL):
+        self.backends = [OllamaBackend(url) for url in urls]
+        self.check_interval = check_interval
+        self.refreshed_at = None  # Masa semakan penuh terakhir selesai
+        self._lock = threading.Lock()
+        self._checker = None
+        self._checked = threading.Event()  # Ditetapkan selepas semakan penuh pertama
+        self._refresh_requested = threading.Event()
+
+    def probe(self, backend):
+        """Menyemak satu pelayan melalui /api/tags dan /api/ps dan mengemas kini senarai modelnya."""
+        try:
+            response = get_http_session().get(f"{backend.url}/api/tags", timeout=5)
+            response.raise_for_status()
+            model_info = {model["name"]: _model_info(model) for model in response.json().get("models", [])}
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self.mark_failed(backend, e)
+            return False
+        loaded = self._loaded_models(backend)
+        with self._lock:
+            backend.models = set(model_info)
+            backend.model_info = model_info
+            backend.loaded = loaded
+            backend.healthy = True
+            backend.last_error = None
+            backend.last_checked = time.time()
+        return True
+
+    def _loaded_models(self, backend):
+        """Nama model yang sedang dimuatkan (/api/ps), atau None jika pelayan tidak menyokongnya."""
+        try:
+            response = get_http_session().get(f"{backend.url}/api/ps", timeout=5)
+            response.raise_for_status()
+            return {model["name"] for model in response.json().get("models", [])}
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            return None
+
+    def refresh_loaded(self, backend):
+        """
+        Membaca semula /api/ps bagi satu pelayan dan menggantikan senarai model
+        dalam memorinya, supaya model yang telah diusir oleh Ollama dilupakan.
+
+        Returns:
+            Set nama model yang dimuatkan, atau None jika tidak diketahui.
+        """
+        loaded = self._loaded_models(backend)
+        if loaded is not None:
+            with self._lock:
+                backend.loaded = loaded
+        return loaded
+
+    def probe_all(self):
+        """Menyemak semua pelayan. Memulangkan bilangan pelayan yang sihat."""
+        healthy = sum(1 for backend in self.backends if self.probe(backend))
+        self.refreshed_at = time.time()
+        self._checked.set()
+        return healthy
+
+    def _health_check_loop(self):
+        while True:
+            self._refresh_requested.clear()
+            self.probe_all()
+            self._refresh_requested.wait(self.check_interval)
+
+    def request_refresh(self):
+        """Meminta thread semakan kesihatan menyemak semula sekarang tanpa menunggu keputusannya."""
+        # Sebelum semakan pertama selesai, semakan itu sendiri sudah berjalan
+        if self.refreshed_at is not None and time.time() - self.refreshed_at >= self.REFRESH_MIN_INTERVAL:
+            self._refresh_requested.set()
+
+    def wait_until_checked(self, timeout=None):
+        """Menunggu semakan penuh pertama (cth. skrip baris perintah). Memulangkan True jika selesai."""
+        return self._checked.wait(timeout)
+
+    def start_health_checks(self):
+        """Memulakan thread latar belakang yang menyemak semua pelayan secara berkala."""
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(
+                    target=self._health_check_loop, name="ollama-health-check", daemon=True
+                )
+                self._checker.start()
+
+    def mark_failed(self, backend, error):
+        """Menanda pelayan tidak sihat selepas ralat sambungan."""
+        with self._lock:
+            backend.healthy = False
+            backend.last_error = str(error)
+            backend.last_checked = time.time()
+
+    def forget_model(self, backend, model):
+        """Membuang model dari senarai pelayan (cth. selepas respons 404 'model not found')."""
+        with self._lock:
+            backend.models.discard(model)
+
+    def mark_loaded(self, backend, model):
+        """Menanda model sebagai dimuatkan pada pelayan (cth. selepas pemanasan berjaya)."""
+        with self._lock:
+            if backend.loaded is None:
+                backend.loaded = set()
+            backend.loaded.add(model)
+
+    def residency(self, model):
+        """
+        Keadaan model dalam memori pelayan sihat yang mempunyainya.
+
+        Returns:
+            'loaded' jika dimuatkan pada sekurang-kurangnya satu pelayan,
+            'cold' jika perlu dimuatkan dahulu, atau None jika tidak diketahui.
+        """
+        with self._lock:
+            backends = [b for b in self.backends if b.healthy and model in b.models]
+            if any(b.loaded is not None and model in b.loaded for b in backends):
+                return "loaded"
+            if backends and all(b.loaded is not None for b in backends):
+                return "cold"
+            return None
+
+    def available_models(self):
+        """Gabungan model pada semua pelayan yang sihat, disusun."""
+        with self._lock:
+            models = set()
+            for backend in self.backends:
+                if backend.healthy:
+                    models |= backend.models
+            return sorted(models)
+
+    def catalog(self):
+        """
+        Senarai model dan kesihatan pelayan dari semakan latar belakang terakhir.
+
+        Tidak pernah menunggu rangkaian. Jika semua pelayan gagal, senarai
+        terakhir yang diketahui masih dipulangkan dengan tanda 'stale' supaya
+        pengguna boleh terus memilih model sementara pelayan pulih. Semakan
+        baharu diminta jika data lebih lama daripada dua selang semakan.
+
+        Returns:
+            Dict dengan 'state' ('pending' sebelum mana-mana pelayan disemak,
+            'ok', 'empty' jika pelayan sihat tetapi tiada model, atau
+            'unreachable' jika semua pelayan gagal), 'models' (senarai dict
+            name/size/parameter_size/quantization/loaded/stale, disusun),
+            'healthy', 'total', 'checked_at' dan 'errors' (senarai (url, ralat)).
+        """
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy]
+            models = {}
+            for backend in healthy or self.backends:
+                for name in backend.models:
+                    entry = models.setdefault(
+                        name, dict(backend.model_info.get(name, {}), name=name, loaded=False, stale=not healthy)
+                    )
+                    if backend.loaded is not None and name in backend.loaded:
+                        entry["loaded"] = True
+            errors = [(b.url, b.last_error) for b in self.backends if not b.healthy]
+            # Pelayan yang lambat tidak menangguhkan keputusan pelayan lain yang sudah disemak
+            checked = [b.last_checked for b in self.backends if b.last_checked is not None]
+        checked_at = self.refreshed_at or (max(checked) if checked else None)
+        if not checked:
+            state = "pending"
+        elif not healthy:
+            state = "unreachable"
+        else:
+            state = "ok" if models else "empty"
+        if checked_at is not None and time.time() - checked_at > 2 * self.check_interval:
+            self.request_refresh()
+        return {
+            "state": state, "models": [models[name] for name in sorted(models)],
+            "healthy": len(healthy), "total": len(self.backends), "checked_at": checked_at, "errors": errors,
+        }
+
+    def acquire(self, model, exclude=()):
+        """
+        Memilih pelayan untuk `model` dan menambah kiraan permintaannya.
+
+        Keutamaan: pelayan sihat yang mempunyai model, kemudian mana-mana
+        pelayan sihat (senarai model mungkin belum dikemas kini), dan akhir
+        sekali pelayan tidak sihat sebagai cubaan terakhir. Pemanggil mesti
+        memanggil release() selepas selesai.
+
+        Returns:
+            OllamaBackend, atau None jika semua pelayan telah dicuba.
+        """
+        with self._lock:
+            remaining = [b for b in self.backends if b.url not in exclude]
+            healthy = [b for b in remaining if b.healthy]
+            with_model = [b for b in healthy if model in b.models]
+            candidates = with_model or healthy or remaining
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend):
+        """Mengurangkan kiraan permintaan belum selesai bagi pelayan."""
+        with self._lock:
+            backend.outstanding = max(0, backend.outstanding - 1)
+
+    def status(self):
+        """Senarai ringkasan keadaan setiap pelayan untuk paparan UI."""
+        with self._lock:
+            return [
+                {
+                    "url": b.url, "healthy": b.healthy, "models": sorted(b.models),
+                    "loaded": sorted(b.loaded) if b.loaded is not None else None,
+                    "outstanding": b.outstanding, "last_checked": b.last_checked, "last_error": b.last_error,
+                }
+                for b in self.backends
+            ]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_backend_pool():
+    """Mendapatkan kumpulan pelayan yang dikongsi dan memulakan semakan kesihatan."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = BackendPool(OLLAMA_BASE_URLS)
+                pool.start_health_checks()
+                _pool = pool
+    return _pool
+
+def _backend_metrics():
+    """Kesihatan dan beban setiap pelayan Ollama, dibaca ketika dikikis."""
+    statuses = _pool.status() if _pool is not None else []
+    return [
+        ("stembot_ollama_backend_up", "1 jika pelayan Ollama sihat pada semakan terakhir.", "gauge",
+         [({"url": s["url"]}, int(s["healthy"])) for s in statuses]),
+        ("stembot_ollama_backend_outstanding", "Permintaan belum selesai bagi setiap pelayan Ollama.", "gauge",
+         [({"url": s["url"]}, s["outstanding"]) for s in statuses]),
+    ]
+
+REGISTRY.register_collector(_backend_metrics)
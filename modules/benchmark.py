@@ -0,0 +1,353 @@
+# modules/benchmark.py
+#
+# Penanda aras beban hujung ke hujung. Sejumlah pengguna simulasi dijalankan
+# serentak melalui aliran sebenar aplikasi: log masuk (auth), soal jawab
+# melalui penjadual dan klien Ollama, simpan/muat sesi (session_manager),
+# ekstraksi fail dan eksport perbualan. Setiap peringkat dilaporkan dengan
+# p50/p95/p99 dan daya pemprosesan supaya perubahan prestasi boleh diukur.
+#
+#   python -m modules.benchmark --users 20 --turns 5 --latency 0.5 --token-rate 30
+#
+# Secara lalai Ollama digantikan dengan modules.mock_ollama dan semua data
+# (pengguna, sesi, cache) ditulis ke direktori sementara. Konfigurasi aplikasi
+# dibaca dari persekitaran ketika modul diimport, jadi modul aplikasi hanya
+# diimport selepas persekitaran penanda aras ditetapkan. Tetapan lain
+# (cth. SCHEDULER_MAX_IN_FLIGHT, CHAT_STORE_BACKEND) dibaca seperti biasa.
+
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import as_completed
+from datetime import datetime
+from .mock_ollama import MockOllamaServer
+
+BENCHMARK_PASSWORD = "penanda-aras-123"
+FIXTURE_TYPES = ("pdf", "docx", "csv", "txt")  # Jenis yang boleh dijana oleh _build_fixtures
+STAGE_ORDER = ("login", "queue_wait", "first_token", "chat", "session_save", "session_load", "extraction", "export")
+
+class StageRecorder:
+    """Tempoh setiap operasi mengikut peringkat, dikumpul dari semua thread pengguna."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # peringkat -> senarai saat
+        self.errors = {}  # peringkat -> bilangan ralat
+
+    def record(self, stage, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def summary(self, elapsed):
+        """Senarai baris laporan (dict) mengikut peringkat."""
+        from .metrics import percentile
+
+        def order(stage):
+            base = stage.split(":")[0]
+            return (STAGE_ORDER.index(base) if base in STAGE_ORDER else len(STAGE_ORDER), stage)
+
+        with self._lock:
+            stages = {stage: list(values) for stage, values in self.samples.items()}
+            errors = dict(self.errors)
+        rows = []
+        for stage in sorted(set(stages) | set(errors), key=order):
+            values = stages.get(stage, [])
+            rows.append({
+                "stage": stage,
+                "count": len(values),
+                "errors": errors.get(stage, 0),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "mean": sum(values) / len(values) if values else None,
+                "max": max(values) if values else None,
+                "throughput": len(values) / elapsed if elapsed > 0 else None,
+            })
+        return rows
+
+def _configure_environment(data_dir, ollama_url, args):
+    """Menghalakan semua storan ke `data_dir` dan klien ke `ollama_url` sebelum config diimport."""
+    os.environ.update({
+        "STEMBOT_DATA_DIR": data_dir,
+        "USERS_DB_PATH": os.path.join(data_dir, "user_data", "users.sqlite3"),
+        "CHAT_DB_PATH": os.path.join(data_dir, "chat_sessions", "chat_sessions.sqlite3"),
+        "EXTRACTION_CACHE_DIR": os.path.join(data_dir, "uploaded_files", "extraction_cache"),
+        "EXTRACTION_CACHE_ENABLED": "true" if args.extraction_cache else "false",
+        "EXPORT_CACHE_DIR": os.path.join(data_dir, "exported_files", "cache"),
+        "RAG_INDEX_DIR": os.path.join(data_dir, "vector_index"),
+        "RESPONSE_CACHE_DB": "",
+        "OLLAMA_BASE_URL": ollama_url,
+        "OLLAMA_BASE_URLS": ollama_url,
+        "DEFAULT_OLLAMA_MODEL": args.model,
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "METRICS_PORT": "0",
+        "MODEL_WARMUP_ENABLED": "false" if args.no_warmup else "true",
+    })
+
+def _build_fixtures(kinds, pdf_pages):
+    """Kandungan fail contoh bagi setiap jenis ekstraksi: {sambungan: bait}."""
+    paragraph = (
+        "Hukum Newton kedua menyatakan bahawa daya bersih ke atas objek sama dengan jisim "
+        "didarab pecutan, F = ma. Unit SI bagi daya ialah newton (N)."
+    )
+    fixtures = {}
+    if "txt" in kinds:
+        fixtures["txt"] = "\n".join([paragraph] * 200).encode("utf-8")
+    if "csv" in kinds:
+        rows = ["nama,jisim_kg,pecutan_ms2,daya_n"]
+        rows += [f"objek{i},{i % 50 + 1},{i % 9 + 1},{(i % 50 + 1) * (i % 9 + 1)}" for i in range(2000)]
+        fixtures["csv"] = "\n".join(rows).encode("utf-8")
+    if "docx" in kinds:
+        from docx import Document
+        document = Document()
+        for number in range(200):
+            document.add_paragraph(f"{number + 1}. {paragraph}")
+        table = document.add_table(rows=50, cols=3)
+        for index, row in enumerate(table.rows):
+            for column, cell in enumerate(row.cells):
+                cell.text = f"{index}:{column}"
+        buffer = io.BytesIO()
+        document.save(buffer)
+        fixtures["docx"] = buffer.getvalue()
+    if "pdf" in kinds:
+        from fpdf import FPDF
+        pdf = FPDF()
+        pdf.set_font("helvetica", size=11)
+        for page in range(pdf_pages):
+            pdf.add_page()
+            pdf.multi_cell(0, 6, f"Halaman {page + 1}\n" + "\n".join([paragraph] * 12))
+        fixtures["pdf"] = bytes(pdf.output())
+    return fixtures
+
+def _create_users(usernames):
+    """Mendaftarkan pengguna penanda aras (tidak diukur)."""
+    from .password_hashing import hash_passwords
+    from .user_store import get_user_store
+
+    hashes = hash_passwords([BENCHMARK_PASSWORD] * len(usernames))
+    created_at = datetime.now().isoformat()
+    get_user_store().create_users({
+        username: {"password": hashed, "created_at": created_at} for username, hashed in zip(usernames, hashes)
+    })
+
+def _chat_turn(prompt, history, args, username, recorder):
+    """Satu soalan melalui penjadual seperti app.generate_assistant_reply. Memulangkan (jawapan, pemikiran)."""
+    from .ollama_client import query_ollama_non_stream, stream_ollama_chat
+    from .scheduler import SchedulerBusyError
+
+    started = time.perf_counter()
+    try:
+        if not args.stream:
+            reply, thinking, stats = query_ollama_non_stream(prompt, history, args.model, username=username)
+        else:
+            answer, thinking, stats = [], [], {}
+            for kind, value in stream_ollama_chat(prompt, history, args.model, username=username):
+                if kind == "answer":
+                    answer.append(value)
+                elif kind == "thinking":
+                    thinking.append(value)
+                elif kind == "done":
+                    stats = value
+            reply, thinking = "".join(answer), "".join(thinking)
+            if stats.get("time_to_first_token") is not None:
+                recorder.record("first_token", stats["time_to_first_token"])
+        if stats.get("queue_wait") is not None:
+            recorder.record("queue_wait", stats["queue_wait"])
+        recorder.record("chat", time.perf_counter() - started, ok=not stats.get("error"))
+        return reply, thinking
+    except SchedulerBusyError as e:
+        recorder.record("chat", time.perf_counter() - started, ok=False)
+        return f"Maaf, {e}", ""
+
+def _simulate_user(index, username, args, fixtures, recorder, failures):
+    """Aliran seorang pengguna: log masuk, beberapa soalan, ekstraksi dan eksport."""
+    from .auth import authenticate
+    from .chat_store import SESSION_ID_FORMAT
+    from .export_jobs import get_export_manager
+    from .file_processor import extract_text_from_file
+    from .session_manager import save_chat_session, load_chat_window
+    from config import CHAT_HISTORY_WINDOW
+
+    try:
+        if args.ramp_up > 0:
+            time.sleep(args.ramp_up * index / args.users)
+
+        started = time.perf_counter()
+        authenticated, _ = authenticate(username, BENCHMARK_PASSWORD)
+        recorder.record("login", time.perf_counter() - started, ok=authenticated)
+
+        session_id = datetime.now().strftime(SESSION_ID_FORMAT)
+        history = []
+        for turn in range(args.turns):
+            # Soalan serupa meniru kelas yang menaip soalan yang sama dari papan (penjanaan dikongsi)
+            asker = "kelas" if args.identical_prompts else username
+            prompt = f"Soalan {turn + 1} daripada {asker}: terangkan tenaga kinetik dengan contoh."
+            reply, thinking = _chat_turn(prompt, history, args, username, recorder)
+            history.append({"role": "user", "content": prompt})
+            history.append({"role": "assistant", "content": reply, "thinking_process": thinking})
+
+            started = time.perf_counter()
+            saved = save_chat_session(username, session_id, history[-2:], offset=len(history) - 2)
+            recorder.record("session_save", time.perf_counter() - started, ok=saved)
+            started = time.perf_counter()
+            _, loaded = load_chat_window(username, session_id)
+            # load_chat_window hanya memulangkan CHAT_HISTORY_WINDOW mesej terakhir
+            expected = min(len(history), CHAT_HISTORY_WINDOW)
+            recorder.record("session_load", time.perf_counter() - started, ok=len(loaded) == expected)
+            if args.think_time > 0:
+                time.sleep(args.think_time)
+
+        for kind, data in fixtures.items():
+            uploaded = io.BytesIO(data)
+            uploaded.name = f"{username}.{kind}"
+            started = time.perf_counter()
+            text = extract_text_from_file(uploaded)
+            recorder.record(f"extraction:{kind}", time.perf_counter() - started, ok=bool(text))
+
+        if args.export_formats and history:
+            manager = get_export_manager()
+            submitted = time.perf_counter()
+            jobs = [manager.get(job_id) for job_id in manager.submit_all(username, history, username, args.export_formats)]
+            # as_completed dan bukan add_done_callback: wait() boleh kembali sebelum
+            # panggilan balik dijalankan, jadi sesetengah eksport tidak direkodkan
+            formats = {job.future: job.format for job in jobs}
+            for future in as_completed(formats):
+                recorder.record(
+                    f"export:{formats[future]}", time.perf_counter() - submitted,
+                    ok=not future.cancelled() and future.exception() is None and bool(future.result()),
+                )
+    except Exception:
+        failures.append(traceback.format_exc())
+
+def _format_ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+def print_report(rows, elapsed, users, mock=None):
+    print(f"\n{users} pengguna dalam {elapsed:.1f} saat\n")
+    header = f"{'Peringkat':<20}{'n':>7}{'ralat':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'purata ms':>11}{'maks ms':>11}{'ops/s':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        throughput = "-" if row["throughput"] is None else f"{row['throughput']:.2f}"
+        print(
+            f"{row['stage']:<20}{row['count']:>7}{row['errors']:>7}{_format_ms(row['p50']):>11}{_format_ms(row['p95']):>11}"
+            f"{_format_ms(row['p99']):>11}{_format_ms(row['mean']):>11}{_format_ms(row['max']):>11}{throughput:>9}"
+        )
+    if mock is not None:
+        counts = mock.counts
+        print(f"\nPelayan tiruan: {counts['requests']} permintaan, {counts['generations']} penjanaan, {counts['errors']} ralat disuntik")
+
+def run_benchmark(args):
+    """
+    Menjalankan penanda aras mengikut argumen baris arahan.
+
+    Returns:
+        Dict keputusan dengan 'elapsed', 'stages' dan 'failures'.
+    """
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="stembot-benchmark-")
+    mock = None
+    if args.ollama_url:
+        ollama_url = args.ollama_url.rstrip("/")
+    else:
+        mock = MockOllamaServer(
+            models=[args.model], latency=args.latency, token_rate=args.token_rate, tokens=args.tokens,
+            error_rate=args.error_rate, jitter=args.jitter, parallel=args.parallel, load_time=args.load_time,
+            seed=args.seed,
+        ).start()
+        ollama_url = mock.url
+    _configure_environment(data_dir, ollama_url, args)
+
+    from config import setup_directories
+    from .backends import get_backend_pool
+    from .export_jobs import EXPORT_FORMATS
+    from .model_manager import get_model_manager
+
+    try:
+        unknown = [fmt for fmt in args.export_formats if fmt not in EXPORT_FORMATS]
+        if unknown:
+            raise SystemExit(f"Format eksport tidak disokong: {', '.join(unknown)}")
+        setup_directories()
+        if not get_backend_pool().probe_all():
+            raise SystemExit(f"Tidak dapat menyambung ke Ollama di {ollama_url}.")
+        usernames = [f"pengguna{index:04d}" for index in range(args.users)]
+        print(f"Menyediakan {args.users} pengguna dan fail contoh dalam {data_dir} ...")
+        get_model_manager()  # Pemanasan model seperti permulaan app.py
+        _create_users(usernames)
+        fixtures = _build_fixtures(args.extract_types, args.pdf_pages)
+
+        recorder = StageRecorder()
+        failures = []
+        threads = [
+            threading.Thread(target=_simulate_user, args=(index, username, args, fixtures, recorder, failures),
+                             name=f"benchmark-{username}")
+            for index, username in enumerate(usernames)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {"elapsed": elapsed, "stages": recorder.summary(elapsed), "failures": failures, "mock": mock}
+    finally:
+        if mock is not None:
+            mock.stop()
+        if not args.data_dir and not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+def _csv_list(value):
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Penanda aras beban hujung ke hujung DFK Stembot.")
+    parser.add_argument("--users", type=int, default=10, help="Pengguna simulasi serentak.")
+    parser.add_argument("--turns", type=int, default=3, help="Soalan bagi setiap pengguna.")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Saat untuk memulakan semua pengguna secara berperingkat.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Saat antara soalan setiap pengguna.")
+    parser.add_argument("--stream", action="store_true", help="Gunakan stream_ollama_chat dan ukur masa token pertama.")
+    parser.add_argument("--identical-prompts", action="store_true", help="Semua pengguna bertanya soalan yang sama serentak.")
+    parser.add_argument("--model", default=os.getenv("DEFAULT_OLLAMA_MODEL", "STEMBot-4B"))
+    parser.add_argument("--extract-types", type=_csv_list, default=list(FIXTURE_TYPES),
+                        help="Jenis fail untuk ekstraksi, dipisahkan dengan koma (kosong untuk melangkau).")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="Halaman dalam fail PDF contoh.")
+    parser.add_argument("--extraction-cache", action="store_true", help="Dayakan cache ekstraksi (lalai: dimatikan).")
+    parser.add_argument("--export-formats", type=_csv_list, default=["pdf", "docx", "txt"],
+                        help="Format eksport, dipisahkan dengan koma (kosong untuk melangkau).")
+    parser.add_argument("--no-warmup", action="store_true", help="Jangan muatkan model lebih awal (ukur muatan sejuk).")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--ollama-url", help="Gunakan pelayan Ollama sebenar dan bukan pelayan tiruan.")
+    mock_group = parser.add_argument_group("pelayan Ollama tiruan")
+    mock_group.add_argument("--latency", type=float, default=0.2, help="Saat sebelum token pertama.")
+    mock_group.add_argument("--token-rate", type=float, default=40.0, help="Token sesaat.")
+    mock_group.add_argument("--tokens", type=int, default=64, help="Token bagi setiap jawapan.")
+    mock_group.add_argument("--error-rate", type=float, default=0.0, help="Kebarangkalian ralat HTTP 500 (0-1).")
+    mock_group.add_argument("--jitter", type=float, default=0.1)
+    mock_group.add_argument("--parallel", type=int, default=0, help="Penjanaan serentak pelayan (0 = tanpa had).")
+    mock_group.add_argument("--load-time", type=float, default=0.0, help="Saat untuk memuatkan model sejuk.")
+    mock_group.add_argument("--seed", type=int)
+    parser.add_argument("--data-dir", help="Direktori data (lalai: direktori sementara yang dipadam selepas selesai).")
+    parser.add_argument("--keep-data", action="store_true", help="Jangan padam direktori data sementara.")
+    parser.add_argument("--json", help="Tulis keputusan ke fail JSON ini.")
+    args = parser.parse_args()
+    unknown = [kind for kind in args.extract_types if kind not in FIXTURE_TYPES]
+    if unknown:
+        parser.error(f"Jenis fail contoh tidak disokong: {', '.join(unknown)}")
+
+    result = run_benchmark(args)
+    print_report(result["stages"], result["elapsed"], args.users, result["mock"])
+    if result["failures"]:
+        print(f"\n{len(result['failures'])} pengguna gagal:\n{result['failures'][0]}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            options = {k: v for k, v in vars(args).items() if k != "json"}
+            json.dump({"options": options, "elapsed": result["elapsed"], "stages": result["stages"]}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,788 @@
+# modules/chat_store.py
+#
+# Storan sesi perbualan yang boleh ditukar ganti. Semua storan mempunyai kaedah
+# yang sama dan menaikkan OSError/sqlite3.Error (atau ValueError bagi offset
+# yang melebihi mesej tersimpan) kepada pemanggil; session_manager memaparkan
+# mesej ralat kepada pengguna.
+#
+# Pindahkan sesi JSON sedia ada secara manual dengan:
+#     python -m modules.chat_store migrate [--to sqlite|jsonl]
+
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from config import HISTORY_DIR, CHAT_STORE_BACKEND, CHAT_DB_PATH, JSONL_COMPACT_INTERVAL
+
+SESSION_ID_FORMAT = "%Y%m%d_%H%M%S"
+
+def session_created_at(session_id):
+    """Masa cipta sesi dari ID berformat YYYYMMDD_HHMMSS; 0 jika format tidak sepadan."""
+    try:
+        return datetime.strptime(session_id, SESSION_ID_FORMAT).timestamp()
+    except ValueError:
+        return 0.0
+
+def _fsync_dir(path):
+    """Memastikan penamaan semula fail dalam direktori kekal selepas kerosakan (POSIX sahaja)."""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_text(path, text):
+    """Menulis fail sementara, fsync, kemudian os.replace supaya fail asal tidak pernah separuh ditulis."""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+def _check_offset(session_id, offset, stored_count):
+    """Mesej sebelum `offset` mesti sudah disimpan; jika tidak, ada mesej yang hilang di antaranya."""
+    if offset > stored_count:
+        raise ValueError(
+            f"Sesi '{session_id}' hanya mempunyai {stored_count} mesej tersimpan tetapi simpanan bermula pada {offset}."
+        )
+
+def session_title(history, max_length=60):
+    """Tajuk sesi: mesej pertama pengguna, dipendekkan."""
+    for msg in history:
+        if msg.get("role") == "user" and msg.get("content", "").strip():
+            title = " ".join(msg["content"].split())
+            return title if len(title) <= max_length else title[:max_length - 1] + "…"
+    return ""
+
+class SessionIndex:
+    """
+    Indeks sesi bagi setiap pengguna untuk storan berasaskan fail.
+
+    Indeks disimpan sebagai log JSONL (_index.jsonl) supaya setiap simpanan
+    hanya menambah satu baris kecil. Salinan dalam proses disemak dengan
+    mtime/saiz fail: jika fail hanya bertambah, baris baharu sahaja dibaca.
+    Log dipadatkan secara atomik apabila terlalu banyak baris lapuk.
+    """
+
+    FILENAME = "_index.jsonl"
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}  # pengguna -> {"entries", "sorted", "ino", "size", "mtime", "lines"}
+        self._lock = threading.Lock()
+
+    def _path(self, username):
+        return os.path.join(self.store.user_dir(username), self.FILENAME)
+
+    @staticmethod
+    def _apply(entries, record):
+        session_id = record.get("id")
+        if not session_id:
+            return
+        if record.get("_deleted"):
+            entries.pop(session_id, None)
+        else:
+            entries.setdefault(session_id, {"id": session_id}).update(record)
+
+    def _read_lines(self, path, offset, entries):
+        """Menggunakan baris dari `offset`; baris rosak (cth. separuh ditulis) diabaikan."""
+        lines = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                lines += 1
+                try:
+                    self._apply(entries, json.loads(raw))
+                except ValueError:
+                    continue
+        return lines
+
+    def _rebuild(self, username, path):
+        entries = self.store.scan_index_entries(username)
+        atomic_write_text(path, "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries.values()))
+
+    def _load(self, username):
+        """Memulangkan entri cache pengguna yang dikemas kini. Mesti dipanggil dengan kunci dipegang."""
+        path = self._path(username)
+        if not os.path.exists(path):
+            self._rebuild(username, path)
+        stat = os.stat(path)
+        cached = self._cache.get(username)
+        if cached and (cached["ino"], cached["size"], cached["mtime"]) == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return cached
+        if cached and cached["ino"] == stat.st_ino and stat.st_size > cached["size"]:
+            cached["lines"] += self._read_lines(path, cached["size"], cached["entries"])
+        else:
+            entries = {}
+            cached = {"entries": entries, "lines": self._read_lines(path, 0, entries)}
+            self._cache[username] = cached
+        cached.update(ino=stat.st_ino, size=stat.st_size, mtime=stat.st_mtime_ns, sorted=None)
+        return cached
+
+    def _append(self, username, record):
+        with self._lock:
+            cached = self._load(username)
+            path = self._path(username)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._apply(cached["entries"], record)
+            cached["lines"] += 1
+            if cached["lines"] > 2 * len(cached["entries"]) + 50:
+                atomic_write_text(path, "".join(
+                    json.dumps(e, ensure_ascii=False) + "\n" for e in cached["entries"].values()
+                ))
+                cached["lines"] = len(cached["entries"])
+            stat = os.stat(path)
+            cached.update(ino=stat.st_ino, size=stat.st_size, mtime=stat.st_mtime_ns, sorted=None)
+
+    def get(self, username, session_id):
+        with self._lock:
+            return self._load(username)["entries"].get(session_id)
+
+    def record_save(self, username, session_id, history, offset=0):
+        """Mengemas kini entri selepas sesi disimpan; tajuk dan masa cipta hanya pada simpanan pertama."""
+        record = {"id": session_id, "updated_at": time.time(), "message_count": offset + len(history)}
+        existing = self.get(username, session_id)
+        if existing is None or not existing.get("title"):
+            record.update(title=session_title(history), created_at=session_created_at(session_id))
+        self._append(username, record)
+
+    def remove(self, username, session_id):
+        self._append(username, {"id": session_id, "_deleted": True})
+
+    def clear(self, username):
+        with self._lock:
+            self._cache.pop(username, None)
+            path = self._path(username)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _sorted(self, username):
+        """Entri pengguna yang terbaharu dahulu, disusun sekali bagi setiap versi fail. Mesti dipanggil dengan kunci dipegang."""
+        cached = self._load(username)
+        if cached["sorted"] is None:
+            cached["sorted"] = sorted(
+                cached["entries"].values(),
+                key=lambda e: (e.get("created_at", 0.0), e["id"]), reverse=True
+            )
+        return cached["sorted"]
+
+    def list(self, username):
+        """Semua entri sesi pengguna, yang terbaharu dahulu."""
+        with self._lock:
+            return list(self._sorted(username))
+
+    def search(self, username, query="", limit=None, offset=0):
+        """Satu halaman entri yang tajuk atau ID-nya mengandungi `query`, bersama jumlah padanan."""
+        with self._lock:
+            entries = self._sorted(username)
+            if query:
+                needle = query.lower()
+                entries = [e for e in entries if needle in e.get("title", "").lower() or needle in e["id"].lower()]
+            stop = offset + limit if limit is not None else None
+            return entries[offset:stop], len(entries)
+
+class JsonChatStore:
+    """Format asal: satu fail JSON bagi setiap sesi di bawah HISTORY_DIR/<pengguna>/."""
+
+    SUFFIX = ".json"
+
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = history_dir
+        self.index = SessionIndex(self)
+
+    def user_dir(self, username):
+        user_dir = os.path.join(self.history_dir, username)
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def _session_path(self, username, session_id):
+        return os.path.join(self.user_dir(username), f"{session_id}{self.SUFFIX}")
+
+    def _summary_path(self, username, session_id):
+        return os.path.join(self.user_dir(username), f"{session_id}.summary")
+
+    def save_messages(self, username, session_id, history, offset=0):
+        """`history` ialah mesej bermula dari kedudukan `offset`; fail ditulis semula sepenuhnya."""
+        if offset:
+            stored = self.load_messages(username, session_id, 0, offset)
+            _check_offset(session_id, offset, len(stored))
+            history = stored + list(history)
+        with open(self._session_path(username, session_id), "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+        self.index.record_save(username, session_id, history)
+
+    def load_messages(self, username, session_id, start=0, stop=None):
+        """Mesej sesi dalam julat [start, stop)."""
+        try:
+            with open(self._session_path(username, session_id), "r", encoding="utf-8") as f:
+                return json.load(f)[start:stop]
+        except FileNotFoundError:
+            return []
+
+    def count_messages(self, username, session_id):
+        entry = self.index.get(username, session_id)
+        if entry is not None:
+            return entry.get("message_count", 0)
+        return len(self.load_messages(username, session_id))
+
+    def scan_session_ids(self, username):
+        """ID sesi dari fail pada cakera, yang terbaharu dahulu (tanpa indeks)."""
+        user_dir = self.user_dir(username)
+        files = [
+            f[:-len(self.SUFFIX)] for f in os.listdir(user_dir)
+            if f.endswith(self.SUFFIX) and f != SessionIndex.FILENAME
+        ]
+        return sorted(files, key=session_created_at, reverse=True)
+
+    def scan_index_entries(self, username):
+        """Membina semula entri indeks dengan membaca setiap sesi (sekali sahaja, jika indeks tiada)."""
+        entries = {}
+        for session_id in self.scan_session_ids(username):
+            history = self.load_messages(username, session_id)
+            entries[session_id] = {
+                "id": session_id, "title": session_title(history),
+                "created_at": session_created_at(session_id),
+                "updated_at": os.path.getmtime(self._session_path(username, session_id)),
+                "message_count": len(history),
+            }
+        return entries
+
+    def list_sessions(self, username):
+        """Entri indeks {'id', 'title', 'created_at', 'updated_at', 'message_count'}, yang terbaharu dahulu."""
+        return self.index.list(username)
+
+    def search_sessions(self, username, query="", limit=None, offset=0):
+        """Memulangkan (entri pada halaman, jumlah sesi yang sepadan) dari indeks dalam proses."""
+        return self.index.search(username, query, limit, offset)
+
+    def get_session(self, username, session_id):
+        """Entri indeks bagi satu sesi, atau None."""
+        return self.index.get(username, session_id)
+
+    def list_session_ids(self, username):
+        return [entry["id"] for entry in self.list_sessions(username)]
+
+    def delete_session(self, username, session_id):
+        filepath = self._session_path(username, session_id)
+        if not os.path.exists(filepath):
+            return False
+        os.remove(filepath)
+        if os.path.exists(self._summary_path(username, session_id)):
+            os.remove(self._summary_path(username, session_id))
+        self.index.remove(username, session_id)
+        return True
+
+    def delete_all_sessions(self, username):
+        """Memulangkan (bilangan dipadam, senarai ralat)."""
+        user_dir = self.user_dir(username)
+        deleted_count = 0
+        errors = []
+        for filename in os.listdir(user_dir):
+            if filename.endswith((".json", ".summary")):
+                try:
+                    os.remove(os.path.join(user_dir, filename))
+                    if filename.endswith(".json"):
+                        deleted_count += 1
+                except OSError as e:
+                    errors.append(f"Gagal memadam {filename}: {e}")
+        self.index.clear(username)
+        return deleted_count, errors
+
+    def save_summary(self, username, session_id, summary):
+        with open(self._summary_path(username, session_id), "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+
+    def load_summary(self, username, session_id):
+        try:
+            with open(self._summary_path(username, session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+class SQLiteChatStore:
+    """
+    Storan SQLite (mod WAL) dengan mesej sebagai baris tambah-sahaja.
+
+    Menyimpan mesej baharu hanya memasukkan baris yang belum wujud, jadi
+    kosnya tidak bergantung pada panjang sejarah. Senarai sesi ialah satu
+    pertanyaan berindeks mengikut (pengguna, masa cipta).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            title TEXT,
+            summary TEXT,
+            UNIQUE (username, session_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (username, created_at DESC);
+        CREATE TABLE IF NOT EXISTS messages (
+            session_pk INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            extra TEXT,
+            PRIMARY KEY (session_pk, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path=CHAT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        # Pangkalan data lama dicipta sebelum lajur tajuk ditambah
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "title" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN title TEXT")
+
+    def _conn(self):
+        """Satu sambungan bagi setiap thread (sambungan sqlite3 tidak boleh dikongsi antara thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _session_row(self, conn, username, session_id):
+        return conn.execute(
+            "SELECT id, message_count FROM sessions WHERE username = ? AND session_id = ?",
+            (username, session_id)
+        ).fetchone()
+
+    @staticmethod
+    def _message_row(session_pk, seq, message):
+        extra = {k: v for k, v in message.items() if k not in ("role", "content")}
+        return (session_pk, seq, message.get("role", ""), message.get("content", ""),
+                json.dumps(extra) if extra else None)
+
+    def save_messages(self, username, session_id, history, offset=0):
+        """
+        Menyimpan sejarah dengan hanya menambah mesej yang belum disimpan.
+
+        `history` ialah mesej bermula dari kedudukan `offset`; mesej sebelum
+        itu sudah berada dalam storan. Jika sejarah lebih pendek dari yang
+        disimpan (cth. mesej dibuang), mesej dari `offset` ditulis semula.
+        """
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            row = self._session_row(conn, username, session_id)
+            if row is None:
+                cursor = conn.execute(
+                    "INSERT INTO sessions (username, session_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (username, session_id, session_created_at(session_id), now)
+                )
+                session_pk, stored_count = cursor.lastrowid, 0
+            else:
+                session_pk, stored_count = row
+            _check_offset(session_id, offset, stored_count)
+            total = offset + len(history)
+            if total < stored_count:
+                conn.execute("DELETE FROM messages WHERE session_pk = ? AND seq >= ?", (session_pk, offset))
+                stored_count = offset
+            conn.executemany(
+                "INSERT INTO messages (session_pk, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+                [self._message_row(session_pk, seq, msg)
+                 for seq, msg in enumerate(history[stored_count - offset:], start=stored_count)]
+            )
+            conn.execute(
+                "UPDATE sessions SET message_count = ?, updated_at = ?,"
+                " title = CASE WHEN title IS NULL OR title = '' THEN ? ELSE title END WHERE id = ?",
+                (total, now, session_title(history), session_pk)
+            )
+
+    def load_messages(self, username, session_id, start=0, stop=None):
+        """Mesej sesi dalam julat [start, stop), dibaca terus mengikut indeks (sesi, seq)."""
+        rows = self._conn().execute(
+            "SELECT m.role, m.content, m.extra FROM messages m JOIN sessions s ON s.id = m.session_pk"
+            " WHERE s.username = ? AND s.session_id = ? AND m.seq >= ? AND m.seq < ? ORDER BY m.seq",
+            (username, session_id, start, stop if stop is not None else 2 ** 62)
+        ).fetchall()
+        return [dict({"role": role, "content": content}, **(json.loads(extra) if extra else {}))
+                for role, content, extra in rows]
+
+    def count_messages(self, username, session_id):
+        row = self._session_row(self._conn(), username, session_id)
+        return row[1] if row else 0
+
+    ENTRY_COLUMNS = "session_id, title, created_at, updated_at, message_count"
+
+    @staticmethod
+    def _entry(row):
+        return {"id": row[0], "title": row[1] or "", "created_at": row[2], "updated_at": row[3], "message_count": row[4]}
+
+    def list_sessions(self, username):
+        """Entri sesi {'id', 'title', 'created_at', 'updated_at', 'message_count'}, yang terbaharu dahulu."""
+        rows = self._conn().execute(
+            f"SELECT {self.ENTRY_COLUMNS} FROM sessions"
+            " WHERE username = ? ORDER BY created_at DESC, session_id DESC",
+            (username,)
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def search_sessions(self, username, query="", limit=None, offset=0):
+        """
+        Memulangkan (entri pada halaman, jumlah sesi yang sepadan).
+
+        Carian dan paginasi dilakukan dalam SQL supaya hanya baris pada
+        halaman yang dibaca, walau berapa banyak sesi pengguna.
+        """
+        where, params = "username = ?", [username]
+        if query:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where += " AND (title LIKE ? ESCAPE '\\' OR session_id LIKE ? ESCAPE '\\')"
+            params += [pattern, pattern]
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM sessions WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {self.ENTRY_COLUMNS} FROM sessions WHERE {where}"
+            " ORDER BY created_at DESC, session_id DESC LIMIT ? OFFSET ?",
+            params + [limit if limit is not None else -1, offset]
+        ).fetchall()
+        return [self._entry(row) for row in rows], total
+
+    def get_session(self, username, session_id):
+        """Entri bagi satu sesi melalui kunci unik (pengguna, ID sesi), atau None."""
+        row = self._conn().execute(
+            f"SELECT {self.ENTRY_COLUMNS} FROM sessions WHERE username = ? AND session_id = ?",
+            (username, session_id)
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    def list_session_ids(self, username):
+        rows = self._conn().execute(
+            "SELECT session_id FROM sessions WHERE username = ? ORDER BY created_at DESC, session_id DESC",
+            (username,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_session(self, username, session_id):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE username = ? AND session_id = ?", (username, session_id)
+            )
+        return cursor.rowcount > 0
+
+    def delete_all_sessions(self, username):
+        """Memulangkan (bilangan dipadam, senarai ralat)."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
+        return cursor.rowcount, []
+
+    def save_summary(self, username, session_id, summary):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE sessions SET summary = ? WHERE username = ? AND session_id = ?",
+                (json.dumps(summary), username, session_id)
+            )
+
+    def load_summary(self, username, session_id):
+        row = self._conn().execute(
+            "SELECT summary FROM sessions WHERE username = ? AND session_id = ?", (username, session_id)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+class JsonlChatStore(JsonChatStore):
+    """
+    Log sesi tambah-sahaja: satu mesej JSON bagi setiap baris dalam <sesi>.jsonl.
+
+    Setiap simpanan menambah mesej baharu dengan satu write + fsync. Baris
+    terakhir yang tidak lengkap (kerosakan semasa menulis) diabaikan semasa
+    membaca dan dipotong sebelum tambahan seterusnya. Jika sejarah menjadi
+    lebih pendek, rekod {"_op": "truncate"} ditambah dan bukannya menulis
+    semula fail; thread latar belakang memadatkan log sedemikian secara
+    berkala dengan penamaan semula atomik, jadi kerosakan di tengah-tengah
+    pemadatan meninggalkan sama ada log lama atau log baharu yang lengkap.
+    Kunci adalah dalam proses sahaja, jadi storan ini menganggap satu proses
+    Streamlit.
+    """
+
+    SUFFIX = ".jsonl"
+
+    def __init__(self, history_dir=HISTORY_DIR, compact_interval=JSONL_COMPACT_INTERVAL):
+        super().__init__(history_dir)
+        self.compact_interval = compact_interval
+        self._counts = {}  # (pengguna, sesi) -> bilangan mesej hidup
+        self._dirty = set()  # sesi dengan rekod mati yang perlu dipadatkan
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._compactor = threading.Thread(target=self._compaction_loop, name="jsonl-compactor", daemon=True)
+        self._compactor.start()
+
+    def _lock_for(self, username, session_id):
+        with self._locks_guard:
+            return self._locks.setdefault((username, session_id), threading.Lock())
+
+    def _iter_records(self, path):
+        """Membaca rekod satu demi satu; baris terakhir tanpa newline dianggap tidak lengkap."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        return
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def _dirty_marker(self, username, session_id):
+        return self._session_path(username, session_id) + ".dirty"
+
+    def iter_messages(self, username, session_id):
+        """
+        Menghasilkan mesej sesi secara berstrim tanpa memuatkan keseluruhan fail.
+
+        Log yang mengandungi rekod truncate (ditanda dengan fail .dirty sehingga
+        dipadatkan) perlu ditimbal dahulu kerana rekod kemudian boleh membuang
+        mesej yang lebih awal.
+        """
+        records = self._iter_records(self._session_path(username, session_id))
+        if not os.path.exists(self._dirty_marker(username, session_id)):
+            yield from records
+            return
+        self._dirty.add((username, session_id))
+        pending = []
+        for record in records:
+            if record.get("_op") == "truncate":
+                del pending[record["count"]:]
+            else:
+                pending.append(record)
+        yield from pending
+
+    def load_messages(self, username, session_id, start=0, stop=None):
+        """Mesej sesi dalam julat [start, stop); fail dibaca hanya setakat `stop`."""
+        if start or stop is not None:
+            return list(itertools.islice(self.iter_messages(username, session_id), start, stop))
+        messages = list(self.iter_messages(username, session_id))
+        self._counts[(username, session_id)] = len(messages)
+        return messages
+
+    def count_messages(self, username, session_id):
+        key = (username, session_id)
+        if key not in self._counts:
+            self._counts[key] = sum(1 for _ in self.iter_messages(username, session_id))
+        return self._counts[key]
+
+    def _repair_tail(self, path):
+        """Memotong baris terakhir yang tidak lengkap sebelum menambah rekod baharu."""
+        try:
+            with open(path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return
+                # Cari newline terakhir dari belakang dalam blok kecil
+                position = size
+                while position > 0:
+                    step = min(4096, position)
+                    position -= step
+                    f.seek(position)
+                    block = f.read(step)
+                    index = block.rfind(b"\n")
+                    if index >= 0:
+                        f.truncate(position + index + 1)
+                        return
+                f.truncate(0)
+        except FileNotFoundError:
+            return
+
+    def _append_records(self, path, records):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save_messages(self, username, session_id, history, offset=0):
+        """`history` ialah mesej bermula dari kedudukan `offset`; hanya mesej baharu ditambah pada log."""
+        key = (username, session_id)
+        path = self._session_path(username, session_id)
+        with self._lock_for(username, session_id):
+            # Sentiasa dibaiki sebelum menambah: kiraan mungkin sudah diisi oleh
+            # load_messages yang mengabaikan baris terakhir yang tidak lengkap
+            self._repair_tail(path)
+            if key not in self._counts:
+                self._counts[key] = sum(1 for _ in self.iter_messages(username, session_id))
+            stored_count = self._counts[key]
+            _check_offset(session_id, offset, stored_count)
+            total = offset + len(history)
+            records = []
+            if total < stored_count:
+                # Penanda ditulis dahulu supaya pembaca tahu log perlu ditimbal
+                open(self._dirty_marker(username, session_id), "w").close()
+                records.append({"_op": "truncate", "count": total})
+                self._dirty.add(key)
+                stored_count = total
+            records.extend(history[stored_count - offset:])
+            if records:
+                self._append_records(path, records)
+            self._counts[key] = total
+        self.index.record_save(username, session_id, history, offset)
+
+    def compact(self, username, session_id):
+        """Menulis semula log sesi kepada mesej hidup sahaja secara atomik."""
+        path = self._session_path(username, session_id)
+        with self._lock_for(username, session_id):
+            messages = list(self.iter_messages(username, session_id))
+            atomic_write_text(path, "".join(json.dumps(msg, ensure_ascii=False) + "\n" for msg in messages))
+            self._counts[(username, session_id)] = len(messages)
+            self._dirty.discard((username, session_id))
+            if os.path.exists(self._dirty_marker(username, session_id)):
+                os.remove(self._dirty_marker(username, session_id))
+
+    def _compaction_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            for username, session_id in list(self._dirty):
+                try:
+                    self.compact(username, session_id)
+                except (OSError, ValueError):
+                    pass  # Dicuba semula pada kitaran seterusnya
+
+    def delete_session(self, username, session_id):
+        with self._lock_for(username, session_id):
+            self._counts.pop((username, session_id), None)
+            self._dirty.discard((username, session_id))
+            if os.path.exists(self._dirty_marker(username, session_id)):
+                os.remove(self._dirty_marker(username, session_id))
+            return super().delete_session(username, session_id)
+
+    def delete_all_sessions(self, username):
+        user_dir = self.user_dir(username)
+        deleted_count = 0
+        errors = []
+        for filename in os.listdir(user_dir):
+            if filename.endswith((".jsonl", ".summary", ".jsonl.dirty")) and filename != SessionIndex.FILENAME:
+                try:
+                    os.remove(os.path.join(user_dir, filename))
+                    if filename.endswith(".jsonl"):
+                        deleted_count += 1
+                        session_id = filename[:-len(".jsonl")]
+                        self._counts.pop((username, session_id), None)
+                        self._dirty.discard((username, session_id))
+                except OSError as e:
+                    errors.append(f"Gagal memadam {filename}: {e}")
+        self.index.clear(username)
+        return deleted_count, errors
+
+    def save_summary(self, username, session_id, summary):
+        atomic_write_text(self._summary_path(username, session_id), json.dumps(summary))
+
+def migrate_json_sessions(source, target, usernames=None, rename=True):
+    """
+    Menyalin sesi dari JsonChatStore ke storan lain.
+
+    Fail yang berjaya dipindahkan dinamakan semula kepada *.json.migrated supaya
+    ia tidak dipindahkan dua kali. Fail yang rosak atau tidak boleh dibaca
+    dilangkau (dan, dengan `rename`, dinamakan semula kepada *.json.corrupt
+    untuk disemak secara manual), supaya satu fail tidak menghalang storan daripada dimulakan.
+
+    Returns:
+        Tuple (bilangan sesi dipindahkan, senarai (laluan, ralat) yang dilangkau).
+    """
+    if usernames is None:
+        if not os.path.isdir(source.history_dir):
+            return 0, []
+        usernames = [name for name in os.listdir(source.history_dir)
+                     if os.path.isdir(os.path.join(source.history_dir, name))]
+    migrated = 0
+    skipped = []
+    for username in usernames:
+        for session_id in source.scan_session_ids(username):
+            path = source._session_path(username, session_id)
+            try:
+                history = source.load_messages(username, session_id)
+                if not isinstance(history, list):
+                    raise ValueError("kandungan bukan senarai mesej")
+            except (ValueError, OSError) as e:
+                skipped.append((path, str(e)))
+                if rename:
+                    try:
+                        os.replace(path, path + ".corrupt")
+                    except OSError:
+                        pass  # Dicuba semula pada permulaan seterusnya
+                continue
+            target.save_messages(username, session_id, history)
+            summary = source.load_summary(username, session_id)
+            if summary:
+                target.save_summary(username, session_id, summary)
+            if rename:
+                os.replace(path, path + ".migrated")
+            migrated += 1
+    return migrated, skipped
+
+STORE_BACKENDS = {"sqlite": SQLiteChatStore, "jsonl": JsonlChatStore, "json": JsonChatStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_chat_store():
+    """Mendapatkan storan sesi mengikut CHAT_STORE_BACKEND ('sqlite', 'jsonl' atau 'json')."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = STORE_BACKENDS.get(CHAT_STORE_BACKEND, JsonChatStore)()
+                if type(store) is not JsonChatStore:
+                    # Sesi JSON lama dipindahkan sekali semasa proses bermula
+                    migrate_json_sessions(JsonChatStore(), store)
+                _store = store
+    return _store
+
+def main():
+    parser = argparse.ArgumentParser(description="Alat storan sesi perbualan DFK Stembot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Pindahkan sesi JSON ke SQLite atau JSONL.")
+    migrate.add_argument("--to", choices=["sqlite", "jsonl"], default="sqlite", help="Storan sasaran.")
+    migrate.add_argument("--user", action="append", dest="usernames", help="Hanya pengguna ini (boleh diulang).")
+    migrate.add_argument("--keep", action="store_true", help="Jangan namakan semula fail JSON selepas dipindahkan.")
+    compact = subparsers.add_parser("compact", help="Padatkan semua log JSONL sekarang.")
+    compact.add_argument("--user", action="append", dest="usernames", help="Hanya pengguna ini (boleh diulang).")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        target = STORE_BACKENDS[args.to]()
+        count, skipped = migrate_json_sessions(JsonChatStore(), target, args.usernames, rename=not args.keep)
+        print(f"{count} sesi dipindahkan ke storan '{args.to}'.")
+        for path, error in skipped:
+            print(f"Dilangkau kerana rosak: {path}: {error}")
+    elif args.command == "compact":
+        store = JsonlChatStore()
+        usernames = args.usernames or [name for name in os.listdir(store.history_dir)
+                                       if os.path.isdir(os.path.join(store.history_dir, name))]
+        count = 0
+        for username in usernames:
+            for session_id in store.list_session_ids(username):
+                store.compact(username, session_id)
+                count += 1
+        print(f"{count} log sesi dipadatkan.")
+
+if __name__ == "__main__":
+    main()
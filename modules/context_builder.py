@@ -0,0 +1,104 @@
+# modules/context_builder.py
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MODEL_BUDGETS, CONTEXT_SUMMARY_MIN_MESSAGES
+
+# Anggaran kasar: ~4 aksara setiap token untuk teks Inggeris/Melayu, ditambah
+# token tambahan untuk format peranan setiap mesej.
+CHARS_PER_TOKEN = 4
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_INSTRUCTION = (
+    "Ringkaskan perbualan tutorial di bawah dalam bahasa yang sama dengan perbualan. "
+    "Kekalkan soalan pelajar, fakta, formula, nilai berangka dan kesimpulan penting. "
+    "Tulis dalam bentuk nota ringkas, tidak lebih daripada 200 patah perkataan."
+)
+
+def estimate_tokens(text):
+    """Menganggar bilangan token bagi teks tanpa memerlukan tokenizer model."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def estimate_message_tokens(message):
+    """Menganggar bilangan token bagi satu mesej {'role', 'content'}."""
+    return MESSAGE_TOKEN_OVERHEAD + estimate_tokens(message.get("content", ""))
+
+def get_context_budget(model):
+    """Bajet token sejarah bagi model, mengikut nama penuh dahulu kemudian nama asas (tanpa tag)."""
+    if model in CONTEXT_MODEL_BUDGETS:
+        return CONTEXT_MODEL_BUDGETS[model]
+    return CONTEXT_MODEL_BUDGETS.get(model.split(":")[0], CONTEXT_TOKEN_BUDGET)
+
+def find_window_start(messages, budget):
+    """
+    Mencari indeks permulaan tetingkap gelongsor yang muat dalam bajet.
+
+    Mesej terakhir (prompt semasa) sentiasa disertakan walaupun melebihi bajet.
+    """
+    used = 0
+    for index in range(len(messages) - 1, -1, -1):
+        used += estimate_message_tokens(messages[index])
+        if used > budget and index < len(messages) - 1:
+            return index + 1
+    return 0
+
+def summary_message(summary):
+    """Mesej sistem yang membawa ringkasan perbualan terdahulu."""
+    return {"role": "system", "content": f"Ringkasan perbualan terdahulu:\n{summary['text']}"}
+
+def retrieval_message(chunks):
+    """Mesej sistem yang membawa petikan dokumen yang paling berkaitan dengan prompt."""
+    excerpts = "\n\n".join(f"[{chunk['filename']}]\n{chunk['text']}" for chunk in chunks)
+    return {
+        "role": "system",
+        "content": "Gunakan petikan dokumen berikut jika berkaitan untuk menjawab soalan pengguna.\n\n" + excerpts,
+    }
+
+def fit_messages_to_budget(messages, model, summary=None, offset=0):
+    """
+    Memangkas mesej supaya muat dalam bajet token model.
+
+    Jika ringkasan bergulir tersedia dan tidak bertindih dengan tetingkap, ia
+    diletakkan di hadapan sebagai mesej sistem. Ringkasan dikemas kini hanya
+    selepas sekurang-kurangnya CONTEXT_SUMMARY_MIN_MESSAGES mesej tercicir
+    (lihat summary_refresh_range), jadi mesej di antara hujung ringkasan dan
+    permulaan tetingkap (kurang daripada kira-kira CONTEXT_SUMMARY_MIN_MESSAGES)
+    tidak dihantar sehingga ringkasan seterusnya meliputinya.
+
+    Args:
+        messages: Senarai mesej {'role', 'content'} termasuk prompt semasa.
+        summary: Dict pilihan {'covered': bilangan mesej yang diringkaskan, 'text': ...}.
+        offset: Bilangan mesej sesi sebelum `messages[0]` yang tidak dimuatkan
+            dalam memori (lihat session_manager.trim_chat_history).
+    """
+    budget = get_context_budget(model)
+    if summary and summary.get("text"):
+        with_summary = summary_message(summary)
+        start = find_window_start(messages, budget - estimate_message_tokens(with_summary))
+        # Tetingkap tidak boleh dilanjutkan ke belakang hingga hujung ringkasan:
+        # find_window_start sudah memulangkan permulaan paling awal yang muat
+        if 0 < summary.get("covered", 0) <= offset + start:
+            return [with_summary] + messages[start:]
+    return messages[find_window_start(messages, budget):]
+
+def summary_refresh_range(messages, model, summary=None, offset=0):
+    """
+    Menentukan sama ada ringkasan bergulir perlu dikira semula.
+
+    Returns:
+        Indeks akhir (eksklusif, dalam keseluruhan sesi) mesej yang patut
+        diringkaskan, atau None jika ringkasan semasa masih mencukupi.
+    """
+    start = offset + find_window_start(messages, get_context_budget(model))
+    covered = summary.get("covered", 0) if summary else 0
+    if start - covered < CONTEXT_SUMMARY_MIN_MESSAGES:
+        return None
+    return start
+
+def build_summary_request(messages, previous_summary=None):
+    """Membina mesej untuk meminta model meringkaskan `messages` bersama ringkasan lama."""
+    transcript = "\n\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+    if previous_summary and previous_summary.get("text"):
+        transcript = f"Ringkasan sebelum ini:\n{previous_summary['text']}\n\nPerbualan seterusnya:\n{transcript}"
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTION},
+        {"role": "user", "content": transcript},
+    ]
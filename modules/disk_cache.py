@@ -0,0 +1,48 @@
+# modules/disk_cache.py
+#
+# Fungsi bantuan untuk cache fail pada cakera dengan pengusiran LRU mengikut
+# saiz. Masa ubah suai fail digunakan sebagai masa akses terakhir (kemas kini
+# dengan touch() pada setiap hit) kerana atime tidak boleh dipercayai.
+
+import os
+
+def scan_entries(root, suffixes):
+    """Semua fail cache di bawah `root` sebagai senarai (laluan, saiz, masa_akses_terakhir)."""
+    entries = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            # Fail bermula dengan '.' ialah fail sementara yang sedang ditulis
+            if name.startswith(".") or not name.endswith(tuple(suffixes)):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Dibuang oleh proses lain
+            entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+def touch(path):
+    """Menanda entri sebagai baru digunakan."""
+    os.utime(path)
+
+def evict_lru(root, max_bytes, suffixes):
+    """
+    Membuang fail paling lama tidak digunakan sehingga jumlah saiz tidak melebihi `max_bytes`.
+
+    Returns:
+        Tuple (jumlah saiz selepas pengusiran, bilangan fail dibuang).
+    """
+    entries = sorted(scan_entries(root, suffixes), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return total, removed
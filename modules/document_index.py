@@ -0,0 +1,255 @@
+# modules/document_index.py
+#
+# Indeks vektor tempatan bagi dokumen yang dimuat naik. Teks dipecahkan kepada
+# cebisan, dibenamkan melalui /api/embed Ollama secara berkelompok dan
+# disimpan bagi setiap pengguna sebagai matriks NumPy (dibaca dengan mmap).
+# Hanya cebisan yang paling berkaitan dihantar bersama prompt.
+
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from config import (
+    RAG_INDEX_DIR, RAG_EMBED_MODEL, RAG_EMBED_BATCH_SIZE, RAG_CHUNK_CHARS,
+    RAG_CHUNK_OVERLAP, RAG_TOP_K, RAG_MIN_SCORE
+)
+from .backends import get_backend_pool
+from .ollama_client import post_to_ollama
+
+def chunk_text(text, chunk_chars=RAG_CHUNK_CHARS, overlap=RAG_CHUNK_OVERLAP):
+    """
+    Memecahkan teks kepada cebisan kira-kira `chunk_chars` aksara.
+
+    Perenggan digabungkan selagi muat; perenggan yang terlalu panjang dipotong
+    dengan pertindihan `overlap` aksara supaya ayat di sempadan tidak hilang.
+    """
+    pieces = []
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        step = max(1, chunk_chars - overlap)
+        for start in range(0, len(paragraph), step):
+            pieces.append(paragraph[start:start + chunk_chars])
+            if start + chunk_chars >= len(paragraph):
+                break
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def embed_texts(texts, model=RAG_EMBED_MODEL, batch_size=RAG_EMBED_BATCH_SIZE):
+    """
+    Membenamkan teks melalui /api/embed secara berkelompok.
+
+    Returns:
+        Matriks float32 (bilangan_teks x dimensi) dengan baris bernorma satu,
+        jadi hasil darab titik ialah persamaan kosinus.
+
+    Raises:
+        requests.exceptions.RequestException atau ValueError jika pembenaman gagal.
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        backend, response = post_to_ollama('/api/embed', {'model': model, 'input': batch}, timeout=300)
+        try:
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings") or []
+        finally:
+            get_backend_pool().release(backend)
+        if len(embeddings) != len(batch):
+            raise ValueError(f"Model pembenaman '{model}' memulangkan {len(embeddings)} vektor untuk {len(batch)} teks.")
+        vectors.extend(embeddings)
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def document_id(text, embed_model=RAG_EMBED_MODEL):
+    """ID dokumen dari kandungan teks dan model pembenaman."""
+    return hashlib.sha256(f"{embed_model}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+class DocumentIndex:
+    """
+    Indeks vektor bagi seorang pengguna.
+
+    Fail dalam direktori pengguna:
+        vectors.npy     Matriks float32 semua cebisan, dibaca dengan mmap.
+        chunks.jsonl    Satu baris {'doc', 'text'} bagi setiap baris matriks.
+        documents.json  {doc_id: {'filename', 'sessions', 'created_at'}}.
+
+    Dokumen yang sama dalam beberapa sesi dibenamkan sekali sahaja; sesi
+    baharu hanya ditambah pada rekod dokumen.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._vectors = None
+        self._chunks = []
+        self._documents = {}
+        self._row_docs = np.empty(0, dtype=object)
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _reload_if_changed(self):
+        """Memuatkan semula fail jika proses lain telah mengemas kini indeks. Mesti dipanggil dengan kunci dipegang."""
+        try:
+            mtime = os.stat(self._path("documents.json")).st_mtime_ns
+        except FileNotFoundError:
+            self._vectors, self._chunks, self._documents = None, [], {}
+            self._row_docs = np.empty(0, dtype=object)
+            self._loaded_mtime = None
+            return
+        if mtime == self._loaded_mtime:
+            return
+        with open(self._path("documents.json"), "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        chunks = []
+        if os.path.exists(self._path("chunks.jsonl")):
+            with open(self._path("chunks.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        chunks.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Baris terakhir separuh ditulis
+        vectors = None
+        if os.path.exists(self._path("vectors.npy")):
+            vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        # Kerosakan di antara penulisan fail: gunakan hanya baris yang ada dalam kedua-duanya
+        rows = min(len(chunks), 0 if vectors is None else vectors.shape[0])
+        self._chunks = chunks[:rows]
+        self._vectors = vectors[:rows] if vectors is not None else None
+        self._documents = documents
+        self._row_docs = np.array([chunk["doc"] for chunk in self._chunks], dtype=object)
+        self._loaded_mtime = mtime
+
+    def _write_documents(self, documents):
+        tmp_path = self._path(f"documents.json.tmp{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(documents, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path("documents.json"))
+
+    def session_documents(self, session_key):
+        """ID dokumen yang dilampirkan pada sesi, mengikut masa dimuat naik."""
+        with self._lock:
+            self._reload_if_changed()
+            docs = [(info["created_at"], doc_id) for doc_id, info in self._documents.items()
+                    if session_key in info.get("sessions", [])]
+        return [doc_id for _, doc_id in sorted(docs)]
+
+    def add_document(self, session_key, filename, text):
+        """
+        Memecah, membenam dan menyimpan dokumen, kemudian melampirkannya pada sesi.
+
+        Returns:
+            Bilangan cebisan baharu yang dibenamkan (0 jika dokumen sudah diindeks).
+        """
+        doc_id = document_id(text)
+        with self._lock:
+            self._reload_if_changed()
+            known = doc_id in self._documents
+        if known:
+            with self._lock:
+                self._reload_if_changed()
+                info = self._documents[doc_id]
+                if session_key not in info["sessions"]:
+                    info["sessions"].append(session_key)
+                    self._write_documents(self._documents)
+            return 0
+
+        chunks = chunk_text(text)
+        if not chunks:
+            return 0
+        # Pembenaman dilakukan tanpa kunci kerana ia perlahan
+        vectors = embed_texts(chunks)
+
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            self._reload_if_changed()
+            existing = None if self._vectors is None else np.asarray(self._vectors)
+            if existing is not None and existing.shape[1] != vectors.shape[1]:
+                # Model pembenaman telah ditukar; vektor lama tidak lagi setanding
+                existing, self._chunks, self._documents = None, [], {}
+            combined = vectors if existing is None else np.concatenate([existing, vectors])
+            tmp_path = self._path(f"vectors.tmp{os.getpid()}.npy")
+            np.save(tmp_path, combined)
+            os.replace(tmp_path, self._path("vectors.npy"))
+            mode = "a" if existing is not None else "w"
+            with open(self._path("chunks.jsonl"), mode, encoding="utf-8") as f:
+                f.writelines(json.dumps({"doc": doc_id, "text": chunk}, ensure_ascii=False) + "\n" for chunk in chunks)
+            self._documents[doc_id] = {"filename": filename, "sessions": [session_key], "created_at": time.time()}
+            # documents.json ditulis terakhir; mtimenya menandakan indeks lengkap kepada pembaca
+            self._write_documents(self._documents)
+            self._loaded_mtime = None
+        return len(chunks)
+
+    def search(self, query_vector, session_key, k=RAG_TOP_K, min_score=RAG_MIN_SCORE):
+        """
+        Mencari `k` cebisan paling serupa dalam dokumen sesi.
+
+        Jika tiada cebisan melepasi `min_score` (cth. arahan umum seperti
+        "ringkaskan dokumen ini"), cebisan awal dokumen terbaru dipulangkan.
+
+        Returns:
+            Senarai {'filename', 'text', 'score'} mengikut skor menurun.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            session_docs = [doc_id for doc_id, info in self._documents.items()
+                            if session_key in info.get("sessions", [])]
+            if not session_docs or self._vectors is None:
+                return []
+            rows = np.flatnonzero(np.isin(self._row_docs, session_docs))
+            if rows.size == 0:
+                return []
+            scores = np.asarray(self._vectors[rows]) @ query_vector
+            top = np.argsort(-scores)[:k] if rows.size <= k else np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = [
+                {"filename": self._documents[self._chunks[rows[i]]["doc"]]["filename"],
+                 "text": self._chunks[rows[i]]["text"], "score": float(scores[i])}
+                for i in top if scores[i] >= min_score
+            ]
+            if results:
+                return results
+            latest = max(session_docs, key=lambda doc_id: self._documents[doc_id]["created_at"])
+            return [
+                {"filename": self._documents[latest]["filename"], "text": chunk["text"], "score": 0.0}
+                for chunk in self._chunks if chunk["doc"] == latest
+            ][:k]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_document_index(username):
+    """Mendapatkan indeks dokumen bagi pengguna (dikongsi oleh semua sesi Streamlit dalam proses)."""
+    with _indexes_lock:
+        if username not in _indexes:
+            _indexes[username] = DocumentIndex(os.path.join(RAG_INDEX_DIR, username))
+        return _indexes[username]
+
+def index_document(username, session_key, filename, text):
+    """Mengindeks teks dokumen yang dimuat naik untuk sesi. Memulangkan bilangan cebisan baharu."""
+    return get_document_index(username).add_document(session_key, filename, text)
+
+def retrieve_chunks(username, session_key, query, k=RAG_TOP_K):
+    """
+    Memulangkan cebisan dokumen sesi yang paling berkaitan dengan `query`.
+
+    Tiada permintaan pembenaman dibuat jika sesi tidak mempunyai dokumen.
+    """
+    index = get_document_index(username)
+    if not index.session_documents(session_key):
+        return []
+    return index.search(embed_texts([query])[0], session_key, k)
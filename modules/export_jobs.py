@@ -0,0 +1,225 @@
+# modules/export_jobs.py
+#
+# Eksport perbualan dijalankan sebagai kerja latar belakang dalam kumpulan
+# proses supaya membina PDF/Word/PowerPoint yang panjang tidak membekukan
+# skrip Streamlit. UI meninjau status kerja mengikut ID.
+#
+# Fail yang dijana disimpan dalam EXPORT_CACHE_DIR mengikut cincangan
+# kandungan, jadi mengeksport perbualan yang sama sekali lagi adalah segera.
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from config import (
+    EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, EXPORT_WORKERS, EXPORT_JOB_TTL,
+    LOGO_PATH, WATERMARK_TEXT
+)
+from .disk_cache import touch, evict_lru
+from .metrics import EXPORT_DURATION
+from .file_processor import (
+    format_conversation_text, save_to_word, save_to_txt, save_to_excel, save_to_pptx
+)
+from .pdf_renderer import render_chat_pdf
+
+# format -> (label, sambungan fail, fungsi simpan, input: 'text' atau 'history')
+EXPORT_FORMATS = {
+    "pdf": ("PDF", ".pdf", render_chat_pdf, "history"),
+    "docx": ("Word", ".docx", save_to_word, "text"),
+    "txt": ("Teks", ".txt", save_to_txt, "text"),
+    "xlsx": ("Excel", ".xlsx", save_to_excel, "history"),
+    "pptx": ("PowerPoint", ".pptx", save_to_pptx, "history"),
+}
+
+# Naikkan setiap kali rupa fail eksport berubah supaya fail lama dalam cache tidak digunakan
+EXPORT_RENDERER_VERSION = "2"
+
+def export_cache_key(export_format, content):
+    """Cincangan kandungan eksport bersama format, tera air, logo dan versi penjana."""
+    try:
+        logo_stat = os.stat(LOGO_PATH)
+        logo_version = [logo_stat.st_size, logo_stat.st_mtime_ns]
+    except (OSError, TypeError):
+        logo_version = None
+    material = {
+        "format": export_format, "content": content, "watermark": WATERMARK_TEXT,
+        "logo": logo_version, "version": EXPORT_RENDERER_VERSION,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def run_export(export_format, content, full_path):
+    """
+    Tugas pekerja: membina satu fail eksport. Memulangkan True jika berjaya.
+
+    Fail ditulis ke laluan sementara dan dinamakan semula supaya pembaca
+    cache tidak pernah melihat fail separuh siap.
+    """
+    save_function = EXPORT_FORMATS[export_format][2]
+    # Sambungan dikekalkan kerana sesetengah penulis (cth. pandas) memilih format mengikutnya
+    tmp_path = os.path.join(os.path.dirname(full_path), f".tmp{os.getpid()}_{os.path.basename(full_path)}")
+    try:
+        if not save_function(content, tmp_path):
+            return False
+        os.replace(tmp_path, full_path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class ExportJob:
+    """Satu permintaan eksport dan keadaannya."""
+
+    def __init__(self, username, export_format, full_path, filename, future, cached=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.username = username
+        self.format = export_format
+        self.full_path = full_path
+        self.filename = filename  # Nama fail untuk dimuat turun
+        self.cached = cached
+        self.created_at = time.time()
+        self.future = future
+
+    @property
+    def status(self):
+        """'queued', 'running', 'done' atau 'failed'."""
+        if self.future.running():
+            return "running"
+        if not self.future.done():
+            return "queued"
+        if self.future.cancelled() or self.future.exception() is not None or not self.future.result():
+            return "failed"
+        return "done"
+
+    @property
+    def error(self):
+        """Sebab kegagalan dari pekerja eksport, atau None jika belum gagal."""
+        if not self.future.done():
+            return None
+        if self.future.cancelled():
+            return "Eksport dibatalkan."
+        if self.future.exception() is not None:
+            return str(self.future.exception())
+        if not self.future.result():
+            return "Penjana eksport gagal tanpa butiran."
+        return None
+
+class ExportJobManager:
+    """Menjejak kerja eksport bagi semua pengguna dalam proses ini."""
+
+    def __init__(self, max_workers=EXPORT_WORKERS, job_ttl=EXPORT_JOB_TTL,
+                 cache_dir=EXPORT_CACHE_DIR, cache_max_bytes=EXPORT_CACHE_MAX_BYTES):
+        # 'fork' tidak selamat dalam proses yang sudah mempunyai thread latar belakang
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+        self.job_ttl = job_ttl
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self._jobs = {}  # id kerja -> ExportJob
+        self._in_flight = {}  # laluan cache -> Future yang sedang membina fail tersebut
+        # RLock: panggilan balik future yang sudah selesai dijalankan serta-merta dalam thread yang sama
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cached_future(self, export_format, content):
+        """
+        Future bagi fail eksport: sudah selesai jika fail ada dalam cache,
+        dikongsi jika fail yang sama sedang dibina, atau kerja baharu.
+        Mesti dipanggil dengan kunci dipegang.
+
+        Returns:
+            Tuple (laluan cache, future, dari_cache).
+        """
+        full_path = os.path.join(self.cache_dir, export_cache_key(export_format, content) + EXPORT_FORMATS[export_format][1])
+        if os.path.exists(full_path):
+            try:
+                touch(full_path)
+                future = Future()
+                future.set_result(True)
+                EXPORT_DURATION.observe(0.0, format=export_format, outcome="cache")
+                return full_path, future, True
+            except FileNotFoundError:
+                pass  # Baru sahaja diusir; bina semula
+        future = self._in_flight.get(full_path)
+        if future is None:
+            future = self._executor.submit(run_export, export_format, content, full_path)
+            self._in_flight[full_path] = future
+            future.add_done_callback(
+                lambda done, path=full_path, fmt=export_format, submitted=time.time(): self._on_export_done(done, path, fmt, submitted)
+            )
+        return full_path, future, False
+
+    def _on_export_done(self, future, full_path, export_format, submitted_at):
+        succeeded = not future.cancelled() and future.exception() is None and future.result()
+        EXPORT_DURATION.observe(time.time() - submitted_at, format=export_format, outcome="rendered" if succeeded else "failed")
+        with self._lock:
+            self._in_flight.pop(full_path, None)
+        evict_lru(self.cache_dir, self.cache_max_bytes, [ext for _, ext, _, _ in EXPORT_FORMATS.values()])
+
+    def _prune(self):
+        """Melupakan kerja lama. Mesti dipanggil dengan kunci dipegang."""
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.created_at < cutoff and job.future.done()]:
+            del self._jobs[job_id]
+
+    def submit_all(self, username, chat_history, filename_prefix, formats, include_user=True, include_assistant=True):
+        """
+        Menghantar kerja eksport bagi setiap format serentak.
+
+        Teks perbualan diformat sekali sahaja dan dikongsi oleh semua format
+        berasaskan teks. Format yang sudah ada dalam cache selesai serta-merta.
+
+        Returns:
+            Senarai ID kerja.
+        """
+        history = [
+            msg for msg in chat_history
+            if (msg.get("role") == "user" and include_user) or (msg.get("role") == "assistant" and include_assistant)
+        ]
+        text_content = None
+        if any(EXPORT_FORMATS[fmt][3] == "text" for fmt in formats):
+            text_content = format_conversation_text(chat_history, include_user, include_assistant)
+        job_ids = []
+        with self._lock:
+            self._prune()
+            for export_format in formats:
+                content = text_content if EXPORT_FORMATS[export_format][3] == "text" else history
+                full_path, future, cached = self._cached_future(export_format, content)
+                filename = f"{filename_prefix}{EXPORT_FORMATS[export_format][1]}"
+                job = ExportJob(username, export_format, full_path, filename, future, cached)
+                self._jobs[job.id] = job
+                job_ids.append(job.id)
+        return job_ids
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs_for(self, username):
+        """Kerja pengguna, terbaru dahulu."""
+        with self._lock:
+            self._prune()
+            jobs = [job for job in self._jobs.values() if job.username == username]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def dismiss(self, username, job_id):
+        """Membuang kerja yang telah selesai dari senarai pengguna."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.username == username and job.future.done():
+                del self._jobs[job_id]
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_export_manager():
+    """Mendapatkan pengurus kerja eksport yang dikongsi."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ExportJobManager()
+    return _manager
@@ -0,0 +1,100 @@
+# modules/extraction_cache.py
+
+import hashlib
+import os
+import threading
+from config import EXTRACTION_CACHE_ENABLED, EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_BYTES
+from .disk_cache import scan_entries, touch, evict_lru
+
+def make_extraction_key(file_bytes, file_type, extractor_version):
+    """Kunci kandungan: SHA-256 bait fail bersama jenis fail dan versi pengekstrak."""
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"\0{file_type}\0{extractor_version}".encode("utf-8"))
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """
+    Cache teks yang diekstrak pada cakera, dialamatkan mengikut kandungan fail.
+
+    Setiap entri ialah satu fail teks dalam subdirektori dua aksara pertama
+    kunci. Masa ubah suai fail dikemas kini pada setiap hit, jadi pengusiran
+    membuang entri yang paling lama tidak digunakan sehingga jumlah saiz
+    kembali di bawah had.
+    """
+
+    SUFFIX = ".txt"
+
+    def __init__(self, cache_dir=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in scan_entries(cache_dir, [self.SUFFIX]))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.SUFFIX)
+
+    def get(self, key):
+        """Memulangkan teks yang disimpan atau None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        try:
+            touch(path)  # Tanda sebagai baru digunakan untuk LRU
+        except OSError:
+            pass  # Diusir oleh proses lain selepas dibaca; teks masih sah
+        with self._lock:
+            self._stats["hits"] += 1
+        return text
+
+    def put(self, key, text):
+        """Menyimpan teks secara atomik dan mengusir entri lama jika melebihi had."""
+        path = self._path(key)
+        data = text.encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # Saiz entri yang digantikan ditolak supaya jumlah tidak terus meningkat
+            try:
+                replaced_bytes = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+            self._stats["stores"] += 1
+            self._total_bytes += len(data) - replaced_bytes
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Membuang entri paling lama tidak digunakan sehingga jumlah saiz di bawah had."""
+        with self._lock:
+            # Imbas semula kerana proses lain mungkin telah menambah atau membuang entri
+            self._total_bytes, removed = evict_lru(self.cache_dir, self.max_bytes, [self.SUFFIX])
+            self._stats["evictions"] += removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, total_bytes=self._total_bytes)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """Mendapatkan cache ekstraksi yang dikongsi, atau None jika dimatikan."""
+    global _cache
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExtractionCache()
+    return _cache
@@ -0,0 +1,188 @@
+# modules/extraction_pipeline.py
+#
+# Saluran ekstraksi teks PDF dan OCR. Halaman PDF diproses secara selari
+# dalam kumpulan proses; halaman tanpa lapisan teks (imbasan) dirasterkan dan
+# dihantar ke Tesseract selepas pra-pemprosesan imej. Modul ini tidak
+# bergantung pada Streamlit kerana ia diimport semula oleh proses pekerja.
+
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+from config import (
+    EXTRACTION_WORKERS, PDF_PAGES_PER_TASK, OCR_LANGUAGES, OCR_DPI,
+    OCR_MAX_DIMENSION, OCR_MIN_PAGE_CHARS
+)
+
+# Naikkan setiap kali output ekstraksi berubah supaya cache teks lama tidak digunakan
+EXTRACTOR_VERSION = "2"
+
+# Sudut (darjah) yang dicuba semasa membetulkan kecondongan imbasan
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+# Imej dikecilkan ke lebar ini semasa menganggar sudut supaya carian murah
+DESKEW_SAMPLE_WIDTH = 800
+
+def _skew_score(binary_image, angle):
+    """Varians jumlah baris piksel gelap; paling tinggi apabila baris teks mendatar."""
+    rotated = binary_image.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+    row_sums = np.asarray(rotated, dtype=np.float32).sum(axis=1)
+    return float(np.var(row_sums))
+
+def estimate_skew_angle(image):
+    """
+    Menganggar kecondongan imej skala kelabu dengan profil unjuran.
+
+    Returns:
+        Sudut dalam darjah untuk diputar supaya baris teks mendatar.
+    """
+    sample = image
+    if image.width > DESKEW_SAMPLE_WIDTH:
+        sample = image.resize(
+            (DESKEW_SAMPLE_WIDTH, max(1, image.height * DESKEW_SAMPLE_WIDTH // image.width))
+        )
+    # Teks gelap menjadi 1, latar belakang 0
+    pixels = np.asarray(sample, dtype=np.uint8)
+    binary = Image.fromarray(((pixels < pixels.mean() - 20) * 255).astype(np.uint8))
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    angles = [step * DESKEW_STEP for step in range(-steps, steps + 1)]
+    return max(angles, key=lambda angle: _skew_score(binary, angle))
+
+def preprocess_for_ocr(image, max_dimension=OCR_MAX_DIMENSION):
+    """Menukar imej kepada skala kelabu, mengecilkan imej besar dan membetulkan kecondongan."""
+    image = image.convert("L")
+    longest = max(image.size)
+    if longest > max_dimension:
+        scale = max_dimension / longest
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.LANCZOS)
+    angle = estimate_skew_angle(image)
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return image
+
+def ocr_image(image, languages=OCR_LANGUAGES):
+    """Menjalankan Tesseract pada imej selepas pra-pemprosesan."""
+    return pytesseract.image_to_string(preprocess_for_ocr(image), lang=languages)
+
+def ocr_image_bytes(image_bytes, languages=OCR_LANGUAGES):
+    """Seperti ocr_image, tetapi menerima bait fail imej (sesuai untuk proses pekerja)."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return ocr_image(image, languages)
+
+def is_image_only_page(page, text):
+    """Halaman dianggap imbasan jika hampir tiada teks tetapi mempunyai imej."""
+    return len(text.strip()) < OCR_MIN_PAGE_CHARS and bool(page.get_images(full=False))
+
+def extract_page_text(page, languages=OCR_LANGUAGES, dpi=OCR_DPI):
+    """
+    Mengekstrak teks satu halaman PDF, menggunakan OCR bagi halaman imbasan.
+
+    Returns:
+        Tuple (teks, ocr_digunakan).
+    """
+    text = page.get_text()
+    if not is_image_only_page(page, text):
+        return text, False
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    return ocr_image(image, languages), True
+
+def _extract_page_range(shm_name, size, page_numbers, languages, dpi):
+    """Tugas pekerja: membuka PDF dari memori kongsi dan mengekstrak halaman tertentu."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    results = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for number in page_numbers:
+            text, used_ocr = extract_page_text(doc[number], languages, dpi)
+            results.append((number, text, used_ocr))
+    return results
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_extraction_pool():
+    """
+    Mendapatkan kumpulan proses ekstraksi yang dikongsi, atau None jika
+    EXTRACTION_WORKERS ialah 0 (ekstraksi dijalankan dalam thread pemanggil).
+    """
+    global _pool
+    if EXTRACTION_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 'fork' tidak selamat dalam proses yang sudah mempunyai thread latar belakang
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context(method)
+                )
+    return _pool
+
+def extract_pdf_text(file_bytes, progress_callback=None, languages=OCR_LANGUAGES, dpi=OCR_DPI):
+    """
+    Mengekstrak teks semua halaman PDF secara selari.
+
+    Bait PDF diletakkan dalam memori kongsi sekali sahaja; setiap tugas
+    pekerja memproses PDF_PAGES_PER_TASK halaman dan keputusan disusun semula
+    mengikut nombor halaman.
+
+    Args:
+        progress_callback: Fungsi pilihan (halaman_selesai, jumlah_halaman, halaman_ocr).
+
+    Returns:
+        Tuple (teks, bilangan halaman yang menggunakan OCR).
+    """
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+    pages = {}
+    ocr_pages = 0
+
+    def collect(results):
+        nonlocal ocr_pages
+        for number, text, used_ocr in results:
+            pages[number] = text
+            ocr_pages += used_ocr
+        if progress_callback:
+            progress_callback(len(pages), page_count, ocr_pages)
+
+    pool = get_extraction_pool()
+    if pool is None or page_count <= PDF_PAGES_PER_TASK:
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            for number in range(page_count):
+                text, used_ocr = extract_page_text(doc[number], languages, dpi)
+                collect([(number, text, used_ocr)])
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(file_bytes)))
+        try:
+            shm.buf[:len(file_bytes)] = file_bytes
+            futures = [
+                pool.submit(_extract_page_range, shm.name, len(file_bytes),
+                            list(range(start, min(start + PDF_PAGES_PER_TASK, page_count))), languages, dpi)
+                for start in range(0, page_count, PDF_PAGES_PER_TASK)
+            ]
+            try:
+                for future in as_completed(futures):
+                    collect(future.result())
+            finally:
+                for future in futures:
+                    future.cancel()
+        finally:
+            shm.close()
+            shm.unlink()
+    return "".join(pages[number] for number in range(page_count)), ocr_pages
+
+def extract_image_text(file_bytes, languages=OCR_LANGUAGES):
+    """Menjalankan OCR pada fail imej dalam kumpulan proses (jika ada)."""
+    pool = get_extraction_pool()
+    if pool is None:
+        return ocr_image_bytes(file_bytes, languages)
+    return pool.submit(ocr_image_bytes, file_bytes, languages).result()
@@ -1,84 +1,205 @@
 # modules/file_processor.py
 
 import streamlit as st
+import csv
+import functools
+import io
 import os
 import time
-from PIL import Image
-import pytesseract
-import fitz  # PyMuPDF
+import openpyxl
 import pandas as pd
 
 # Import untuk format dokumen
 from docx import Document
 from docx.shared import Inches as DocxInches, Pt as DocxPt, RGBColor as DocxRGBColor
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from fpdf import FPDF
 from pptx import Presentation
 from pptx.util import Inches as PptxInches, Pt as PptxPt
 
 # Import pembolehubah konfigurasi
-from config import UPLOAD_DIR, LOGO_PATH, WATERMARK_TEXT, FONT_DIR
+from config import (
+    LOGO_PATH, WATERMARK_TEXT, FONT_DIR, OCR_LANGUAGES,
+    EXTRACTION_SIZE_LIMITS, EXTRACTION_DEFAULT_SIZE_LIMIT, EXTRACTION_MAX_ROWS
+)
+from .extraction_pipeline import extract_pdf_text, extract_image_text, EXTRACTOR_VERSION
+from .extraction_cache import get_extraction_cache, make_extraction_key
+from .metrics import EXTRACTION_DURATION
 
 # --- FUNGSI EKSTRAKSI TEKS ---
+#
+# Semua pengekstrak membaca terus dari penimbal dalam memori fail yang dimuat
+# naik (tiada fail sementara). Dokumen berstruktur dibaca baris demi baris
+# atau slaid demi slaid dan dihadkan kepada EXTRACTION_MAX_ROWS baris.
 
-def extract_text_from_file(uploaded_file_obj):
+IMAGE_TYPES = {".png", ".jpg", ".jpeg", ".gif"}
+
+def _file_size(file_obj):
+    """Saiz fail dalam bait tanpa membaca kandungannya."""
+    size = getattr(file_obj, "size", None)
+    if size is None:
+        position = file_obj.tell()
+        size = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(position)
+    return size
+
+def _file_buffer(file_obj):
+    """Pandangan memoryview ke atas kandungan fail tanpa menyalinnya (jika disokong)."""
+    if hasattr(file_obj, "getbuffer"):
+        return file_obj.getbuffer()
+    return memoryview(file_obj.getvalue())
+
+def _limited(lines, max_rows=EXTRACTION_MAX_ROWS):
+    """Menghentikan penjana baris selepas `max_rows` dengan nota pemangkasan."""
+    for count, line in enumerate(lines):
+        if count >= max_rows:
+            yield f"... (dipangkas selepas {max_rows} baris)"
+            return
+        yield line
+
+def _iter_docx_lines(file_obj):
+    doc = Document(file_obj)
+    for para in doc.paragraphs:
+        yield para.text
+    for table in doc.tables:
+        for row in table.rows:
+            yield "\t".join(cell.text for cell in row.cells)
+
+def _iter_pptx_lines(file_obj):
+    prs = Presentation(file_obj)
+    for number, slide in enumerate(prs.slides, start=1):
+        yield f"--- Slaid {number} ---"
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                for para in shape.text_frame.paragraphs:
+                    text = "".join(run.text for run in para.runs)
+                    if text.strip():
+                        yield text
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    yield "\t".join(cell.text for cell in row.cells)
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text.strip():
+            yield f"Nota: {slide.notes_slide.notes_text_frame.text.strip()}"
+
+def _iter_xlsx_lines(file_obj):
+    # Mod baca-sahaja membaca helaian secara berperingkat tanpa memuatkan seluruh buku kerja
+    workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"--- Helaian {sheet.title} ---"
+            for row in sheet.iter_rows(values_only=True):
+                if any(value is not None for value in row):
+                    yield "\t".join("" if value is None else str(value) for value in row)
+    finally:
+        workbook.close()
+
+def _iter_csv_lines(file_obj):
+    text_stream = io.TextIOWrapper(file_obj, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        for row in csv.reader(text_stream):
+            yield "\t".join(row)
+    finally:
+        # Jangan tutup fail asal bersama pembungkus teks
+        text_stream.detach()
+
+LINE_EXTRACTORS = {
+    ".docx": _iter_docx_lines,
+    ".pptx": _iter_pptx_lines,
+    ".xlsx": _iter_xlsx_lines,
+    ".csv": _iter_csv_lines,
+}
+EXTRACTABLE_TYPES = IMAGE_TYPES | set(LINE_EXTRACTORS) | {".txt", ".pdf"}
+
+def extract_text_from_file(uploaded_file_obj, progress_callback=None):
     """
-    Mengekstrak teks dari objek fail yang dimuat naik (Imej, PDF, DOCX, TXT).
+    Mengekstrak teks dari objek fail yang dimuat naik (Imej, PDF, DOCX, PPTX, XLSX, CSV, TXT).
     
     Args:
         uploaded_file_obj: Objek fail dari st.file_uploader.
+        progress_callback: Fungsi pilihan (halaman_selesai, jumlah_halaman, halaman_ocr)
+            yang dipanggil semasa halaman PDF diproses.
 
     Returns:
         String teks yang diekstrak, atau None jika gagal atau jenis fail tidak disokong.
     """
     filename = uploaded_file_obj.name
-    file_bytes = uploaded_file_obj.getvalue()
-    extracted_text = ""
-    temp_file_path = None
+    file_type = os.path.splitext(filename)[1].lower()
+    if file_type not in EXTRACTABLE_TYPES:
+        st.warning(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
+        return None
 
+    # Had saiz disemak sebelum fail dihuraikan
+    size_limit_mb = EXTRACTION_SIZE_LIMITS.get(file_type.lstrip("."), EXTRACTION_DEFAULT_SIZE_LIMIT)
+    file_size = _file_size(uploaded_file_obj)
+    if file_size > size_limit_mb * 1024 * 1024:
+        st.error(f"Fail '{filename}' ({file_size / (1024 * 1024):.1f} MB) melebihi had {size_limit_mb} MB bagi jenis {file_type}.")
+        return None
+
+    start_time = time.perf_counter()
     try:
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            image = Image.open(uploaded_file_obj)
-            extracted_text = pytesseract.image_to_string(image)
-            if not extracted_text.strip():
-                st.info(f"Tiada teks dapat diekstrak dari imej '{filename}' menggunakan OCR.")
-        
-        elif filename.lower().endswith(".txt"):
-            extracted_text = file_bytes.decode('utf-8', errors='ignore')
-
-        elif filename.lower().endswith(".docx"):
-            # Simpan fail sementara untuk dibaca oleh python-docx
-            temp_file_path = os.path.join(UPLOAD_DIR, f"temp_{int(time.time())}_{filename}")
-            with open(temp_file_path, "wb") as f:
-                f.write(file_bytes)
-            doc = Document(temp_file_path)
-            extracted_text = "\n".join([para.text for para in doc.paragraphs])
-
-        elif filename.lower().endswith(".pdf"):
-            with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-                extracted_text = "".join(page.get_text() for page in doc)
-        
-        else:
-            st.warning(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
-            return None
-            
-        return extracted_text.strip() if isinstance(extracted_text, str) else None
+        with _file_buffer(uploaded_file_obj) as buffer:
+            # Fail yang sama (cth. lembaran kerja dimuat naik oleh ramai pelajar) hanya diekstrak sekali
+            cache = get_extraction_cache()
+            cache_key = None
+            if cache is not None:
+                cache_key = make_extraction_key(buffer, file_type, f"{EXTRACTOR_VERSION}:{OCR_LANGUAGES}")
+                try:
+                    cached_text = cache.get(cache_key)
+                except OSError:
+                    cached_text = None
+                if cached_text is not None:
+                    EXTRACTION_DURATION.observe(time.perf_counter() - start_time, file_type=file_type, outcome="cache")
+                    return cached_text
+
+            if file_type in IMAGE_TYPES:
+                # Proses pekerja OCR memerlukan salinan bait yang boleh di-pickle
+                extracted_text = extract_image_text(bytes(buffer))
+                if not extracted_text.strip():
+                    st.info(f"Tiada teks dapat diekstrak dari imej '{filename}' menggunakan OCR.")
+
+            elif file_type == ".txt":
+                extracted_text = str(buffer, "utf-8", errors="ignore")
+
+            elif file_type == ".pdf":
+                # Halaman diproses secara selari; halaman imbasan melalui OCR
+                extracted_text, ocr_pages = extract_pdf_text(buffer, progress_callback)
+                if ocr_pages:
+                    st.info(f"{ocr_pages} halaman imbasan dalam '{filename}' dibaca menggunakan OCR.")
+
+            else:
+                uploaded_file_obj.seek(0)
+                extracted_text = "\n".join(_limited(LINE_EXTRACTORS[file_type](uploaded_file_obj)))
+
+        extracted_text = extracted_text.strip()
+        if cache is not None and extracted_text:
+            try:
+                cache.put(cache_key, extracted_text)
+            except OSError as e:
+                st.warning(f"Gagal menyimpan teks '{filename}' dalam cache: {e}")
+        EXTRACTION_DURATION.observe(time.perf_counter() - start_time, file_type=file_type, outcome="extracted")
+        return extracted_text
 
     except Exception as e:
+        EXTRACTION_DURATION.observe(time.perf_counter() - start_time, file_type=file_type, outcome="failed")
         st.error(f"Ralat semasa memproses fail '{filename}': {e}")
         return None
-    
-    finally:
-        # Pastikan fail sementara dipadam
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-            except OSError as e_remove:
-                st.warning(f"Gagal memadam fail sementara '{temp_file_path}': {e_remove}")
 
 
 # --- FUNGSI PEMFORMATAN & EKSPORT ---
 
+@functools.lru_cache(maxsize=None)
+def _logo_bytes():
+    """Kandungan fail logo, dibaca sekali bagi setiap proses; None jika tiada."""
+    if not LOGO_PATH or not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, "rb") as f:
+        return f.read()
+
+@functools.lru_cache(maxsize=None)
+def _font_path(filename):
+    """Laluan fon dalam FONT_DIR, disemak sekali bagi setiap proses; None jika tiada."""
+    path = os.path.join(FONT_DIR, filename)
+    return path if os.path.exists(path) else None
+
 def format_conversation_text(chat_history, include_user=True, include_assistant=True):
     """Memformat sejarah perbualan menjadi satu string teks yang boleh dibaca."""
     lines = []
@@ -94,19 +215,24 @@ def format_conversation_text(chat_history, include_user=True, include_assistant=
     
     return "\n\n".join(lines)
 
+# Fungsi simpan di bawah dijalankan dalam proses pekerja eksport (export_jobs)
+# yang tiada konteks Streamlit, jadi kegagalan dinaikkan sebagai pengecualian
+# dan dipaparkan kepada pengguna melalui ExportJob.error, bukan st.error.
+
 def save_to_word(text_content, full_path):
     """Menyimpan kandungan teks ke fail .docx."""
     try:
         doc = Document()
         # Tambah logo jika wujud
-        if LOGO_PATH and os.path.exists(LOGO_PATH):
+        logo_bytes = _logo_bytes()
+        if logo_bytes:
             try:
                 p = doc.add_paragraph()
                 p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-                p.add_run().add_picture(LOGO_PATH, width=DocxInches(1.5))
+                p.add_run().add_picture(io.BytesIO(logo_bytes), width=DocxInches(1.5))
                 doc.add_paragraph() # Jarak
-            except Exception as e:
-                st.warning(f"Gagal menambah logo pada Word: {e}")
+            except Exception:
+                pass  # Logo tidak penting; dokumen dijana tanpanya
 
         # Tambah kandungan utama
         for para_block in text_content.split("\n\n"):
@@ -115,44 +241,7 @@ def save_to_word(text_content, full_path):
         doc.save(full_path)
         return True
     except Exception as e:
-        st.error(f"Gagal menyimpan ke Word: {e}")
-        return False
-
-def save_to_pdf(text_content, full_path):
-    """Menyimpan kandungan teks ke fail .pdf."""
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        # Tetapan Fon Unicode (Penting untuk menyokong pelbagai aksara)
-        font_path = os.path.join(FONT_DIR, "DejaVuSans.ttf")
-        if os.path.exists(font_path):
-            pdf.add_font("DejaVu", "", font_path, uni=True)
-            pdf.set_font("DejaVu", size=12)
-        else:
-            pdf.set_font("Arial", size=12)
-            if "DejaVu" in str(font_path): # Hanya tunjuk amaran jika fon sepatutnya ada
-                 st.warning("Fail fon 'DejaVuSans.ttf' tidak ditemui. Menggunakan fon lalai.")
-
-        # Tambah logo jika wujud
-        if LOGO_PATH and os.path.exists(LOGO_PATH):
-            try:
-                page_width = pdf.w - 2 * pdf.l_margin
-                x_logo = (page_width - 30) / 2 + pdf.l_margin
-                pdf.image(LOGO_PATH, x=x_logo, y=10, w=30)
-                pdf.ln(25) # Jarak selepas logo
-            except Exception as e:
-                st.warning(f"Gagal menambah logo pada PDF: {e}")
-
-        # Tambah kandungan utama
-        pdf.multi_cell(0, 10, text_content)
-        
-        pdf.output(full_path)
-        return True
-    except Exception as e:
-        st.error(f"Gagal menyimpan ke PDF: {e}")
-        return False
+        raise RuntimeError(f"Gagal menyimpan ke Word: {e}") from e
 
 def save_to_txt(text_content, full_path):
     """Menyimpan kandungan teks ke fail .txt."""
@@ -161,8 +250,7 @@ def save_to_txt(text_content, full_path):
             f.write(text_content)
         return True
     except IOError as e:
-        st.error(f"Gagal menyimpan ke Teks: {e}")
-        return False
+        raise RuntimeError(f"Gagal menyimpan ke Teks: {e}") from e
 
 def save_to_excel(chat_history, full_path):
     """Menyimpan sejarah perbualan ke fail .xlsx."""
@@ -176,22 +264,22 @@ def save_to_excel(chat_history, full_path):
             for msg in chat_history
         ]
         if not data:
-            st.warning("Tiada data untuk dieksport ke Excel.")
-            return False
-            
+            raise ValueError("Tiada data untuk dieksport ke Excel.")
+
         df = pd.DataFrame(data)
         df.to_excel(full_path, index=False, engine='openpyxl')
         return True
+    except ValueError:
+        raise
     except Exception as e:
-        st.error(f"Gagal menyimpan ke Excel: {e}")
-        return False
+        raise RuntimeError(f"Gagal menyimpan ke Excel: {e}") from e
 
 def save_to_pptx(chat_history, full_path):
     """Menyimpan sejarah perbualan ke fail .pptx, satu mesej per slaid."""
     try:
         prs = Presentation()
-        # Gunakan layout 'Title and Content' atau 'Blank'
-        slide_layout = prs.slide_layouts[5] 
+        # Layout 'Title and Content' mempunyai placeholder kandungan (indeks 1)
+        slide_layout = prs.slide_layouts[1]
 
         for msg in chat_history:
             slide = prs.slides.add_slide(slide_layout)
@@ -225,5 +313,4 @@ def save_to_pptx(chat_history, full_path):
         prs.save(full_path)
         return True
     except Exception as e:
-        st.error(f"Gagal menyimpan ke PowerPoint: {e}")
-        return False
+        raise RuntimeError(f"Gagal menyimpan ke PowerPoint: {e}") from e
@@ -0,0 +1,160 @@
+# modules/generation_tasks.py
+#
+# Penjanaan jawapan yang sedang berjalan bagi setiap pengguna. Setiap jawapan
+# didaftarkan dengan threading.Event yang dihantar sebagai stop_event kepada
+# stream_ollama_chat; menetapkannya menutup sambungan ke Ollama (jika tiada
+# peminta lain berkongsi penjanaan itu) supaya GPU tidak terus menjana
+# jawapan yang tiada siapa akan baca.
+#
+# Penjanaan dibatalkan apabila pengguna menekan butang henti, log keluar,
+# menukar sesi, menghantar soalan baharu melebihi GENERATION_LIMIT_PER_USER
+# (yang paling lama dibatalkan), atau apabila tab pelayar tidak lagi
+# bersambung.
+
+import threading
+import time
+import uuid
+from config import GENERATION_LIMIT_PER_USER, GENERATION_WATCHDOG_INTERVAL
+from .metrics import REGISTRY, GENERATION_CANCELLATIONS
+
+# sebab pembatalan -> nota yang ditambah pada jawapan separuh siap
+CANCEL_REASONS = {
+    "user": "Dihentikan oleh pengguna.",
+    "new_prompt": "Dihentikan kerana soalan baharu dihantar.",
+    "logout": "Dihentikan kerana pengguna log keluar.",
+    "session_switch": "Dihentikan kerana sesi perbualan ditukar.",
+    "disconnected": "Dihentikan kerana pelayar terputus sambungan.",
+    "interrupted": "Dihentikan kerana halaman dimuat semula.",
+}
+
+class GenerationTask:
+    """
+    Satu penjanaan yang sedang berjalan.
+
+    Args:
+        owner: Pengenal tab pelayar (ID sesi Streamlit) yang memulakannya.
+        session_id: ID sesi perbualan yang menerima jawapan.
+        is_connected: Fungsi pilihan yang memulangkan False apabila tab
+            pelayar telah terputus; disemak oleh thread pengawas.
+    """
+
+    def __init__(self, username, owner, session_id, model, is_connected=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.username = username
+        self.owner = owner
+        self.session_id = session_id
+        self.model = model
+        self.is_connected = is_connected
+        self.started_at = time.time()
+        self.stop_event = threading.Event()
+        self.cancel_reason = None
+
+    @property
+    def cancelled(self):
+        return self.stop_event.is_set()
+
+    def cancel(self, reason):
+        """Menghentikan penjanaan. Memulangkan True jika belum dibatalkan sebelum ini."""
+        if self.stop_event.is_set():
+            return False
+        self.cancel_reason = reason
+        self.stop_event.set()
+        GENERATION_CANCELLATIONS.inc(reason=reason)
+        return True
+
+class GenerationTracker:
+    """Mendaftarkan penjanaan aktif setiap pengguna dan membatalkannya apabila perlu."""
+
+    def __init__(self, limit_per_user=GENERATION_LIMIT_PER_USER, watchdog_interval=GENERATION_WATCHDOG_INTERVAL):
+        self.limit_per_user = max(1, limit_per_user)
+        self.watchdog_interval = watchdog_interval
+        self._tasks = {}  # username -> senarai GenerationTask, paling lama dahulu
+        self._lock = threading.Lock()
+        self._watchdog = None
+
+    def start(self, username, owner, session_id, model, is_connected=None):
+        """
+        Mendaftarkan penjanaan baharu. Penjanaan lama pengguna yang melebihi
+        had dibatalkan dengan sebab 'new_prompt'.
+
+        Returns:
+            GenerationTask; hantar task.stop_event kepada stream_ollama_chat
+            dan panggil finish() selepas selesai.
+        """
+        task = GenerationTask(username, owner, session_id, model, is_connected)
+        with self._lock:
+            tasks = self._tasks.setdefault(username, [])
+            superseded = tasks[:max(0, len(tasks) - self.limit_per_user + 1)]
+            tasks.append(task)
+        for old_task in superseded:
+            old_task.cancel("new_prompt")
+        if is_connected is not None:
+            self._start_watchdog()
+        return task
+
+    def finish(self, task):
+        """Membuang penjanaan yang telah selesai atau berhenti dari senarai aktif."""
+        with self._lock:
+            tasks = self._tasks.get(task.username, [])
+            if task in tasks:
+                tasks.remove(task)
+            if not tasks:
+                self._tasks.pop(task.username, None)
+
+    def cancel(self, username, reason, owner=None):
+        """
+        Membatalkan penjanaan aktif pengguna, atau hanya yang dimulakan oleh
+        tab `owner` jika diberi. Memulangkan bilangan yang dibatalkan.
+        """
+        with self._lock:
+            tasks = [t for t in self._tasks.get(username, []) if owner is None or t.owner == owner]
+        return sum(1 for task in tasks if task.cancel(reason))
+
+    def active(self, username=None):
+        """Penjanaan yang belum dibatalkan, bagi seorang pengguna atau semua."""
+        with self._lock:
+            groups = [self._tasks.get(username, [])] if username is not None else list(self._tasks.values())
+            return [task for tasks in groups for task in tasks if not task.cancelled]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watchdog_interval)
+            for task in self.active():
+                if task.is_connected is None:
+                    continue
+                try:
+                    connected = task.is_connected()
+                except Exception:
+                    continue  # Semakan sambungan tidak boleh menghentikan pengawas
+                if not connected:
+                    task.cancel("disconnected")
+
+    def _start_watchdog(self):
+        with self._lock:
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name="generation-watchdog", daemon=True)
+                self._watchdog.start()
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_generation_tracker():
+    """Mendapatkan penjejak penjanaan yang dikongsi oleh semua sesi Streamlit dalam proses ini."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = GenerationTracker()
+    return _tracker
+
+def _generation_metrics():
+    """Bilangan penjanaan aktif dan pengguna yang mempunyainya, dibaca ketika dikikis."""
+    tasks = get_generation_tracker().active()
+    return [
+        ("stembot_active_generations", "Penjanaan jawapan aktif yang dijejak bagi semua pengguna.", "gauge",
+         [({}, len(tasks))]),
+        ("stembot_users_generating", "Pengguna yang mempunyai sekurang-kurangnya satu penjanaan aktif.", "gauge",
+         [({}, len({task.username for task in tasks}))]),
+    ]
+
+REGISTRY.register_collector(_generation_metrics)
@@ -0,0 +1,47 @@
+# modules/http_client.py
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import OLLAMA_POOL_SIZE, OLLAMA_MAX_RETRIES, OLLAMA_RETRY_BACKOFF
+
+# Status yang biasanya sementara (Ollama sedang dimulakan semula atau sibuk)
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Mendapatkan requests.Session yang dikongsi oleh seluruh proses.
+
+    Sesi ini memegang kolam sambungan keep-alive supaya setiap permintaan ke
+    Ollama tidak perlu membuka sambungan TCP baharu. Sambungan yang gagal
+    dicuba semula dengan backoff eksponen; POST hanya dicuba semula jika
+    sambungan belum terbina, jadi penjanaan tidak dihantar dua kali.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=OLLAMA_MAX_RETRIES,
+                    connect=OLLAMA_MAX_RETRIES,
+                    read=0,
+                    status=OLLAMA_MAX_RETRIES,
+                    backoff_factor=OLLAMA_RETRY_BACKOFF,
+                    status_forcelist=RETRY_STATUS_CODES,
+                    allowed_methods=frozenset({"GET", "HEAD"}),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=OLLAMA_POOL_SIZE,
+                    pool_maxsize=OLLAMA_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
@@ -0,0 +1,281 @@
+# modules/metrics.py
+#
+# Metrik latensi dan daya pemprosesan bagi proses ini. Nilai direkodkan di
+# tempat ia diukur (penjadual, klien Ollama, ekstraksi, eksport) dan
+# didedahkan dalam format teks Prometheus melalui pelayan HTTP kecil pada
+# METRICS_PORT, serta dipaparkan dalam papan pemantauan pentadbir.
+#
+# Metrik disimpan dalam memori sahaja dan bermula semula dari sifar apabila
+# proses dimulakan semula (Prometheus mengendalikan tetapan semula kaunter).
+
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_HOST, METRICS_PORT, METRICS_RECENT_SAMPLES
+
+# Sempadan baldi histogram (saat), dari token pertama hingga eksport PDF panjang
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def percentile(values, q):
+    """Persentil `q` (0-100) secara pangkat terdekat; None jika tiada nilai."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+
+class Counter(_Metric):
+    """Kaunter yang hanya bertambah, dengan label."""
+
+    TYPE = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        """{tuple nilai label: jumlah}."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """
+    Histogram berbaldi untuk Prometheus.
+
+    Cerapan terkini juga disimpan (sehingga `recent` nilai) supaya papan
+    pemantauan boleh mengira persentil tepat tanpa pangkalan data siri masa.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS, recent=METRICS_RECENT_SAMPLES):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # tuple label -> [kiraan setiap baldi (tidak kumulatif), jumlah, kiraan]
+        self._recent = deque(maxlen=recent)  # (masa, tuple label, nilai)
+
+    def observe(self, value, **labels):
+        """Merekod satu cerapan; nilai None diabaikan."""
+        if value is None:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            self._recent.append((time.time(), key, value))
+
+    def totals(self):
+        """{tuple nilai label: (kiraan, jumlah)} sejak proses bermula."""
+        with self._lock:
+            return {key: (series[2], series[1]) for key, series in self._series.items()}
+
+    def recent(self, since=None):
+        """Cerapan terkini sebagai senarai (dict label, nilai)."""
+        with self._lock:
+            samples = list(self._recent)
+        return [
+            (dict(zip(self.labelnames, key)), value)
+            for timestamp, key, value in samples if since is None or timestamp >= since
+        ]
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            series_items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in series_items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Semua metrik proses, serta pengumpul yang membaca keadaan semasa ketika dikikis."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """`collector()` memulangkan senarai (nama, bantuan, jenis, [(dict label, nilai)])."""
+        self._collectors.append(collector)
+
+    def render(self):
+        """Semua metrik dalam format teks Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, help_text, metric_type, samples in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+                lines += [f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "stembot_queue_wait_seconds", "Masa menunggu slot penjanaan dalam penjadual.", ("model",)
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "stembot_time_to_first_token_seconds", "Masa dari permintaan /api/chat hingga token pertama.", ("model",)
+)
+GENERATION_DURATION = REGISTRY.histogram(
+    "stembot_generation_duration_seconds", "Tempoh penuh permintaan /api/chat.", ("model", "outcome")
+)
+PROMPT_EVAL_DURATION = REGISTRY.histogram(
+    "stembot_prompt_eval_duration_seconds", "Masa Ollama menilai prompt (prompt_eval_duration).", ("model",)
+)
+EVAL_DURATION = REGISTRY.histogram(
+    "stembot_eval_duration_seconds", "Masa Ollama menjana token jawapan (eval_duration).", ("model",)
+)
+LOAD_DURATION = REGISTRY.histogram(
+    "stembot_model_load_duration_seconds", "Masa Ollama memuatkan model sebelum menjana (load_duration).", ("model",)
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    "stembot_prompt_tokens_total", "Token prompt yang dinilai oleh Ollama (prompt_eval_count).", ("model",)
+)
+COMPLETION_TOKENS = REGISTRY.counter(
+    "stembot_completion_tokens_total", "Token jawapan yang dijana oleh Ollama (eval_count).", ("model",)
+)
+GENERATIONS = REGISTRY.counter(
+    "stembot_generations_total",
+    "Permintaan penjanaan mengikut hasil: completed, cancelled, error, cached, coalesced atau busy.", ("model", "outcome")
+)
+GENERATION_CANCELLATIONS = REGISTRY.counter(
+    "stembot_generation_cancellations_total",
+    "Penjanaan yang dibatalkan mengikut sebab: user, new_prompt, logout, session_switch atau disconnected.", ("reason",)
+)
+EXTRACTION_DURATION = REGISTRY.histogram(
+    "stembot_extraction_duration_seconds", "Masa mengekstrak teks fail yang dimuat naik.", ("file_type", "outcome")
+)
+EXPORT_DURATION = REGISTRY.histogram(
+    "stembot_export_duration_seconds", "Masa dari permintaan eksport hingga fail sedia.", ("format", "outcome")
+)
+
+# Ollama melaporkan tempoh dalam nanosaat
+_OLLAMA_DURATIONS = (
+    (PROMPT_EVAL_DURATION, "prompt_eval_duration"),
+    (EVAL_DURATION, "eval_duration"),
+    (LOAD_DURATION, "load_duration"),
+)
+
+def record_generation(model, stats):
+    """
+    Merekod satu permintaan /api/chat dari dict statistik stream_ollama_chat
+    (atau medan respons /api/chat bukan strim).
+    """
+    if stats.get("error"):
+        outcome = "error"
+    elif stats.get("completed"):
+        outcome = "completed"
+    else:
+        outcome = "cancelled"
+    GENERATIONS.inc(model=model, outcome=outcome)
+    GENERATION_DURATION.observe(stats.get("time_taken"), model=model, outcome=outcome)
+    TIME_TO_FIRST_TOKEN.observe(stats.get("time_to_first_token"), model=model)
+    for histogram, field in _OLLAMA_DURATIONS:
+        if stats.get(field) is not None:
+            histogram.observe(stats[field] / 1e9, model=model)
+    if stats.get("prompt_eval_count"):
+        PROMPT_TOKENS.inc(stats["prompt_eval_count"], model=model)
+    if stats.get("eval_count"):
+        COMPLETION_TOKENS.inc(stats["eval_count"], model=model)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Kikisan berkala tidak perlu memenuhi log Streamlit
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Memulakan pelayan /metrics sekali bagi setiap proses.
+
+    Returns:
+        Pelayan HTTP, atau None jika dimatikan (port 0) atau port sudah digunakan.
+    """
+    global _server
+    if port <= 0:
+        return None
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                try:
+                    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+                except OSError:
+                    return None
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+                _server = server
+    return _server
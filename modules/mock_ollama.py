@@ -0,0 +1,288 @@
+# modules/mock_ollama.py
+#
+# Pelayan Ollama tiruan untuk penanda aras dan ujian beban tanpa GPU.
+# Menyokong /api/tags, /api/ps, /api/chat (strim dan bukan strim),
+# /api/generate dan /api/embed dengan latensi, kadar token dan kadar ralat
+# yang boleh dilaraskan, supaya kesesakan dalam aplikasi boleh diukur secara
+# berasingan daripada kelajuan model sebenar.
+#
+#   python -m modules.mock_ollama --port 11434 --latency 0.5 --token-rate 30
+
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Perkataan jawapan tiruan, diulang mengikut bilangan token
+REPLY_WORDS = (
+    "Tenaga", "kinetik", "ialah", "tenaga", "yang", "dimiliki", "oleh", "objek", "kerana",
+    "gerakannya", "dan", "dikira", "dengan", "$E_k", "=", "\\frac{1}{2}mv^2$", "di", "mana",
+    "m", "ialah", "jisim", "manakala", "v", "ialah", "halaju", "objek", "tersebut.",
+)
+EMBEDDING_DIMENSIONS = 64
+
+def _embed(text):
+    """Vektor beg perkataan berdasarkan cincangan supaya teks serupa mempunyai vektor serupa."""
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in text.lower().split():
+        vector[int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "big") % EMBEDDING_DIMENSIONS] += 1.0
+    return vector
+
+class MockOllamaServer:
+    """
+    Pelayan Ollama tiruan yang berjalan dalam thread latar belakang.
+
+    Args:
+        latency: Saat sebelum token pertama (penilaian prompt).
+        token_rate: Token sesaat semasa menjana jawapan.
+        tokens: Bilangan token bagi setiap jawapan.
+        error_rate: Kebarangkalian (0-1) sesuatu penjanaan gagal dengan HTTP 500.
+        jitter: Variasi rawak relatif (cth. 0.2 = ±20%) bagi latensi dan kadar token.
+        parallel: Penjanaan serentak maksimum bagi setiap model seperti
+            OLLAMA_NUM_PARALLEL; permintaan lain menunggu. 0 untuk tanpa had.
+        load_time: Saat untuk memuatkan model yang belum berada dalam memori
+            (permintaan pertama atau /api/generate kosong). Model yang dimuatkan
+            disenaraikan oleh /api/ps.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, models=("STEMBot-4B",), latency=0.2, token_rate=40.0,
+                 tokens=64, error_rate=0.0, jitter=0.1, parallel=0, load_time=0.0, seed=None):
+        self.models = list(models)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.load_time = load_time
+        self.loaded = set()
+        self._load_locks = {model: threading.Lock() for model in self.models}
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._slots = {model: threading.BoundedSemaphore(parallel) for model in self.models} if parallel > 0 else {}
+        self._counts_lock = threading.Lock()
+        self.counts = {"requests": 0, "generations": 0, "errors": 0}
+        self._httpd = _MockHTTPServer((host, port), _MockOllamaHandler)
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Memulakan pelayan dalam thread latar belakang. Memulangkan self."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def _vary(self, value):
+        with self._random_lock:
+            return max(0.0, value * (1 + self._random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        with self._random_lock:
+            return self._random.random() < self.error_rate
+
+    def prompt_delay(self):
+        return self._vary(self.latency)
+
+    def token_delay(self):
+        return self._vary(1.0 / self.token_rate) if self.token_rate > 0 else 0.0
+
+    def ensure_loaded(self, model):
+        """Memuatkan model jika belum (sekali walaupun diminta serentak). Memulangkan saat dimuatkan."""
+        if model in self.loaded:
+            return 0.0
+        with self._load_locks[model]:
+            if model in self.loaded:
+                return 0.0
+            time.sleep(self.load_time)
+            self.loaded.add(model)
+            return self.load_time
+
+    def slot(self, model):
+        """Semafor penjanaan model, atau None jika tiada had."""
+        return self._slots.get(model)
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Klien yang memutuskan sambungan (pembatalan disengajakan) bukan ralat pelayan
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+class _MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Sambungan keep-alive seperti Ollama sebenar
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _model_entries(self):
+        return [
+            {
+                "name": model, "model": model, "size": 2_500_000_000,
+                "details": {"format": "gguf", "parameter_size": "4B", "quantization_level": "Q4_K_M"},
+            }
+            for model in self.mock.models
+        ]
+
+    def do_GET(self):
+        self.mock.count("requests")
+        if self.path == "/api/tags":
+            self._send_json({"models": self._model_entries()})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [
+                dict(entry, size_vram=entry["size"]) for entry in self._model_entries() if entry["name"] in self.mock.loaded
+            ]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        self.mock.count("requests")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, 400)
+            return
+        if self.path == "/api/embed":
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json({"model": request.get("model"), "embeddings": [_embed(text) for text in inputs]})
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(request, chat=self.path == "/api/chat")
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, request, chat):
+        model = request.get("model")
+        if model not in self.mock.models:
+            self._send_json({"error": f"model '{model}' not found"}, 404)
+            return
+        if not chat and not request.get("prompt"):
+            # Permintaan kosong hanya memuatkan model (pemanasan)
+            load_seconds = self.mock.ensure_loaded(model)
+            self._send_json({
+                "model": model, "response": "", "done": True, "done_reason": "load",
+                "load_duration": int(load_seconds * 1e9),
+            })
+            return
+        self.mock.count("generations")
+        if self.mock.should_fail():
+            self.mock.count("errors")
+            self._send_json({"error": "simulated failure"}, 500)
+            return
+
+        slot = self.mock.slot(model)
+        if slot is not None:
+            slot.acquire()
+        try:
+            self._respond(request, model, chat)
+        finally:
+            if slot is not None:
+                slot.release()
+
+    def _respond(self, request, model, chat):
+        started = time.perf_counter()
+        load_seconds = self.mock.ensure_loaded(model)
+        prompt_delay = self.mock.prompt_delay()
+        time.sleep(prompt_delay)
+        words = list(itertools.islice(itertools.cycle(REPLY_WORDS), self.mock.tokens))
+        field = "message" if chat else "response"
+
+        def piece(text):
+            return {"role": "assistant", "content": text} if chat else text
+
+        stream = request.get("stream", True)
+        if stream:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+        eval_started = time.perf_counter()
+        try:
+            for index, word in enumerate(words):
+                time.sleep(self.mock.token_delay())
+                if stream:
+                    self._write_chunk({"model": model, field: piece(word if index == 0 else " " + word), "done": False})
+            final = {
+                "model": model, field: piece("" if stream else " ".join(words)), "done": True, "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_count": sum(len(str(m.get("content", "")).split()) for m in request.get("messages", [])),
+                "prompt_eval_duration": int(prompt_delay * 1e9),
+                "eval_count": len(words),
+                "eval_duration": int((time.perf_counter() - eval_started) * 1e9),
+            }
+            if stream:
+                self._write_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            else:
+                self._send_json(final)
+        except (BrokenPipeError, ConnectionResetError):
+            # Klien menutup sambungan (penjanaan dibatalkan)
+            self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Pelayan Ollama tiruan untuk penanda aras DFK Stembot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", default="STEMBot-4B", help="Nama model dipisahkan dengan koma.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Saat sebelum token pertama.")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Token sesaat.")
+    parser.add_argument("--tokens", type=int, default=64, help="Token bagi setiap jawapan.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Kebarangkalian ralat HTTP 500 (0-1).")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Variasi rawak relatif latensi dan kadar token.")
+    parser.add_argument("--parallel", type=int, default=0, help="Penjanaan serentak bagi setiap model (0 = tanpa had).")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Saat untuk memuatkan model yang belum dimuatkan.")
+    args = parser.parse_args()
+
+    server = MockOllamaServer(
+        args.host, args.port, [m.strip() for m in args.models.split(",") if m.strip()], args.latency,
+        args.token_rate, args.tokens, args.error_rate, args.jitter, args.parallel, args.load_time,
+    )
+    print(f"Pelayan Ollama tiruan di {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# modules/model_manager.py
+#
+# Kitaran hayat model pada pelayan Ollama. Memuatkan model 4B dari cakera
+# mengambil 10-30 saat, jadi model lalai dan model yang baru dipilih dimuatkan
+# lebih awal (permintaan /api/generate kosong dengan keep_alive) supaya
+# jawapan pertama setiap kelas tidak menanggung kos tersebut. Model yang
+# dikekalkan dan sudah berada dalam memori disegarkan secara berkala supaya
+# tidak diusir oleh Ollama di antara waktu kelas.
+
+import threading
+import time
+from collections import OrderedDict
+import requests
+from config import (
+    OLLAMA_KEEP_ALIVE, OLLAMA_HEALTH_CHECK_INTERVAL, MODEL_WARMUP_ENABLED, MODEL_WARMUP_MODELS,
+    MODEL_RECENT_LIMIT
+)
+from .backends import get_backend_pool
+from .http_client import get_http_session
+from .metrics import LOAD_DURATION
+
+class ModelManager:
+    """
+    Memuatkan dan mengekalkan model dalam memori semua pelayan Ollama.
+
+    Model yang dikekalkan ialah `pinned` (konfigurasi) serta `recent_limit`
+    model terakhir yang dipilih pengguna. Model yang sudah dimuatkan
+    disegarkan setiap `interval` saat; model yang telah diusir hanya dimuatkan
+    semula apabila dipilih, supaya pelayan yang tidak muat semua model tidak
+    bertukar-tukar model tanpa henti.
+    """
+
+    def __init__(self, pool, pinned=MODEL_WARMUP_MODELS, recent_limit=MODEL_RECENT_LIMIT,
+                 keep_alive=OLLAMA_KEEP_ALIVE, interval=OLLAMA_HEALTH_CHECK_INTERVAL, enabled=MODEL_WARMUP_ENABLED):
+        self.pool = pool
+        self.enabled = enabled
+        self.pinned = list(pinned)
+        self.recent_limit = recent_limit
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self._recent = OrderedDict()  # model -> None, paling baru di hujung
+        self._warming = set()
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def kept_models(self):
+        """Model yang dikekalkan dalam memori: disematkan dahulu, kemudian pilihan terkini."""
+        with self._lock:
+            recent = list(self._recent)
+        return list(dict.fromkeys(self.pinned + recent))
+
+    def status(self, model):
+        """Keadaan dari BackendPool.residency(), atau 'warming' jika model belum dimuatkan tetapi sedang dimuatkan."""
+        residency = self.pool.residency(model)
+        with self._lock:
+            if residency != "loaded" and model in self._warming:
+                return "warming"
+        return residency
+
+    def _load(self, backend, model):
+        """Memuatkan model pada satu pelayan. Memulangkan True jika berjaya."""
+        try:
+            response = get_http_session().post(
+                f"{backend.url}/api/generate", json={"model": model, "keep_alive": self.keep_alive}, timeout=600
+            )
+            response.raise_for_status()
+            load_duration = response.json().get("load_duration")
+        except (requests.exceptions.RequestException, ValueError):
+            return False
+        if load_duration:
+            LOAD_DURATION.observe(load_duration / 1e9, model=model)
+        self.pool.mark_loaded(backend, model)
+        return True
+
+    def _warm(self, model, only_loaded):
+        try:
+            for backend in self.pool.backends:
+                if not backend.healthy or (backend.models and model not in backend.models):
+                    continue
+                if only_loaded:
+                    # backend.loaded mungkin basi (mark_loaded hanya menambah); baca semula
+                    # /api/ps supaya model yang sudah diusir tidak dimuatkan semula
+                    loaded = self.pool.refresh_loaded(backend)
+                    if loaded is None or model not in loaded:
+                        continue
+                self._load(backend, model)
+        finally:
+            with self._lock:
+                self._warming.discard(model)
+
+    def warm(self, model, only_loaded=False):
+        """
+        Memuatkan `model` pada semua pelayan sihat yang mempunyainya dalam thread latar belakang.
+
+        Dengan `only_loaded`, hanya pelayan yang sudah memuatkan model disegarkan.
+        Tiada kesan jika model yang sama sedang dimuatkan.
+        """
+        with self._lock:
+            if model in self._warming:
+                return
+            self._warming.add(model)
+        threading.Thread(target=self._warm, args=(model, only_loaded), name=f"model-warmup-{model}", daemon=True).start()
+
+    def select(self, model):
+        """Dipanggil apabila pengguna memilih model: dijadikan model terkini dan dimuatkan jika belum."""
+        with self._lock:
+            self._recent.pop(model, None)
+            self._recent[model] = None
+            while len(self._recent) > self.recent_limit:
+                self._recent.popitem(last=False)
+        if self.enabled and self.pool.residency(model) != "loaded":
+            self.warm(model)
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.interval)
+            for model in self.kept_models():
+                self.warm(model, only_loaded=True)
+
+    def start(self):
+        """Memuatkan model yang disematkan dan memulakan thread penyegaran keep_alive."""
+        if not self.enabled:
+            return
+        for model in self.pinned:
+            self.warm(model)
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="model-keep-alive", daemon=True)
+                self._refresher.start()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_model_manager():
+    """Mendapatkan pengurus model yang dikongsi; pemanasan bermula pada panggilan pertama."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = ModelManager(get_backend_pool())
+                manager.start()
+                _manager = manager
+    return _manager
@@ -1,72 +1,563 @@
 # modules/ollama_client.py
 
 import streamlit as st
+import hashlib
 import requests
 import json
+import threading
 import time
-from config import OLLAMA_BASE_URL
+from config import CONTEXT_SUMMARY_ENABLED, OLLAMA_KEEP_ALIVE, REQUEST_COALESCING_ENABLED
+from .backends import get_backend_pool
+from .context_builder import (
+    fit_messages_to_budget, summary_refresh_range, build_summary_request, retrieval_message
+)
+from .http_client import get_http_session
+from .metrics import GENERATIONS, record_generation
+from .response_cache import normalize_text
+from .scheduler import get_scheduler, SchedulerBusyError
+from .session_manager import load_chat_session, load_session_summary, save_session_summary
 
-@st.cache_data(ttl=300)
-def get_ollama_models_cached():
-    """Mendapatkan senarai model dari Ollama API dan menyimpannya dalam cache."""
-    try:
-        response = requests.get(f'{OLLAMA_BASE_URL}/api/tags', timeout=10)
-        response.raise_for_status()
-        models_data = response.json().get('models', [])
-        return sorted([model['name'] for model in models_data]) if models_data else []
-    except requests.exceptions.RequestException as e:
-        st.error(f"Gagal menyambung ke Ollama: {e}")
-        return []
-
-def query_ollama_non_stream(prompt, chat_history, selected_model):
-    """Menghantar permintaan ke Ollama API dan mengendalikan respons."""
-    # ... (Kod asal anda untuk fungsi ini sudah sangat baik dan mantap)
-    # ... (Saya sertakan di sini untuk kelengkapan)
+THINK_START_TAG = "<think>"
+THINK_END_TAG = "</think>"
+
+def get_model_catalog():
+    """
+    Senarai model dan kesihatan pelayan Ollama untuk paparan halaman.
+
+    Dibaca dari cache proses yang dikemas kini oleh thread semakan kesihatan
+    (lihat BackendPool.catalog()), jadi paparan halaman tidak pernah menunggu
+    /api/tags walaupun pelayan lambat atau tidak dapat dihubungi.
+    """
+    return get_backend_pool().catalog()
+
+def post_to_ollama(path, payload, stream=False, timeout=600):
+    """
+    Menghantar payload ke `path` (cth. '/api/chat') pada pelayan terbaik untuk model tersebut.
+
+    Jika sambungan gagal atau pelayan tidak mempunyai model (404), pelayan
+    seterusnya dicuba. Pemanggil mesti memanggil get_backend_pool().release()
+    ke atas pelayan yang dipulangkan selepas respons selesai dibaca.
+
+    Returns:
+        Tuple (pelayan, respons).
+    """
+    # Setiap permintaan menetapkan semula pemasa keep_alive supaya model tidak diusir di antara kelas
+    payload = {'keep_alive': OLLAMA_KEEP_ALIVE, **payload}
+    pool = get_backend_pool()
+    tried = set()
+    last_error = None
+    while True:
+        backend = pool.acquire(payload['model'], exclude=tried)
+        if backend is None:
+            if last_error is not None:
+                raise last_error
+            raise requests.exceptions.ConnectionError("Tiada pelayan Ollama yang tersedia.")
+        tried.add(backend.url)
+        try:
+            response = get_http_session().post(f'{backend.url}{path}', json=payload, stream=stream, timeout=timeout)
+        except requests.exceptions.ConnectionError as e:
+            pool.release(backend)
+            pool.mark_failed(backend, e)
+            last_error = e
+            continue
+        except BaseException:
+            pool.release(backend)
+            raise
+        if response.status_code == 404 and len(tried) < len(pool.backends):
+            # Model tiada pada pelayan ini; cuba pelayan lain
+            pool.forget_model(backend, payload['model'])
+            pool.release(backend)
+            response.close()
+            continue
+        if response.ok:
+            pool.mark_loaded(backend, payload['model'])  # Ollama memuatkan model untuk menjawab permintaan ini
+        return backend, response
+
+def _post_chat(payload, stream=False, timeout=600):
+    """Menghantar payload ke /api/chat (lihat post_to_ollama)."""
+    return post_to_ollama('/api/chat', payload, stream=stream, timeout=timeout)
+
+def build_messages_for_api(prompt, chat_history, selected_model=None, context_summary=None, retrieved_chunks=None,
+                           history_offset=0):
+    """
+    Membina senarai mesej untuk dihantar ke /api/chat.
+
+    Jika `selected_model` diberi, sejarah dipangkas kepada tetingkap yang muat
+    dalam bajet token model tersebut (lihat context_builder). Petikan dokumen
+    dari `retrieved_chunks` diletakkan sebagai mesej sistem sejurus sebelum
+    prompt supaya ia sentiasa berada dalam tetingkap. `history_offset` ialah
+    bilangan mesej sesi sebelum `chat_history[0]` yang tidak dimuatkan.
+    """
     messages_for_api = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history]
-    
+
     # Elak menambah prompt yang sama jika ia sudah menjadi mesej terakhir
     if not (messages_for_api and messages_for_api[-1]["role"] == "user" and messages_for_api[-1]["content"] == prompt):
         messages_for_api.append({"role": "user", "content": prompt})
+    if retrieved_chunks:
+        messages_for_api.insert(len(messages_for_api) - 1, retrieval_message(retrieved_chunks))
+    if selected_model:
+        messages_for_api = fit_messages_to_budget(messages_for_api, selected_model, context_summary, history_offset)
+    return messages_for_api
 
-    start_time = time.time()
-    try:
-        payload = {'model': selected_model, 'messages': messages_for_api, 'stream': False}
-        response = requests.post(f'{OLLAMA_BASE_URL}/api/chat', json=payload, timeout=600)
-        response.raise_for_status()
-        
-        full_response_data = response.json()
-        raw_assistant_reply = full_response_data.get('message', {}).get('content', "Tiada kandungan.")
-        
-        # Logik untuk memisahkan 'thinking process'
-        thinking_process = ""
-        assistant_reply = raw_assistant_reply
-        thinking_start_tag = "<think>"
-        thinking_end_tag = "</think>"
-        if thinking_start_tag in raw_assistant_reply and thinking_end_tag in raw_assistant_reply:
-            start_index = raw_assistant_reply.find(thinking_start_tag)
-            end_index = raw_assistant_reply.find(thinking_end_tag)
-            if start_index < end_index:
-                thinking_process = raw_assistant_reply[start_index + len(thinking_start_tag):end_index].strip()
-                assistant_reply = raw_assistant_reply[end_index + len(thinking_end_tag):].strip()
-
-        processing_time = time.time() - start_time
-        return assistant_reply, thinking_process, processing_time
-
-    except requests.exceptions.HTTPError as http_err:
-        error_msg = f"Ralat HTTP dari Ollama: {http_err}"
+def query_ollama_non_stream(prompt, chat_history, selected_model, context_summary=None, retrieved_chunks=None,
+                            username=None, stop_event=None):
+    """
+    Menghantar permintaan ke Ollama API dan menunggu jawapan penuh.
+
+    Permintaan yang sama dengan penjanaan yang sedang berjalan berkongsi
+    jawapannya (lihat stream_ollama_chat). Menetapkan `stop_event` menutup
+    sambungan dan memulangkan jawapan separuh siap.
+
+    Returns:
+        Tuple (jawapan, proses_pemikiran, statistik), dengan statistik ialah
+        dict "done" dari stream_ollama_chat (termasuk 'time_taken' dan 'queue_wait').
+
+    Raises:
+        SchedulerBusyError: Jika `username` diberi dan penjadual menolak permintaan.
+    """
+    answer, thinking, stats = "", "", {}
+    for kind, value in stream_ollama_chat(
+        prompt, chat_history, selected_model, context_summary=context_summary,
+        retrieved_chunks=retrieved_chunks, username=username, stop_event=stop_event
+    ):
+        if kind == "answer":
+            answer += value
+        elif kind == "thinking":
+            thinking += value
+        elif kind == "done":
+            stats = value
+    return answer.strip() or "Tiada kandungan.", thinking.strip(), stats
+
+# --- PENSTRIMAN TOKEN ---
+
+def _partial_tag_suffix(text, tag):
+    """Panjang akhiran `text` yang mungkin merupakan permulaan `tag` yang terpotong."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+class ThinkingStreamSplitter:
+    """
+    Memisahkan kandungan <think>...</think> daripada jawapan secara langsung.
+
+    Seperti query_ollama_non_stream, hanya blok <think> di awal respons
+    dianggap proses pemikiran. Tag boleh terpotong di antara dua chunk, jadi
+    akhiran yang mungkin permulaan tag ditahan sehingga chunk seterusnya tiba.
+    Kelas ini berasaskan 'push' supaya boleh digunakan oleh penstriman
+    segerak dan tak segerak.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        # Keadaan: "start" (belum pasti ada <think>), "thinking", atau "answer"
+        self.state = "start"
+
+    def feed(self, chunk):
+        """Menerima satu chunk teks dan memulangkan senarai tuple (jenis, teks)."""
+        events = []
+        self.buffer += chunk
+        if self.state == "start":
+            stripped = self.buffer.lstrip()
+            if stripped.startswith(THINK_START_TAG):
+                self.buffer = stripped[len(THINK_START_TAG):]
+                self.state = "thinking"
+            elif THINK_START_TAG.startswith(stripped):
+                return events  # Mungkin tag yang terpotong, tunggu chunk seterusnya
+            else:
+                self.state = "answer"
+        if self.state == "thinking":
+            end_index = self.buffer.find(THINK_END_TAG)
+            if end_index < 0:
+                hold = _partial_tag_suffix(self.buffer, THINK_END_TAG)
+                if len(self.buffer) > hold:
+                    events.append(("thinking", self.buffer[:len(self.buffer) - hold]))
+                    self.buffer = self.buffer[len(self.buffer) - hold:]
+                return events
+            if end_index > 0:
+                events.append(("thinking", self.buffer[:end_index]))
+            self.buffer = self.buffer[end_index + len(THINK_END_TAG):]
+            self.state = "answer"
+        if self.buffer:
+            events.append(("answer", self.buffer))
+            self.buffer = ""
+        return events
+
+    def flush(self):
+        """Memulangkan baki teks yang ditahan apabila strim tamat."""
+        events = []
+        if self.buffer:
+            events.append(("thinking" if self.state == "thinking" else "answer", self.buffer))
+            self.buffer = ""
+        return events
+
+def _parse_chat_chunk(line, stats):
+    """
+    Menghuraikan satu baris NDJSON dari /api/chat.
+
+    Returns:
+        Tuple (thinking, content, selesai). `thinking` datang dari medan
+        'thinking' berasingan (Ollama >= 0.9); `content` mungkin masih
+        mengandungi tag <think>. Statistik akhir Ollama disalin ke dalam
+        `stats` apabila chunk 'done' diterima.
+    """
+    data = json.loads(line)
+    if data.get("error"):
+        raise RuntimeError(data["error"])
+    message = data.get("message", {})
+    if data.get("done"):
+        stats.update({k: v for k, v in data.items() if k not in ("message", "done")})
+        stats["completed"] = True
+    return message.get("thinking", ""), message.get("content", ""), bool(data.get("done"))
+
+def _iter_chat_events(lines, stats):
+    """Menukar baris NDJSON kepada tuple (jenis, teks) yang telah dipisahkan."""
+    splitter = ThinkingStreamSplitter()
+    for line in lines:
+        if not line:
+            continue
+        thinking, content, done = _parse_chat_chunk(line, stats)
+        if thinking:
+            yield "thinking", thinking
+        if content:
+            yield from splitter.feed(content)
+        if done:
+            break
+    yield from splitter.flush()
+
+def _describe_chat_error(error):
+    """Mesej ralat untuk st.error dan jawapan maaf bagi pengecualian permintaan /api/chat."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        error_msg = f"Ralat HTTP dari Ollama: {error}"
         try:
-            error_details = http_err.response.json().get("error", "Tiada butiran.")
+            error_details = error.response.json().get("error", "Tiada butiran.")
             error_msg += f" Butiran: {error_details}"
         except json.JSONDecodeError:
             pass
-        st.error(error_msg)
-        return "Maaf, berlaku ralat HTTP semasa menghubungi Ollama.", "", time.time() - start_time
-    except requests.exceptions.Timeout:
-        st.error("Permintaan ke Ollama tamat masa.")
-        return "Maaf, permintaan tamat masa.", "", time.time() - start_time
-    except requests.exceptions.RequestException as e:
-        st.error(f"Masalah menyambung ke Ollama: {e}")
-        return "Maaf, berlaku masalah semasa menghubungi Ollama.", "", time.time() - start_time
+        return error_msg, "Maaf, berlaku ralat HTTP semasa menghubungi Ollama."
+    if isinstance(error, requests.exceptions.Timeout):
+        return "Permintaan ke Ollama tamat masa.", "Maaf, permintaan tamat masa."
+    if isinstance(error, requests.exceptions.RequestException):
+        return f"Masalah menyambung ke Ollama: {error}", "Maaf, berlaku masalah semasa menghubungi Ollama."
+    return f"Ralat tidak dijangka: {error}", "Maaf, ralat tidak dijangka berlaku."
+
+def _chat_events(payload, flight):
+    """
+    Satu permintaan penstriman /api/chat ke Ollama bagi `flight`, tanpa
+    memanggil st.* (dijalankan dalam thread latar belakang).
+
+    Yields:
+        Acara "thinking" dan "answer", diikuti "done" dengan statistik Ollama
+        serta 'error_message' jika permintaan gagal.
+    """
+    selected_model = payload['model']
+    start_time = time.time()
+    stats = {"time_to_first_token": None, "cancelled": False, "error": False, "completed": False}
+    backend = None
+    response = None
+    try:
+        backend, response = _post_chat(payload, stream=True, timeout=(10, 600))
+        flight.response = response
+        response.raise_for_status()
+        for kind, text in _iter_chat_events(response.iter_lines(decode_unicode=True), stats):
+            if flight.stop_event.is_set():
+                stats["cancelled"] = True
+                break
+            if stats["time_to_first_token"] is None:
+                stats["time_to_first_token"] = time.time() - start_time
+            yield kind, text
     except Exception as e:
-        st.error(f"Ralat tidak dijangka: {e}")
-        return "Maaf, ralat tidak dijangka berlaku.", "", time.time() - start_time
+        if flight.stop_event.is_set():
+            stats["cancelled"] = True  # Sambungan ditutup oleh _leave_flight
+        else:
+            error_msg, apology = _describe_chat_error(e)
+            stats.update(error=True, error_message=error_msg)
+            yield "answer", apology
+    finally:
+        # Menutup sambungan memberitahu Ollama supaya berhenti menjana token.
+        # Sambungan yang belum habis dibaca tidak dipulangkan ke kolam.
+        if response is not None:
+            response.close()
+        if backend is not None:
+            get_backend_pool().release(backend)
+        # Direkodkan sekali bagi setiap penjanaan sebenar, walau berapa ramai yang berkongsi
+        stats["time_taken"] = time.time() - start_time
+        record_generation(selected_model, stats)
+
+    yield "done", stats
+
+# --- PENGGABUNGAN PERMINTAAN SERENTAK ---
+# Apabila ramai pelajar menaip soalan yang sama serentak, hanya satu
+# penjanaan dihantar ke Ollama. Permintaan yang tiba semasa penjanaan itu
+# menunggu giliran atau sedang distrim menyertainya dan menerima semua token
+# dari awal. Ini berbeza dari cache jawapan yang hanya membantu selepas
+# jawapan pertama selesai.
+
+class _FlightAbandoned(Exception):
+    """Semua peminta telah pergi semasa penjanaan masih menunggu giliran."""
+
+class _Flight:
+    """Satu penjanaan yang sedang berjalan dan acaranya, dikongsi oleh semua permintaan yang sama."""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.finished = False
+        self.subscribers = 0
+        self.stop_event = threading.Event()  # Ditetapkan apabila tiada lagi peminta
+        self.response = None  # Respons strim Ollama, ditutup jika semua peminta pergi
+        self._condition = threading.Condition()
+
+    def publish(self, kind, value=None):
+        with self._condition:
+            self.events.append((kind, value))
+            self._condition.notify_all()
+
+    def finish(self):
+        with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+    def follow(self, stop_event=None, poll_interval=0.25):
+        """Semua acara dari awal, kemudian acara baharu sebaik tiba sehingga penjanaan selesai."""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.events) and not self.finished:
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    self._condition.wait(poll_interval)
+                if index >= len(self.events):
+                    return
+                events = self.events[index:]
+            index += len(events)
+            yield from events
+
+_flights = {}  # kunci permintaan -> _Flight
+_flights_lock = threading.Lock()
+
+def _flight_key(payload):
+    """Kunci permintaan: model, semua mesej (dinormalkan) dan pilihan penjanaan."""
+    material = {k: v for k, v in payload.items() if k not in ("messages", "stream", "keep_alive")}
+    material["messages"] = [[msg["role"], normalize_text(msg["content"])] for msg in payload["messages"]]
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _run_flight(flight, payload, username):
+    """Thread penjanaan: menunggu slot penjadual (jika `username`) dan menerbitkan setiap acara."""
+    model = payload['model']
+
+    def on_wait(position):
+        if flight.stop_event.is_set():
+            raise _FlightAbandoned()
+        flight.publish("queued", position)
+
+    try:
+        if username is None:
+            flight.publish("started", 0.0)
+            for kind, value in _chat_events(payload, flight):
+                flight.publish(kind, value)
+        else:
+            with get_scheduler().slot(model, username, on_wait=on_wait) as ticket:
+                if flight.stop_event.is_set():
+                    raise _FlightAbandoned()  # Ditinggalkan sejurus sebelum mendapat slot
+                flight.publish("started", ticket.queue_wait)
+                for kind, value in _chat_events(payload, flight):
+                    flight.publish(kind, value)
+    except SchedulerBusyError as e:
+        flight.publish("busy", str(e))
+    except _FlightAbandoned:
+        pass
+    finally:
+        with _flights_lock:
+            if _flights.get(flight.key) is flight:
+                del _flights[flight.key]
+        flight.finish()
+
+def _join_flight(payload, username):
+    """
+    Menyertai penjanaan yang sama yang sedang berjalan, atau memulakan yang baharu.
+
+    Returns:
+        Tuple (flight, ketua) dengan ketua True jika permintaan ini memulakannya.
+    """
+    key = _flight_key(payload)
+    with _flights_lock:
+        flight = _flights.get(key) if REQUEST_COALESCING_ENABLED else None
+        leader = flight is None
+        if leader:
+            flight = _Flight(key)
+            if REQUEST_COALESCING_ENABLED:
+                _flights[key] = flight
+            threading.Thread(
+                target=_run_flight, args=(flight, payload, username), name="ollama-generation", daemon=True
+            ).start()
+        flight.subscribers += 1
+    return flight, leader
+
+def _leave_flight(flight):
+    """Meninggalkan penjanaan; yang terakhir pergi menghentikannya jika belum selesai."""
+    with _flights_lock:
+        flight.subscribers -= 1
+        if flight.subscribers > 0:
+            return
+        flight.stop_event.set()
+        if _flights.get(flight.key) is flight:
+            del _flights[flight.key]
+    if not flight.finished and flight.response is not None:
+        # Thread penjanaan mungkin tersekat menunggu token; menutup sambungan
+        # menghentikan Ollama dan membebaskan slot penjadual serta-merta
+        flight.response.close()
+
+def stream_ollama_chat(prompt, chat_history, selected_model, stop_event=None, context_summary=None,
+                       retrieved_chunks=None, history_offset=0, username=None, on_wait=None):
+    """
+    Menghantar permintaan ke Ollama API dalam mod penstriman.
+
+    Permintaan serentak dengan model, konteks mesej dan pilihan yang sama
+    berkongsi satu penjanaan: yang lewat menerima semua token yang sudah
+    dijana, kemudian token baharu sebaik tiba. Penjanaan dihentikan hanya
+    apabila semua peminta telah berhenti.
+
+    Args:
+        prompt: Mesej terkini pengguna.
+        chat_history: Sejarah perbualan semasa.
+        selected_model: Nama model Ollama.
+        stop_event: threading.Event pilihan; jika ditetapkan, permintaan ini
+            berhenti menerima token (dan penjanaan dihentikan jika tiada
+            peminta lain) supaya Ollama berhenti menjana.
+        context_summary: Ringkasan bergulir pilihan bagi mesej lama yang
+            tercicir dari tetingkap konteks.
+        retrieved_chunks: Petikan dokumen pilihan dari document_index.retrieve_chunks.
+        history_offset: Bilangan mesej sesi sebelum `chat_history[0]` yang tidak dimuatkan.
+        username: Jika diberi, penjanaan menunggu slot penjadual atas nama
+            pengguna ini; jika tidak, pemanggil bertanggungjawab ke atas slot.
+        on_wait: Fungsi pilihan yang dipanggil dengan kedudukan baris gilir
+            semasa menunggu slot.
+
+    Yields:
+        Tuple (jenis, nilai). "started" (masa menunggu dalam baris gilir)
+        dihantar apabila penjanaan mendapat slot. Jenis "thinking" dan
+        "answer" membawa teks, manakala "done" (sentiasa yang terakhir)
+        membawa dict statistik termasuk 'time_taken', 'time_to_first_token',
+        'queue_wait', 'cancelled', 'error', 'completed' (True jika Ollama
+        menghantar chunk terakhir) dan 'coalesced' (True jika berkongsi
+        penjanaan permintaan lain).
+
+    Raises:
+        SchedulerBusyError: Jika baris gilir penuh atau masa menunggu tamat.
+    """
+    messages_for_api = build_messages_for_api(
+        prompt, chat_history, selected_model, context_summary, retrieved_chunks, history_offset
+    )
+    payload = {'model': selected_model, 'messages': messages_for_api, 'stream': True}
+    flight, leader = _join_flight(payload, username)
+    start_time = time.time()
+    stats = {
+        "time_to_first_token": None, "queue_wait": None, "cancelled": True, "error": False,
+        "completed": False, "coalesced": not leader,
+    }
+    try:
+        for kind, value in flight.follow(stop_event):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if kind == "queued":
+                if on_wait is not None:
+                    on_wait(value)
+            elif kind == "busy":
+                raise SchedulerBusyError(value)
+            elif kind == "started":
+                stats["queue_wait"] = value
+                yield kind, value
+            elif kind == "done":
+                # Statistik Ollama dari penjanaan yang dikongsi; masa diukur bagi permintaan ini
+                stats.update({k: v for k, v in value.items() if k not in ("time_taken", "time_to_first_token")})
+                if value.get("error_message"):
+                    st.error(value["error_message"])
+            else:
+                if stats["time_to_first_token"] is None:
+                    stats["time_to_first_token"] = time.time() - start_time
+                yield kind, value
+    finally:
+        _leave_flight(flight)
+        stats["time_taken"] = time.time() - start_time
+        if not leader:
+            GENERATIONS.inc(model=selected_model, outcome="coalesced")
+
+    yield "done", stats
+
+# --- RINGKASAN KONTEKS BERGULIR ---
+
+_summaries_in_progress = set()
+_summaries_lock = threading.Lock()
+
+def summarize_messages(messages, selected_model, previous_summary=None):
+    """
+    Meminta model meringkaskan mesej lama bersama ringkasan sebelumnya.
+
+    Returns:
+        Teks ringkasan, atau None jika gagal (ringkasan lama kekal digunakan).
+    """
+    payload = {
+        'model': selected_model,
+        'messages': build_summary_request(messages, previous_summary),
+        'stream': False,
+    }
+    try:
+        backend, response = _post_chat(payload, timeout=300)
+        try:
+            response.raise_for_status()
+            text = response.json().get('message', {}).get('content', "")
+        finally:
+            get_backend_pool().release(backend)
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    # Buang blok pemikiran jika model menjananya
+    splitter = ThinkingStreamSplitter()
+    events = splitter.feed(text) + splitter.flush()
+    return "".join(value for kind, value in events if kind == "answer").strip() or None
+
+def _refresh_context_summary(username, session_id, chat_history, selected_model, end, history_offset=0):
+    try:
+        previous = load_session_summary(username, session_id)
+        covered = previous.get("covered", 0) if previous else 0
+        # Mesej yang telah dilepaskan dari memori dibaca semula dari storan
+        older = load_chat_session(username, session_id, covered, history_offset) if covered < history_offset else []
+        messages = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in older + chat_history[max(covered - history_offset, 0):end - history_offset]
+        ]
+        # Ringkasan ialah penjanaan juga, jadi ia beratur bersama permintaan lain
+        with get_scheduler().slot(selected_model, username):
+            text = summarize_messages(messages, selected_model, previous)
+        if text:
+            save_session_summary(username, session_id, {"covered": end, "text": text, "model": selected_model})
+    except SchedulerBusyError:
+        pass  # Cuba lagi pada giliran seterusnya
+    finally:
+        with _summaries_lock:
+            _summaries_in_progress.discard((username, session_id))
+
+def schedule_context_summary_refresh(username, session_id, chat_history, selected_model, history_offset=0):
+    """
+    Mengemas kini ringkasan bergulir di latar belakang jika tetingkap konteks telah bergerak.
+
+    Ringkasan dikira sekali bagi setiap kumpulan mesej yang tercicir dan
+    disimpan bersama sesi, jadi ia tidak melambatkan jawapan semasa.
+    """
+    if not CONTEXT_SUMMARY_ENABLED or session_id == "new":
+        return
+    api_messages = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history]
+    end = summary_refresh_range(
+        api_messages, selected_model, load_session_summary(username, session_id), history_offset
+    )
+    if end is None:
+        return
+    with _summaries_lock:
+        if (username, session_id) in _summaries_in_progress:
+            return
+        _summaries_in_progress.add((username, session_id))
+    threading.Thread(
+        target=_refresh_context_summary,
+        args=(username, session_id, list(chat_history), selected_model, end, history_offset),
+        name="context-summary", daemon=True
+    ).start()
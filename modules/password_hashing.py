@@ -0,0 +1,63 @@
+# modules/password_hashing.py
+#
+# Kerja bcrypt dijalankan dalam kumpulan proses terhad supaya lonjakan log
+# masuk tidak membebankan thread skrip Streamlit. Modul ini sengaja hanya
+# bergantung pada bcrypt kerana ia diimport semula oleh setiap proses pekerja.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from config import BCRYPT_ROUNDS, AUTH_HASH_WORKERS
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+def _checkpw(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        # Hash rosak dalam storan dianggap sebagai kata laluan salah
+        return False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_hash_pool():
+    """
+    Mendapatkan kumpulan proses bcrypt yang dikongsi, atau None jika
+    AUTH_HASH_WORKERS ialah 0 (bcrypt dijalankan terus dalam thread pemanggil).
+    """
+    global _pool
+    if AUTH_HASH_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 'fork' tidak selamat dalam proses yang sudah mempunyai thread latar belakang
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(
+                    max_workers=AUTH_HASH_WORKERS, mp_context=multiprocessing.get_context(method)
+                )
+    return _pool
+
+def _run(func, *args):
+    pool = get_hash_pool()
+    if pool is None:
+        return func(*args)
+    return pool.submit(func, *args).result()
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    """Melencongkan kata laluan menggunakan bcrypt dengan faktor kos `rounds`."""
+    return _run(_hashpw, password, rounds)
+
+def verify_password(password, hashed):
+    """Mengesahkan kata laluan dengan hash yang disimpan."""
+    return _run(_checkpw, password, hashed)
+
+def hash_passwords(passwords, rounds=BCRYPT_ROUNDS):
+    """Melencongkan banyak kata laluan secara selari. Memulangkan senarai hash mengikut susunan."""
+    pool = get_hash_pool()
+    if pool is None:
+        return [_hashpw(password, rounds) for password in passwords]
+    return list(pool.map(_hashpw, passwords, [rounds] * len(passwords), chunksize=8))
@@ -0,0 +1,290 @@
+# modules/pdf_renderer.py
+#
+# Penjana PDF perbualan. Mesej ditulis satu demi satu (bukan satu multi_cell
+# gergasi) dengan gaya berasingan bagi peranan, proses pemikiran, kod dan
+# matematik menggunakan fon DejaVu dalam FONT_DIR.
+#
+# Perbualan panjang dijana dalam bahagian sebanyak PDF_EXPORT_MESSAGES_PER_PART
+# mesej. Setiap bahagian ditulis ke cakera dan dilepaskan dari memori sebelum
+# bahagian seterusnya bermula, kemudian PyMuPDF mencantumkan halaman tanpa
+# menjana semula teks. Memori Python kekal terhad tanpa mengira panjang perbualan.
+
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+import fitz  # PyMuPDF
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from config import PDF_EXPORT_MESSAGES_PER_PART, WATERMARK_TEXT
+from .file_processor import _font_path, _logo_bytes
+
+# (keluarga, gaya) -> fail fon dalam FONT_DIR
+FONT_FILES = {
+    ("DejaVu", ""): "DejaVuSans.ttf",
+    ("DejaVu", "B"): "DejaVuSans-Bold.ttf",
+    ("DejaVu", "I"): "DejaVuSans-Oblique.ttf",
+    ("DejaVuMono", ""): "DejaVuSansMono.ttf",
+    ("DejaVuMono", "B"): "DejaVuSansMono-Bold.ttf",
+}
+
+# peranan -> warna tajuk (RGB)
+ROLE_COLORS = {
+    "user": (33, 90, 160),
+    "assistant": (30, 120, 70),
+}
+DEFAULT_ROLE_COLOR = (90, 90, 90)
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s+")
+
+def split_blocks(text):
+    """
+    Memecahkan kandungan markdown kepada blok untuk digayakan.
+
+    Returns:
+        Senarai (jenis, teks) dengan jenis 'text', 'heading', 'code' atau 'math'.
+        Blok kod ``` dan matematik $$ / \\[ \\] dikekalkan baris demi baris.
+    """
+    blocks, paragraph = [], []
+    kind, buffer, closer = None, [], None
+
+    def flush_paragraph():
+        if paragraph:
+            blocks.append(("text", "\n".join(paragraph)))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if kind == "code":
+            if _FENCE_RE.match(line):
+                blocks.append(("code", "\n".join(buffer)))
+                kind, buffer = None, []
+            else:
+                buffer.append(line)
+            continue
+        if kind == "math":
+            if stripped.endswith(closer):
+                buffer.append(stripped[:-len(closer)])
+                blocks.append(("math", "\n".join(l for l in buffer if l.strip())))
+                kind, buffer = None, []
+            else:
+                buffer.append(line)
+            continue
+
+        if _FENCE_RE.match(line):
+            flush_paragraph()
+            kind, buffer = "code", []
+        elif stripped.startswith(("$$", "\\[")):
+            flush_paragraph()
+            opener, closer = ("$$", "$$") if stripped.startswith("$$") else ("\\[", "\\]")
+            body = stripped[len(opener):]
+            if body.endswith(closer):
+                blocks.append(("math", body[:-len(closer)].strip()))
+            else:
+                kind, buffer = "math", [body]
+        elif _HEADING_RE.match(line):
+            flush_paragraph()
+            blocks.append(("heading", _HEADING_RE.sub("", line).strip()))
+        elif not stripped:
+            flush_paragraph()
+        else:
+            paragraph.append(line.rstrip())
+    flush_paragraph()
+    if kind is not None and buffer:
+        # Blok yang tidak ditutup (cth. jawapan terpotong) tetap dipaparkan
+        blocks.append((kind, "\n".join(buffer)))
+    return blocks
+
+class ChatPDF(FPDF):
+    """Dokumen PDF bagi satu bahagian perbualan."""
+
+    def __init__(self, page_offset=0):
+        super().__init__()
+        self.page_offset = page_offset  # Halaman dalam bahagian sebelumnya
+        self._widths = {}
+        self.set_auto_page_break(auto=True, margin=15)
+        self.sans, self.mono = "helvetica", "courier"
+        for (family, style), filename in FONT_FILES.items():
+            path = _font_path(filename)
+            if path:
+                self.add_font(family, style, path)
+        if _font_path(FONT_FILES[("DejaVu", "")]):
+            self.sans = "DejaVu"
+            if _font_path(FONT_FILES[("DejaVuMono", "")]):
+                self.mono = "DejaVuMono"
+
+    def _style(self, family, style):
+        """Gaya yang didaftarkan; gaya biasa jika fail fon gaya tersebut tiada."""
+        if (family, "") in FONT_FILES and not _font_path(FONT_FILES.get((family, style), "")):
+            return ""
+        return style
+
+    def use_font(self, family, style="", size=10.5):
+        self.set_font(family, self._style(family, style), size)
+
+    def footer(self):
+        self.set_y(-12)
+        self.use_font(self.sans, "I", 8)
+        self.set_text_color(140, 140, 140)
+        self.cell(0, 8, f"{WATERMARK_TEXT} · Halaman {self.page_no() + self.page_offset}", align="C")
+
+    def add_logo(self):
+        logo_bytes = _logo_bytes()
+        if not logo_bytes:
+            return
+        try:
+            x_logo = (self.epw - 30) / 2 + self.l_margin
+            self.image(io.BytesIO(logo_bytes), x=x_logo, y=10, w=30)
+            self.ln(25)  # Jarak selepas logo
+        except Exception:
+            pass  # Logo tidak penting; PDF dijana tanpanya
+
+    def _width(self, text):
+        """Lebar teks dalam fon semasa, dicache bagi setiap perkataan."""
+        key = (self.font_family, self.font_style, self.font_size_pt, text)
+        width = self._widths.get(key)
+        if width is None:
+            width = self._widths[key] = self.get_string_width(text)
+        return width
+
+    def _split_to_width(self, text, width):
+        """Memotong teks yang lebih lebar daripada `width` mengikut aksara."""
+        pieces, current, current_width = [], "", 0
+        for char in text:
+            char_width = self._width(char)
+            if current and current_width + char_width > width:
+                pieces.append(current)
+                current, current_width = "", 0
+            current += char
+            current_width += char_width
+        pieces.append(current)
+        return pieces
+
+    def wrap(self, text, width, preserve_spaces=False):
+        """
+        Membalut teks kepada baris yang muat dalam `width`.
+
+        multi_cell fpdf2 mengukur semula keseluruhan serpihan bagi setiap
+        aksara, jadi perenggan panjang menjadi sangat perlahan; pembalutan
+        mengikut perkataan dengan lebar yang dicache mengelakkannya.
+        Dengan `preserve_spaces` (kod), jarak asal dikekalkan dan baris
+        panjang dipotong mengikut aksara.
+        """
+        lines = []
+        space = self._width(" ")
+        for source_line in text.split("\n"):
+            if preserve_spaces:
+                lines.extend(self._split_to_width(source_line.expandtabs(4), width))
+                continue
+            current, current_width = "", 0
+            for word in source_line.split():
+                word_width = self._width(word)
+                if current and current_width + space + word_width <= width:
+                    current += " " + word
+                    current_width += space + word_width
+                    continue
+                if current:
+                    lines.append(current)
+                pieces = self._split_to_width(word, width) if word_width > width else [word]
+                lines.extend(pieces[:-1])
+                current = pieces[-1]
+                current_width = self._width(current)
+            lines.append(current)
+        return lines
+
+    def _paragraph(self, text, height, fill=False, align="L"):
+        for line in self.wrap(text, self.epw, preserve_spaces=fill):
+            self.cell(0, height, line, fill=fill, align=align, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    def write_message(self, msg):
+        """Menulis satu mesej: tajuk peranan, proses pemikiran dan kandungan."""
+        role = msg.get("role", "unknown")
+        color = ROLE_COLORS.get(role, DEFAULT_ROLE_COLOR)
+
+        self.ln(3)
+        self.use_font(self.sans, "B", 11)
+        self.set_text_color(*color)
+        self.cell(0, 7, role.capitalize(), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_draw_color(*color)
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(1.5)
+
+        thinking_process = (msg.get("thinking_process") or "").strip()
+        if role == "assistant" and thinking_process:
+            left_margin = self.l_margin
+            self.set_left_margin(left_margin + 6)
+            self.set_x(self.l_margin)
+            self.use_font(self.sans, "I", 8.5)
+            self.set_text_color(110, 110, 110)
+            self._paragraph(f"[Proses Pemikiran AI]\n{thinking_process}", 4.2)
+            self.set_left_margin(left_margin)
+            self.set_x(left_margin)
+            self.ln(1.5)
+
+        self.set_text_color(20, 20, 20)
+        for kind, block in split_blocks(msg.get("content", "").strip()):
+            if kind == "code":
+                self.use_font(self.mono, "", 8.5)
+                self.set_fill_color(242, 242, 242)
+                self._paragraph(block, 4.2, fill=True)
+            elif kind == "math":
+                self.use_font(self.mono, "", 10)
+                self._paragraph(block, 5.5, align="C")
+            elif kind == "heading":
+                self.use_font(self.sans, "B", 11)
+                self._paragraph(block, 6)
+            else:
+                self.use_font(self.sans, "", 10.5)
+                self._paragraph(block, 5.5)
+            self.ln(1.5)
+
+def _render_part(messages, path, page_offset, with_logo):
+    """Menjana satu bahagian ke `path`. Memulangkan bilangan halaman."""
+    pdf = ChatPDF(page_offset)
+    pdf.add_page()
+    if with_logo:
+        pdf.add_logo()
+    for msg in messages:
+        pdf.write_message(msg)
+    pdf.output(path)
+    return pdf.page_no()
+
+def render_chat_pdf(chat_history, full_path, messages_per_part=PDF_EXPORT_MESSAGES_PER_PART):
+    """
+    Menyimpan sejarah perbualan ke fail .pdf bergaya.
+
+    `chat_history` boleh jadi senarai atau iterator mesej; ia dibaca satu
+    bahagian pada satu masa. Dijalankan dalam pekerja eksport, jadi kegagalan
+    dinaikkan sebagai RuntimeError untuk direkodkan dalam ExportJob.error.
+    """
+    # Fail sementara bermula dengan '.' supaya tidak dikira oleh pengusiran cache eksport
+    part_dir = tempfile.mkdtemp(prefix=".pdfparts", dir=os.path.dirname(full_path) or None)
+    try:
+        messages = iter(chat_history)
+        part_paths, pages = [], 0
+        while True:
+            part = list(itertools.islice(messages, messages_per_part))
+            if part_paths and not part:
+                break
+            part_path = os.path.join(part_dir, f".part{len(part_paths):05d}.pdf")
+            pages += _render_part(part, part_path, pages, with_logo=not part_paths)
+            part_paths.append(part_path)
+            if len(part) < messages_per_part:
+                break
+
+        if len(part_paths) == 1:
+            shutil.move(part_paths[0], full_path)
+            return True
+        with fitz.open() as merged:
+            for part_path in part_paths:
+                with fitz.open(part_path) as part_doc:
+                    merged.insert_pdf(part_doc)
+            merged.save(full_path, garbage=3, deflate=True)
+        return True
+    except Exception as e:
+        raise RuntimeError(f"Gagal menyimpan ke PDF: {e}") from e
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
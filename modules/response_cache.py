@@ -0,0 +1,174 @@
+# modules/response_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_TAIL_MESSAGES, RESPONSE_CACHE_DB
+)
+
+def normalize_text(text):
+    """Menormalkan teks supaya perbezaan huruf besar dan ruang kosong tidak mengubah kunci."""
+    return " ".join(text.lower().split())
+
+def make_cache_key(model, messages, options=None):
+    """
+    Membina kunci cache dari model, hujung konteks perbualan dan pilihan penjanaan.
+
+    Hanya RESPONSE_CACHE_TAIL_MESSAGES mesej terakhir (termasuk mesej sistem
+    seperti ringkasan) diambil kira supaya soalan yang sama dalam sesi
+    berbeza berkongsi jawapan, tetapi soalan susulan tetap bergantung pada
+    konteksnya.
+    """
+    tail = messages[-RESPONSE_CACHE_TAIL_MESSAGES:] if RESPONSE_CACHE_TAIL_MESSAGES > 0 else messages
+    material = {
+        "model": model,
+        "messages": [[msg["role"], normalize_text(msg["content"])] for msg in tail],
+        "options": options or {},
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Cache jawapan dua tier: LRU dalam memori dan SQLite pada cakera (pilihan).
+
+    Tier cakera dikongsi oleh semua proses Streamlit dan kekal selepas
+    aplikasi dimulakan semula; entri yang dibaca dari cakera dinaikkan ke
+    tier memori.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL, db_path=RESPONSE_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # kunci -> dict entri
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if db_path:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            with self._connect() as conn:
+                # Mod WAL kekal dalam fail, membolehkan pembaca dan penulis serentak
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, model TEXT NOT NULL, answer TEXT NOT NULL,"
+                    " thinking TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_model ON responses (model)")
+
+    @contextmanager
+    def _connect(self):
+        """Sambungan SQLite pendek yang di-commit dan ditutup selepas digunakan."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _is_fresh(self, entry):
+        return time.time() - entry["created_at"] <= self.ttl
+
+    def _remember(self, key, entry):
+        """Menyimpan entri dalam tier memori. Mesti dipanggil dengan kunci dipegang."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Memulangkan entri {'model', 'answer', 'thinking', 'created_at'} atau None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_fresh(entry):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return entry
+                del self._entries[key]
+
+        entry = None
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT model, answer, thinking, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row:
+                entry = {"model": row[0], "answer": row[1], "thinking": row[2], "created_at": row[3]}
+
+        with self._lock:
+            if entry is not None and self._is_fresh(entry):
+                self._remember(key, entry)
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, model, answer, thinking=""):
+        """Menyimpan jawapan yang lengkap dalam kedua-dua tier."""
+        entry = {"model": model, "answer": answer, "thinking": thinking, "created_at": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+            self._stats["stores"] += 1
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, answer, thinking, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, answer, thinking, entry["created_at"])
+                )
+
+    def invalidate_model(self, model):
+        """Membuang semua jawapan bagi satu model (cth. selepas model dikemas kini)."""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry["model"] == model]:
+                del self._entries[key]
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE model = ?", (model,))
+
+    def purge_expired(self):
+        """Membuang entri yang telah tamat tempoh dari tier cakera."""
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        """Kiraan hit/miss semasa serta saiz tier memori."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                memory_entries=len(self._entries),
+                hit_rate=self._stats["hits"] / lookups if lookups else 0.0,
+            )
+
+def cached_response_events(entry):
+    """Menukar entri cache kepada acara yang sama seperti stream_ollama_chat."""
+    if entry["thinking"]:
+        yield "thinking", entry["thinking"]
+    yield "answer", entry["answer"]
+    yield "done", {"time_taken": 0.0, "time_to_first_token": 0.0, "cached": True,
+                   "cancelled": False, "error": False, "completed": True}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Mendapatkan cache jawapan yang dikongsi, atau None jika dimatikan."""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+                _cache.purge_expired()
+    return _cache
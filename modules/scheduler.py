@@ -0,0 +1,214 @@
+# modules/scheduler.py
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import SCHEDULER_MAX_IN_FLIGHT, SCHEDULER_MAX_QUEUE_DEPTH, SCHEDULER_QUEUE_TIMEOUT
+from .metrics import REGISTRY, QUEUE_WAIT, GENERATIONS
+
+class SchedulerBusyError(Exception):
+    """Dinaikkan apabila baris gilir penuh atau masa menunggu tamat."""
+
+class GenerationTicket:
+    """Satu permintaan penjanaan yang sedang menunggu atau sedang berjalan."""
+
+    def __init__(self, model, username):
+        self.model = model
+        self.username = username
+        self.enqueued_at = time.time()
+        self.granted_at = None
+        self.state = "queued"  # queued -> running -> released, atau cancelled
+
+    @property
+    def queue_wait(self):
+        """Tempoh menunggu dalam baris gilir (saat)."""
+        return (self.granted_at or time.time()) - self.enqueued_at
+
+class _ModelQueue:
+    """Baris gilir bagi satu model: satu deque per pengguna, dilayan secara round-robin."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.user_queues = OrderedDict()  # username -> deque tiket; susunan = giliran
+        self.depth = 0
+
+    def push(self, ticket):
+        self.user_queues.setdefault(ticket.username, deque()).append(ticket)
+        self.depth += 1
+
+    def pop_next(self):
+        """Mengambil tiket seterusnya dari pengguna di hadapan giliran."""
+        username, tickets = next(iter(self.user_queues.items()))
+        ticket = tickets.popleft()
+        # Pengguna ini ke belakang giliran supaya pengguna lain mendapat peluang
+        del self.user_queues[username]
+        if tickets:
+            self.user_queues[username] = tickets
+        self.depth -= 1
+        return ticket
+
+    def remove(self, ticket):
+        tickets = self.user_queues.get(ticket.username)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            self.depth -= 1
+            if not tickets:
+                del self.user_queues[ticket.username]
+
+    def position(self, ticket):
+        """
+        Kedudukan tiket (bermula dari 1) mengikut susunan round-robin.
+
+        Tiket ke-i seorang pengguna dilayan pada pusingan ke-i, jadi tiket di
+        hadapannya ialah i tiket pertama setiap pengguna lain, ditambah tiket
+        ke-i pengguna yang berada lebih awal dalam giliran.
+        """
+        usernames = list(self.user_queues)
+        tickets = self.user_queues.get(ticket.username)
+        if not tickets or ticket not in tickets:
+            return 0
+        index = tickets.index(ticket)
+        rank = usernames.index(ticket.username)
+        ahead = 0
+        for other_rank, other in enumerate(usernames):
+            count = len(self.user_queues[other])
+            ahead += min(count, index)
+            if other_rank < rank and count > index:
+                ahead += 1
+        return ahead + 1
+
+class GenerationScheduler:
+    """
+    Penjadual seluruh proses di hadapan Ollama.
+
+    Menghadkan bilangan penjanaan serentak bagi setiap model, menyusun
+    permintaan lain secara adil mengikut pengguna, dan menolak permintaan
+    apabila baris gilir melebihi had supaya pelayan GPU tidak dibanjiri.
+    """
+
+    def __init__(self, max_in_flight=SCHEDULER_MAX_IN_FLIGHT, max_queue_depth=SCHEDULER_MAX_QUEUE_DEPTH,
+                 queue_timeout=SCHEDULER_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._queues = {}
+
+    def _queue_for(self, model):
+        if model not in self._queues:
+            self._queues[model] = _ModelQueue()
+        return self._queues[model]
+
+    def _dispatch(self, queue):
+        """Memberi slot kosong kepada tiket seterusnya. Mesti dipanggil dengan kunci dipegang."""
+        granted = False
+        while queue.in_flight < self.max_in_flight and queue.depth:
+            ticket = queue.pop_next()
+            ticket.state = "running"
+            ticket.granted_at = time.time()
+            queue.in_flight += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def submit(self, model, username):
+        """
+        Mendaftarkan permintaan baharu.
+
+        Raises:
+            SchedulerBusyError: Jika baris gilir model sudah penuh.
+        """
+        with self._condition:
+            queue = self._queue_for(model)
+            if queue.in_flight >= self.max_in_flight and queue.depth >= self.max_queue_depth:
+                raise SchedulerBusyError(
+                    f"Baris gilir untuk model '{model}' penuh ({queue.depth} permintaan menunggu)."
+                )
+            ticket = GenerationTicket(model, username)
+            queue.push(ticket)
+            self._dispatch(queue)
+            return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Menunggu sehingga tiket diberi slot. Memulangkan True jika tiket sedang berjalan."""
+        with self._condition:
+            self._condition.wait_for(lambda: ticket.state != "queued", timeout=timeout)
+            return ticket.state == "running"
+
+    def position(self, ticket):
+        """Kedudukan tiket dalam baris gilir (0 jika sudah berjalan)."""
+        with self._condition:
+            return self._queue_for(ticket.model).position(ticket)
+
+    def release(self, ticket):
+        """Membebaskan slot tiket yang sedang berjalan, atau membatalkan tiket yang menunggu."""
+        with self._condition:
+            queue = self._queue_for(ticket.model)
+            if ticket.state == "running":
+                queue.in_flight -= 1
+                ticket.state = "released"
+            elif ticket.state == "queued":
+                queue.remove(ticket)
+                ticket.state = "cancelled"
+            self._dispatch(queue)
+
+    def stats(self):
+        """Ringkasan keadaan semasa setiap model: {model: (berjalan, menunggu)}."""
+        with self._condition:
+            return {model: (queue.in_flight, queue.depth) for model, queue in self._queues.items()}
+
+    @contextmanager
+    def slot(self, model, username, on_wait=None, poll_interval=0.5):
+        """
+        Konteks yang memegang satu slot penjanaan.
+
+        Args:
+            on_wait: Fungsi pilihan yang dipanggil dengan kedudukan baris gilir
+                semasa menunggu (cth. untuk memaparkan status kepada pengguna).
+
+        Raises:
+            SchedulerBusyError: Jika baris gilir penuh atau masa menunggu tamat.
+        """
+        try:
+            ticket = self.submit(model, username)
+        except SchedulerBusyError:
+            GENERATIONS.inc(model=model, outcome="busy")
+            raise
+        try:
+            while not self.wait(ticket, timeout=poll_interval):
+                if ticket.queue_wait > self.queue_timeout:
+                    GENERATIONS.inc(model=model, outcome="busy")
+                    raise SchedulerBusyError(
+                        f"Permintaan menunggu lebih {self.queue_timeout:.0f} saat untuk model '{model}'."
+                    )
+                if on_wait is not None:
+                    on_wait(self.position(ticket))
+            QUEUE_WAIT.observe(ticket.queue_wait, model=model)
+            yield ticket
+        finally:
+            self.release(ticket)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Mendapatkan penjadual yang dikongsi oleh semua sesi Streamlit dalam proses ini."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GenerationScheduler()
+    return _scheduler
+
+def _scheduler_metrics():
+    """Bilangan penjanaan yang sedang berjalan dan menunggu bagi setiap model, dibaca ketika dikikis."""
+    stats = get_scheduler().stats()
+    return [
+        ("stembot_generations_in_flight", "Penjanaan yang sedang berjalan.", "gauge",
+         [({"model": model}, running) for model, (running, _) in stats.items()]),
+        ("stembot_generations_queued", "Permintaan yang menunggu dalam baris gilir.", "gauge",
+         [({"model": model}, queued) for model, (_, queued) in stats.items()]),
+    ]
+
+REGISTRY.register_collector(_scheduler_metrics)
@@ -3,8 +3,10 @@
 import streamlit as st
 import os
 import json
+import sqlite3
 from datetime import datetime
-from config import HISTORY_DIR, DEFAULT_OLLAMA_MODEL
+from config import HISTORY_DIR, DEFAULT_OLLAMA_MODEL, SESSIONS_PER_PAGE, CHAT_HISTORY_WINDOW
+from .chat_store import get_chat_store
 
 def get_user_history_dir(username):
     """Mendapatkan direktori sejarah untuk pengguna tertentu dan membinanya jika belum wujud."""
@@ -12,83 +14,128 @@ def get_user_history_dir(username):
     os.makedirs(user_dir, exist_ok=True)
     return user_dir
 
-def save_chat_session(username, session_id, history):
-    """Menyimpan sejarah perbualan ke fail JSON."""
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
+def save_chat_session(username, session_id, history, offset=0):
+    """
+    Menyimpan sejarah perbualan ke storan sesi (hanya mesej baharu ditambah bagi SQLite).
+
+    `history` ialah mesej bermula dari kedudukan `offset` dalam sesi.
+
+    Returns:
+        True jika berjaya; mesej hanya boleh dilepaskan dari memori selepas itu.
+    """
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
-    except IOError as e:
+        get_chat_store().save_messages(username, session_id, history, offset)
+        return True
+    except (OSError, sqlite3.Error, ValueError) as e:
         st.error(f"Gagal menyimpan sesi '{session_id}': {e}")
+        return False
 
-def load_chat_session(username, session_id):
-    """Memuatkan sejarah perbualan dari fail JSON."""
-    filepath = os.path.join(get_user_history_dir(username), f"{session_id}.json")
+def load_chat_session(username, session_id, start=0, stop=None):
+    """Memuatkan sejarah perbualan (atau julat mesej [start, stop)) dari storan sesi."""
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except (json.JSONDecodeError, IOError) as e:
+        return get_chat_store().load_messages(username, session_id, start, stop)
+    except (json.JSONDecodeError, OSError, sqlite3.Error) as e:
         st.error(f"Gagal memuatkan sesi '{session_id}': {e}")
         return []
 
+def load_chat_window(username, session_id, window=CHAT_HISTORY_WINDOW):
+    """
+    Memuatkan hanya `window` mesej terakhir sesi.
+
+    Returns:
+        Tuple (bilangan mesej lebih awal yang kekal dalam storan, mesej).
+    """
+    try:
+        store = get_chat_store()
+        offset = max(0, store.count_messages(username, session_id) - window)
+        return offset, store.load_messages(username, session_id, offset)
+    except (json.JSONDecodeError, OSError, sqlite3.Error) as e:
+        st.error(f"Gagal memuatkan sesi '{session_id}': {e}")
+        return 0, []
+
+def trim_chat_history(window=CHAT_HISTORY_WINDOW):
+    """
+    Melepaskan mesej lama dari memori sesi. Panggil hanya selepas
+    save_chat_session berjaya, supaya tiada mesej yang belum disimpan dibuang.
+
+    Mesej tersebut kekal dalam storan dan dibaca semula apabila halaman
+    lama dipaparkan atau sejarah penuh diperlukan (cth. eksport).
+    """
+    excess = len(st.session_state.chat_history) - window
+    if excess > 0 and st.session_state.session_id != "new":
+        del st.session_state.chat_history[:excess]
+        st.session_state.chat_history_offset += excess
+
+def get_full_chat_history(username):
+    """Sejarah penuh sesi semasa: mesej lama dari storan diikuti mesej dalam memori."""
+    offset = st.session_state.chat_history_offset
+    if offset == 0:
+        return st.session_state.chat_history
+    return load_chat_session(username, st.session_state.session_id, 0, offset) + st.session_state.chat_history
+
+def save_session_summary(username, session_id, summary):
+    """Menyimpan ringkasan konteks bergulir bagi sesi."""
+    try:
+        get_chat_store().save_summary(username, session_id, summary)
+    except (OSError, sqlite3.Error) as e:
+        st.error(f"Gagal menyimpan ringkasan sesi '{session_id}': {e}")
+
+def load_session_summary(username, session_id):
+    """Memuatkan ringkasan konteks bergulir bagi sesi, atau None jika belum ada."""
+    try:
+        return get_chat_store().load_summary(username, session_id)
+    except (OSError, sqlite3.Error):
+        return None
+
+def list_sessions(username, query="", page=1, page_size=SESSIONS_PER_PAGE):
+    """
+    Menyenaraikan sesi pengguna dari indeks sesi, dengan carian dan paginasi.
+
+    Args:
+        query: Teks carian (tidak sensitif huruf) ke atas tajuk dan ID sesi.
+        page: Nombor halaman bermula dari 1.
+
+    Returns:
+        Tuple (senarai entri sesi pada halaman, jumlah sesi yang sepadan).
+    """
+    try:
+        return get_chat_store().search_sessions(username, query, page_size, (max(page, 1) - 1) * page_size)
+    except (OSError, sqlite3.Error) as e:
+        st.error(f"Gagal membaca senarai sesi: {e}")
+        return [], 0
+
+def get_session_info(username, session_id):
+    """Entri indeks bagi satu sesi, atau None jika tidak ditemui."""
+    try:
+        return get_chat_store().get_session(username, session_id)
+    except (OSError, sqlite3.Error):
+        return None
+
 def load_all_session_ids(username):
-    """Memuatkan dan menyusun semua ID sesi untuk pengguna."""
-    user_history_dir = get_user_history_dir(username)
+    """Memuatkan semua ID sesi untuk pengguna, yang terbaharu dahulu."""
     try:
-        if not os.path.exists(user_history_dir):
-            return []
-        files = [f.replace(".json", "") for f in os.listdir(user_history_dir) if f.endswith(".json")]
-        
-        def sort_key(filename):
-            try:
-                # Format dijangka: YYYYMMDD_HHMMSS
-                return datetime.strptime(filename, "%Y%m%d_%H%M%S")
-            except ValueError:
-                # Jika format tidak sepadan, letakkan di akhir
-                return datetime.min
-        
-        return sorted(files, key=sort_key, reverse=True)
-    except OSError as e:
-        st.error(f"Gagal membaca direktori sesi: {e}")
+        return get_chat_store().list_session_ids(username)
+    except (OSError, sqlite3.Error) as e:
+        st.error(f"Gagal membaca senarai sesi: {e}")
         return []
 
 def delete_chat_session_file(username, session_id):
-    """Memadam fail sesi perbualan tunggal."""
-    filepath = os.path.join(get_user_history_dir(username), f"{session_id}.json")
+    """Memadam sesi perbualan tunggal."""
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if get_chat_store().delete_session(username, session_id):
             st.success(f"Sesi '{session_id}' berjaya dipadam.")
             return True
         else:
             st.warning(f"Fail sesi '{session_id}' tidak ditemui.")
             return False
-    except OSError as e:
+    except (OSError, sqlite3.Error) as e:
         st.error(f"Gagal memadam sesi '{session_id}': {e}")
         return False
 
 def delete_all_chat_sessions(username):
     """Memadam semua sesi perbualan untuk pengguna."""
-    user_history_dir = get_user_history_dir(username)
-    # ... (Kod asal anda untuk fungsi ini sudah baik, boleh disalin terus)
-    # ... (Saya sertakan di sini untuk kelengkapan)
-    deleted_count = 0
-    errors = []
     try:
-        if not os.path.exists(user_history_dir):
-            st.info("Tiada sesi untuk dipadam.")
-            return True
-        for filename in os.listdir(user_history_dir):
-            if filename.endswith(".json"):
-                filepath = os.path.join(user_history_dir, filename)
-                try:
-                    os.remove(filepath)
-                    deleted_count += 1
-                except OSError as e:
-                    errors.append(f"Gagal memadam {filename}: {e}")
+        deleted_count, errors = get_chat_store().delete_all_sessions(username)
         if errors:
             for error in errors: st.error(error)
         if deleted_count > 0:
@@ -96,8 +143,8 @@ def delete_all_chat_sessions(username):
         else:
             st.info("Tiada sesi ditemui untuk dipadam.")
         return True
-    except OSError as e:
-        st.error(f"Gagal mengakses direktori sesi: {e}")
+    except (OSError, sqlite3.Error) as e:
+        st.error(f"Gagal mengakses storan sesi: {e}")
         return False
 
 
@@ -107,6 +154,8 @@ def initialize_session_state(available_models):
         st.session_state.session_id = "new"
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "chat_history_offset" not in st.session_state:
+        st.session_state.chat_history_offset = 0  # Mesej sebelum chat_history[0] yang hanya ada dalam storan
     if "current_filename_prefix" not in st.session_state:
         st.session_state.current_filename_prefix = datetime.now().strftime("%Y%m%d_%H%M%S")
     if "selected_ollama_model" not in st.session_state:
@@ -121,5 +170,7 @@ def initialize_session_state(available_models):
         st.session_state.show_confirm_delete_all_button = False
     if "chat_page_num" not in st.session_state:
         st.session_state.chat_page_num = 1
+    if "session_list_page" not in st.session_state:
+        st.session_state.session_list_page = 1
     if "uploader_key_counter" not in st.session_state:
         st.session_state.uploader_key_counter = 0
@@ -0,0 +1,153 @@
+# modules/user_store.py
+#
+# Storan akaun pengguna dalam SQLite (mod WAL). Carian mengikut nama pengguna
+# menggunakan kunci primer, dan pendaftaran ialah satu INSERT atomik supaya
+# dua pendaftaran serentak tidak boleh menimpa satu sama lain.
+#
+# Fail users.json lama diimport secara automatik kali pertama storan dibuka.
+
+import json
+import os
+import sqlite3
+import threading
+from config import USERS_FILE, USERS_DB_PATH
+
+class UserStore:
+    """Akaun pengguna {'password', 'created_at', ...} diindeks mengikut nama pengguna."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            extra TEXT
+        ) WITHOUT ROWID;
+    """
+
+    # Medan yang mempunyai lajur sendiri; selebihnya disimpan sebagai JSON dalam `extra`
+    COLUMNS = ("password", "created_at")
+
+    def __init__(self, db_path=USERS_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        """Satu sambungan bagi setiap thread (sambungan sqlite3 tidak boleh dikongsi antara thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def _to_row(cls, username, user):
+        extra = {key: value for key, value in user.items() if key not in cls.COLUMNS}
+        return (username, user["password"], user.get("created_at", ""), json.dumps(extra) if extra else None)
+
+    @staticmethod
+    def _from_row(row):
+        user = {"password": row[0], "created_at": row[1]}
+        if row[2]:
+            user.update(json.loads(row[2]))
+        return user
+
+    def get_user(self, username):
+        """Memulangkan rekod pengguna atau None jika tiada."""
+        row = self._conn().execute(
+            "SELECT password, created_at, extra FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def user_exists(self, username):
+        return self._conn().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def create_user(self, username, user):
+        """
+        Mendaftarkan pengguna baharu.
+
+        Returns:
+            True jika berjaya, False jika nama pengguna telah wujud.
+        """
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute("INSERT INTO users (username, password, created_at, extra) VALUES (?, ?, ?, ?)",
+                             self._to_row(username, user))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def create_users(self, users):
+        """
+        Mendaftarkan banyak pengguna dalam satu transaksi.
+
+        Args:
+            users: Dict {nama_pengguna: rekod}.
+
+        Returns:
+            Senarai nama pengguna yang sebenarnya dicipta (yang sedia ada dilangkau).
+        """
+        conn = self._conn()
+        created = []
+        with conn:
+            for username, user in users.items():
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO users (username, password, created_at, extra) VALUES (?, ?, ?, ?)",
+                    self._to_row(username, user)
+                )
+                if cursor.rowcount:
+                    created.append(username)
+        return created
+
+    def update_user(self, username, user):
+        """Menggantikan rekod pengguna sedia ada (atau menciptanya jika tiada)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO users (username, password, created_at, extra) VALUES (?, ?, ?, ?)",
+                         self._to_row(username, user))
+
+    def all_users(self):
+        """Semua pengguna sebagai dict {nama_pengguna: rekod}."""
+        rows = self._conn().execute("SELECT username, password, created_at, extra FROM users ORDER BY username")
+        return {row[0]: self._from_row(row[1:]) for row in rows}
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+def import_users_json(store, path=USERS_FILE, rename=True):
+    """
+    Mengimport akaun dari users.json lama ke dalam storan.
+
+    Akaun yang sudah wujud dalam storan tidak ditimpa. Fail dinamakan semula
+    kepada users.json.migrated supaya tidak diimport lagi.
+
+    Returns:
+        Bilangan akaun yang diimport.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        users = json.load(f)
+    created = store.create_users(users)
+    if rename:
+        os.replace(path, path + ".migrated")
+    return len(created)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_user_store():
+    """Mendapatkan storan pengguna yang dikongsi, mengimport users.json lama sekali sahaja."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = UserStore()
+                import_users_json(store)
+                _store = store
+    return _store